@@ -0,0 +1,83 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("CASHAI_JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.environ.get("CASHAI_JOB_MAX_PENDING", "100"))
+JOB_TTL_SECONDS = int(os.environ.get("CASHAI_JOB_TTL_SECONDS", "3600"))
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobStore:
+    """
+    パイプラインの非同期ジョブ管理（プロセス内）
+    - 実行は上限付きのスレッドプールで行う
+    - 完了したジョブの結果は TTL 経過後に破棄する
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING, ttl_seconds: int = JOB_TTL_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cashai-job")
+        self._max_pending = max_pending
+        self._ttl = ttl_seconds
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[Dict[str, Any]], Any], payload: Dict[str, Any]) -> str:
+        with self._lock:
+            self._purge_expired()
+            pending = sum(1 for j in self._jobs.values() if j["status"] in ("queued", "running"))
+            if pending >= self._max_pending:
+                raise JobQueueFull(f"ジョブの待ち行列が上限（{self._max_pending}件）に達しています。")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+        self._executor.submit(self._run, job_id, fn, payload)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _run(self, job_id: str, fn: Callable[[Dict[str, Any]], Any], payload: Dict[str, Any]) -> None:
+        self._update(job_id, status="running", started_at=time.time())
+        try:
+            result = fn(payload)
+        except Exception as e:
+            logger.exception("job %s failed", job_id)
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+            return
+        self._update(job_id, status="succeeded", result=result, finished_at=time.time())
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _purge_expired(self) -> None:
+        # 呼び出し側でロック取得済みであること
+        now = time.time()
+        expired = [
+            jid for jid, j in self._jobs.items()
+            if j["finished_at"] is not None and now - j["finished_at"] > self._ttl
+        ]
+        for jid in expired:
+            del self._jobs[jid]
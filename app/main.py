@@ -1,16 +1,132 @@
+import functools
+import json
+from typing import Optional
+
 from fastapi import FastAPI, HTTPException
-from app.pipeline.runner import run_001_002_003
+from fastapi.responses import StreamingResponse
+from app.jobs import JobQueueFull, JobStore
+from app.pipeline.llm import usage_stats
+from app.pipeline.llm_cache import llm_response_cache
+from app.pipeline.mapping_store import account_mapping_store
+from app.pipeline.result_cache import PIPELINE_VERSION, pipeline_result_cache
+from app.pipeline.cloab001 import PIPELINE_MODES
+from app.pipeline.runner import get_case_rows, iter_001_002_003, run_001_002_003, update_case_inputs
 
 app = FastAPI(title="cash-ai-01", version="1.0.0")
 
+jobs = JobStore()
+
+
+def _check_mode(mode: Optional[str]) -> None:
+    if mode is not None and mode not in PIPELINE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode は {' / '.join(PIPELINE_MODES)} のいずれかを指定してください。")
+
+
+def _pipeline_response(r: dict) -> dict:
+    return {"ok": True, "result": r.get("data"), "output": r.get("output"), "timings": r.get("timings"), "cached": r.get("cached", False), "fast_path": r.get("fast_path", False), "validation": r.get("validation")}
+
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/v1/cache/stats")
+def cache_stats():
+    return {
+        "ok": True,
+        "pipeline_version": PIPELINE_VERSION,
+        "llm": llm_response_cache.stats(),
+        "pipeline": pipeline_result_cache.stats(),
+        "prompt_cache": usage_stats(),
+        "account_mappings": account_mapping_store.stats(),
+    }
+
+@app.delete("/v1/mappings/{company}")
+def forget_mappings(company: str):
+    """会社ごとの科目対応の記憶を消す（company は "company_id:..." / "ai_case_id:..."）。"""
+    return {"ok": True, "deleted": account_mapping_store.forget(company)}
+
 @app.post("/v1/pipeline")
-def pipeline(payload: dict):
+def pipeline(payload: dict, mode: Optional[str] = None):
+    _check_mode(mode)
     try:
-        r = run_001_002_003(payload)
-        return {"ok": True, "result": r.get("data"), "output": r.get("output")}
+        r = run_001_002_003(payload, mode=mode)
+        return _pipeline_response(r)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/v1/pipeline/stream")
+def pipeline_stream(payload: dict, mode: Optional[str] = None):
+    """区間ごとの確定行を NDJSON（1行1イベント）で返す。途中で失敗した場合は section=error を返して終了。"""
+    _check_mode(mode)
+
+    def _ndjson():
+        try:
+            for event in iter_001_002_003(payload, mode=mode):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"section": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+@app.get("/v1/cases/{case_id}")
+def get_case(case_id: str):
+    """
+    保存済みの案件の行（cloab003 まで適用した 1〜164 行。手入力の行と、それに依存する 79・80・159〜164 行を反映済み）。
+    対象は ai_case_id 付きで実行したパイプラインの結果。
+    """
+    rows = get_case_rows(case_id)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="案件の結果が見つかりません（パイプラインの再実行が必要です）。")
+    return {"ok": True, "case_id": case_id, "rows": rows}
+
+@app.patch("/v1/cases/{case_id}/inputs")
+def patch_case_inputs(case_id: str, payload: dict):
+    """
+    手入力の行（77・78・155〜158）を変更し、依存する行だけを再計算する（LLM は呼ばない）。
+    payload: {"inputs": [{"行番号": 155, "今期": 1000, "前期": ..., "前々期": ...}, ...]}（省略した期は変更しない）
+    対象は ai_case_id 付きで実行したパイプラインの結果。
+    """
+    inputs = {}
+    for item in payload.get("inputs") or []:
+        try:
+            inputs[int(item["行番号"])] = {k: item[k] for k in ("前々期", "前期", "今期") if k in item}
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"inputs の行が不正です: {item}")
+    if not inputs:
+        raise HTTPException(status_code=400, detail="inputs を指定してください。")
+    try:
+        r = update_case_inputs(case_id, inputs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if r is None:
+        raise HTTPException(status_code=404, detail="案件の結果が見つかりません（パイプラインの再実行が必要です）。")
+    return {"ok": True, "case_id": case_id, "rows": r["rows"], "timings": r["timings"]}
+
+@app.post("/v1/pipeline/jobs", status_code=202)
+def submit_pipeline_job(payload: dict, mode: Optional[str] = None):
+    _check_mode(mode)
+    try:
+        job_id = jobs.submit(functools.partial(run_001_002_003, mode=mode), payload)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"ok": True, "job_id": job_id, "status": "queued"}
+
+@app.get("/v1/pipeline/jobs/{job_id}")
+def get_pipeline_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません（期限切れの可能性があります）。")
+    body = {
+        "ok": job["status"] != "failed",
+        "job_id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["status"] == "succeeded":
+        body.update(_pipeline_response(job["result"]))
+    elif job["status"] == "failed":
+        body["error"] = job["error"]
+    return body
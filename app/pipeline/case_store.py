@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+案件（ai_case_id）ごとの最終結果（cloab003 まで適用した行リスト）の保存
+
+手入力の行（77・78・155〜158）だけを後から変更したときに、パイプライン（LLM）を再実行せず、
+保存済みの結果に対して依存する行だけを再計算する（cloab003.update_inputs）。
+  - payload に ai_case_id がある実行のみ保存する（同じ案件の再実行で上書き）
+  - 古い案件は TTL/LRU で消える（消えた案件の入力変更はパイプラインの再実行が必要）
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.pipeline.llm_cache import LLM_CACHE_PATH, SQLiteLRUCache
+
+CASE_STORE_ENABLED = os.environ.get("CASHAI_CASE_STORE", "1") != "0"
+CASE_STORE_MAX_ENTRIES = int(os.environ.get("CASHAI_CASE_STORE_MAX_ENTRIES", "5000"))
+CASE_STORE_MAX_BYTES = int(os.environ.get("CASHAI_CASE_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+CASE_STORE_TTL_SECONDS = int(os.environ.get("CASHAI_CASE_STORE_TTL_SECONDS", str(90 * 24 * 3600)))
+
+# 入力変更の 読み込み → 更新 → 保存 を直列化する（全案件で1つ。1回の更新は数ミリ秒）
+case_update_lock = threading.Lock()
+
+
+def case_key(payload: Dict[str, Any]) -> Optional[str]:
+    case_id = payload.get("ai_case_id")
+    return None if case_id in (None, "") else str(case_id)
+
+
+def save_case(case_id: Optional[str], rows: List[Dict[str, Any]]) -> None:
+    if not CASE_STORE_ENABLED or case_id is None:
+        return
+    case_result_store.set(case_id, json.dumps(rows, ensure_ascii=False))
+
+
+def load_case(case_id: str) -> Optional[List[Dict[str, Any]]]:
+    if not CASE_STORE_ENABLED:
+        return None
+    raw = case_result_store.get(case_id)
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+case_result_store = SQLiteLRUCache(
+    LLM_CACHE_PATH,
+    "case_results",
+    max_entries=CASE_STORE_MAX_ENTRIES,
+    max_bytes=CASE_STORE_MAX_BYTES,
+    ttl_seconds=CASE_STORE_TTL_SECONDS,
+)
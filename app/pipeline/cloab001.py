@@ -0,0 +1,1493 @@
+# -*- coding: utf-8 -*-
+"""
+cloab001（1〜154行の集計）をプロセス内で実行するためのエンジン。
+
+originals/cloab001.py はモジュールレベルのスクリプト（data.json → output.json）だったため、
+リクエストごとに python3 を起動していた。ここでは同じロジックを再入可能な関数として提供する。
+  - run_bs_1_78(source)        : 1〜78行（BS）
+  - run_pl_112_120(source)     : 112〜120行（PL：売上高〜売上総利益）
+  - run_pl_121_154(source)     : 121〜154行（PL：販管費〜当期利益）
+  - build_rows_81_111(source)  : 81〜111行（製造原価。LLM不要）
+  - run_*_rules / run_*_hybrid : ルールのみ / ルール＋判断できない科目だけ LLM で分類
+  - iter_cloab001(source)      : 確定した区間から順に行を返すジェネレータ（ストリーミング用）
+  - run_cloab001(source)       : 上記を統合し、構成比まで付与した output.json 相当の行リストと区間別の所要時間を返す
+CASHAI_LLM_OUTPUT=tool では、LLM の各区間の行を「｜」区切りのテキストではなく submit_rows ツールの JSON（金額は整数型）で受け取る。
+"""
+from __future__ import annotations
+import copy
+import functools
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.pipeline import formulas, llm, rules, validation
+from app.pipeline.prompts import (
+    SYSTEM_PROMPT_BS_1_78,
+    SPEC_TEXT_BS_1_78,
+    USER_PROMPT_BS_1_78_HEAD,
+    SYSTEM_PROMPT_PL_112_120,
+    SPEC_TEXT_PL_112_120,
+    USER_PROMPT_PL_112_120_HEAD,
+    SYSTEM_PROMPT_PL_121_154,
+    SPEC_TEXT_PL_121_154,
+    USER_PROMPT_PL_121_154_HEAD,
+    SYSTEM_PROMPT_CLASSIFY,
+    ROWS_TOOL,
+    TOOL_OUTPUT_NOTE,
+    LINE_FORMAT,
+    build_classify_parts,
+    build_repair_prompt,
+    build_tool_repair_prompt,
+    build_user_parts,
+    build_validation_feedback,
+    compact_source,
+    lean_prompts,
+    scope_prompts,
+    SOURCE_KEYS_BS_1_78,
+    SOURCE_KEYS_PL_112_120,
+    SOURCE_KEYS_PL_121_154,
+)
+from app.pipeline.mapping_store import account_mapping_store, company_key, learn_bs, learn_sga
+from app.pipeline.deterministic_rows import SECTION_ROWS, llm_rows, placeholder, skipped_rows
+from app.pipeline.row_table import PERIOD_KEYS as ROW_PERIOD_KEYS, RowTable
+from app.pipeline.seizo_patterns import seizo_sums
+from app.pipeline.source_index import get_index
+from app.pipeline.utils import _get_amount_triplet, _normalize_account_name, find_pl_sales_total, to_int_safe_bs
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ["今期", "前期", "前々期"]
+
+# 3つの LLM 呼び出しを並列に発行するか（"0" で従来どおり逐次実行）
+LLM_PARALLEL = os.environ.get("CASHAI_LLM_PARALLEL", "1") != "0"
+# 集計モード：llm（従来）/ rules（LLM なし）/ hybrid（ルールで判断できない科目だけ LLM で分類）
+PIPELINE_MODES = ("llm", "rules", "hybrid")
+PIPELINE_MODE = os.environ.get("CASHAI_PIPELINE_MODE", "llm")
+
+# 欠落・形式不正の行を聞き直す回数（0 で従来どおり即エラー）
+LLM_REPAIR_ATTEMPTS = int(os.environ.get("CASHAI_LLM_REPAIR_ATTEMPTS", "2"))
+# ストリーミングで受信し、行ごとに逐次解析するか（"0" で応答全体を待ってから解析）
+LLM_STREAM = os.environ.get("CASHAI_LLM_STREAM", "1") != "0"
+# ストリーミング中、行番号で始まるのに形式不正・範囲外の行がこの数を超えたら生成を打ち切り、欠落行の再質問に切り替える
+LLM_STREAM_MAX_BAD_LINES = int(os.environ.get("CASHAI_LLM_STREAM_MAX_BAD_LINES", "3"))
+# 1〜78行の LLM 呼び出しを 資産（1〜45）/ 負債・純資産（46〜78）の2回に分けて並列に発行する
+BS_SPLIT = os.environ.get("CASHAI_BS_SPLIT", "0") == "1"
+BS_SPLIT_RANGES = ((range(1, 46), "1〜45行（資産）"), (range(46, 79), "46〜78行（負債・純資産）"))
+# 集計後の検算で不一致だった LLM 区間（1〜78 / 121〜154）を、不一致の内容を添えて再質問する回数（0 で再質問しない）
+VALIDATION_RETRIES = int(os.environ.get("CASHAI_VALIDATION_RETRIES", "1"))
+
+
+# ============================================================
+# 共通：LLM出力の行抽出・分割
+# ============================================================
+
+def _extract_lines(raw_text: str, pattern: str) -> List[str]:
+    lines = []
+    for line in raw_text.splitlines():
+        l = line.strip()
+        if re.match(pattern, l):
+            lines.append(l)
+    return lines
+
+
+def _to_int_strict(s: str) -> int:
+    s = s.strip()
+    if s == "":
+        return 0
+    s = s.replace(",", "")
+    return int(s)
+
+
+def _parse_pl_lines(lines: List[str], label: str) -> List[Dict[str, Any]]:
+    rows = []
+    for l in lines:
+        parts = l.split("｜", 6)
+        if len(parts) != 7:
+            raise ValueError(f"{label}: 7 フィールドに分割できませんでした: {l}")
+
+        line_no_str, account_name, now_str, prev_str, prev2_str, kubun_str, method = parts
+
+        try:
+            line_no = int(line_no_str)
+        except ValueError:
+            raise ValueError(f"{label}: 行番号が整数ではありません: {line_no_str}")
+
+        rows.append({
+            "行番号": line_no,
+            "勘定科目": account_name.strip(),
+            "今期": _to_int_strict(now_str),
+            "前期": _to_int_strict(prev_str),
+            "前々期": _to_int_strict(prev2_str),
+            "区分": kubun_str.strip(),
+            "集計方法": method.strip(),
+        })
+    return rows
+
+
+def _check_row_line(line: str) -> int:
+    """1行が「行番号｜勘定科目｜金額｜金額｜金額｜区分｜集計方法」として解析できれば行番号を返す。"""
+    parts = line.split("｜", 6)
+    if len(parts) != 7:
+        raise ValueError(line)
+    for s in parts[2:5]:
+        _to_int_strict(s)
+    return int(parts[0])
+
+
+def _line_no_prefix(line: str) -> Optional[int]:
+    m = re.match(r"^(\d{1,3})｜", line)
+    return int(m.group(1)) if m else None
+
+
+def _collect_rows(raw_text: str, expected: Sequence[int], lean: bool = False) -> Tuple[Dict[int, str], List[int]]:
+    """
+    expected の行番号ごとに最初の正しい行を拾い、欠落・形式不正の行番号を返す。
+    lean（0 の行を省略させた出力）では、出力されなかった行は欠落とせず、形式不正だった行だけを返す。
+    """
+    found: Dict[int, str] = {}
+    malformed: set = set()
+    for l in _extract_lines(raw_text, r"^\d{1,3}｜"):
+        try:
+            n = _check_row_line(l)
+        except ValueError:
+            malformed.add(_line_no_prefix(l))
+            continue
+        if n in expected and n not in found:
+            found[n] = l
+    if lean:
+        return found, [n for n in expected if n in malformed and n not in found]
+    return found, [n for n in expected if n not in found]
+
+
+class _RowCollector:
+    """ストリーミング出力を1行ずつ受け取り、expected の行番号ごとに正しい行を拾う。"""
+
+    def __init__(self, expected: Sequence[int], label: str, lean: bool = False):
+        self.expected = expected
+        self.label = label
+        self.lean = lean
+        self.found: Dict[int, str] = {}
+        self.malformed: set = set()
+        self.last_seen = 0
+        self.bad_lines = 0
+
+    def feed(self, line: str) -> None:
+        l = line.strip()
+        if not l:
+            return
+        if not re.match(r"^\d{1,3}｜", l):
+            # 前置きの文・コードフェンス・見出しなど行番号で始まらない行は数えずに読み飛ばす
+            return
+        self.last_seen = max(self.last_seen, _line_no_prefix(l))
+        try:
+            n = _check_row_line(l)
+        except ValueError:
+            self.malformed.add(_line_no_prefix(l))
+            n = None
+        if n is not None and n in self.expected:
+            if n not in self.found:
+                self.found[n] = l
+                return
+            if self.found[n] == l:
+                # 受け取り済みの行とまったく同じ行の繰り返しは無害なので数えない
+                return
+        # 形式不正の行・範囲外の行・受け取り済みの行番号と内容が食い違う行を数える
+        self.bad_lines += 1
+        if self.bad_lines > LLM_STREAM_MAX_BAD_LINES:
+            logger.warning("%s: 形式不正の行が続いたため生成を打ち切ります: %s", self.label, l)
+            raise llm.StreamAborted(l)
+
+    def missing(self, aborted: bool = False) -> List[int]:
+        if self.lean:
+            # 打ち切った場合は、まだ届いていない（最後に受け取った行より後の）行も聞き直す
+            return [
+                n for n in self.expected
+                if n not in self.found and (n in self.malformed or (aborted and n > self.last_seen))
+            ]
+        return [n for n in self.expected if n not in self.found]
+
+
+def _create_rows_text(
+    system: str,
+    parts: List[str],
+    expected: Sequence[int],
+    line_format: str,
+    max_tokens: int,
+    client: Optional[Any],
+    validate: Callable[[str], Any],
+    label: str,
+    lean: bool = False,
+    model: str = llm.MODEL,
+) -> str:
+    """
+    LLM 出力を取得し、expected の行番号が欠落・形式不正なら、その行だけを追加指示で聞き直して補完する。
+    すべて揃った場合は行番号順に並べたテキストを返す（揃わなければ最初の出力のまま返し、呼び出し側の検証でエラーにする）。
+    lean では出力されなかった行（0 の行）は聞き直さず、形式不正の行だけを聞き直す。
+    """
+    previous = None
+    if LLM_STREAM:
+        collector = _RowCollector(expected, label, lean)
+        raw_text, aborted = llm.stream_text(
+            system, parts, max_tokens=max_tokens, on_line=collector.feed, client=client, model=model, validate=validate
+        )
+        found, missing = collector.found, collector.missing(aborted)
+        if aborted:
+            # 打ち切った場合は、正しく受け取れた行だけを直前の応答として再質問する
+            previous = "\n".join(found[n] for n in expected if n in found)
+    else:
+        raw_text = llm.create_text(system, parts, max_tokens=max_tokens, client=client, model=model, validate=validate)
+        found, missing = _collect_rows(raw_text, expected, lean)
+    if not raw_text.strip():
+        return raw_text
+    if not missing:
+        # 重複行・範囲外の行があっても、揃っていれば行番号順の expected 行だけにする
+        return "\n".join(found[n] for n in expected if n in found)
+
+    if previous is None:
+        previous = raw_text
+    for attempt in range(LLM_REPAIR_ATTEMPTS):
+        logger.warning("%s: 欠落・形式不正の行を再質問します（%d回目）: %s", label, attempt + 1, missing)
+        previous = llm.create_followup(
+            system,
+            parts,
+            previous,
+            build_repair_prompt(missing, line_format),
+            max_tokens=min(max_tokens, max(512, 64 * len(missing))),
+            client=client,
+            model=model,
+        )
+        got, bad = _collect_rows(previous, range(min(expected), max(expected) + 1), lean)
+        for n in missing:
+            if n in got:
+                found[n] = got[n]
+        # lean では聞き直しでも出力されなかった行は 0 の行とみなす
+        missing = [n for n in missing if n not in found and n in bad]
+        if not missing:
+            return "\n".join(found[n] for n in expected if n in found)
+    return raw_text
+
+
+_TOOL_FIELDS = {
+    "account": "勘定科目",
+    "current": "今期",
+    "previous": "前期",
+    "before_previous": "前々期",
+    "kubun": "区分",
+    "method": "集計方法",
+}
+
+
+def _rows_from_tool_json(
+    raw_json: str, expected: Sequence[int], lean: bool = False
+) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+    """
+    ツール出力（{"rows": [...]}）から expected の行番号ごとに最初の正しい行を拾い、欠落の行番号を返す。
+    lean では出力されなかった行は欠落とせず、金額が整数でなかった行だけを返す。
+    """
+    found: Dict[int, Dict[str, Any]] = {}
+    malformed: set = set()
+    try:
+        items = json.loads(raw_json).get("rows") if raw_json.strip() else None
+    except (ValueError, AttributeError):
+        items = None
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        n = item.get("line_no")
+        if not isinstance(n, int) or n not in expected or n in found:
+            continue
+        if not all(isinstance(item.get(k), int) for k in ("current", "previous", "before_previous")):
+            malformed.add(n)
+            continue
+        row: Dict[str, Any] = {"行番号": n}
+        for k, jp in _TOOL_FIELDS.items():
+            v = item.get(k, "")
+            row[jp] = v if isinstance(v, int) else str(v).strip()
+        found[n] = row
+    if lean:
+        return found, [n for n in expected if n in malformed and n not in found]
+    return found, [n for n in expected if n not in found]
+
+
+def _check_tool_rows(raw_json: str, expected: Sequence[int], lean: bool = False) -> None:
+    if lean and not raw_json.strip():
+        raise ValueError("ツール出力がありません")
+    _, missing = _rows_from_tool_json(raw_json, expected, lean)
+    if missing:
+        raise ValueError(f"行が欠落しています: {missing}")
+
+
+def _create_rows_tool(
+    system: str,
+    parts: List[str],
+    expected: Sequence[int],
+    max_tokens: int,
+    client: Optional[Any],
+    label: str,
+    lean: bool = False,
+    model: str = llm.MODEL,
+) -> List[Dict[str, Any]]:
+    """
+    CASHAI_LLM_OUTPUT=tool のとき、ツール呼び出しで行を受け取り行番号順の行リストを返す（金額は整数型のまま）。
+    欠落した行だけを追加指示で出し直させ、揃わなければ ValueError（lean では出力された行だけを返す）。
+    """
+    system = system.rstrip("\n") + "\n\n" + TOOL_OUTPUT_NOTE
+    validate = functools.partial(_check_tool_rows, expected=expected, lean=lean)
+    raw_json = llm.create_tool_json(
+        system, parts, ROWS_TOOL, max_tokens=max_tokens, client=client, model=model, validate=validate
+    )
+    if not raw_json.strip():
+        raise RuntimeError(f"{label}: LLM のツール出力が取得できませんでした。")
+    found, missing = _rows_from_tool_json(raw_json, expected, lean)
+    for attempt in range(LLM_REPAIR_ATTEMPTS):
+        if not missing:
+            break
+        logger.warning("%s: 欠落した行を再提出させます（%d回目）: %s", label, attempt + 1, missing)
+        raw_json = llm.create_tool_json(
+            system,
+            list(parts) + [build_tool_repair_prompt(missing)],
+            ROWS_TOOL,
+            max_tokens=min(max_tokens, max(512, 96 * len(missing))),
+            client=client,
+            model=model,
+            use_cache=False,
+        )
+        got, _ = _rows_from_tool_json(raw_json, missing)
+        found.update(got)
+        missing = [n for n in missing if n not in found]
+    if missing:
+        raise ValueError(f"{label}: ツール出力の行が揃いませんでした: {missing}")
+    return [found[n] for n in expected if n in found]
+
+
+def _run_tiered(
+    section: str,
+    label: str,
+    attempt: Callable[[str], Any],
+    check: Optional[Callable[[Any], List[Any]]] = None,
+    source: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    区間の既定モデル（llm.section_model）で attempt(model) を実行し、
+    失敗（行の欠落・形式不正など）または check が不一致を返した場合だけ MODEL で1回やり直す。
+    MODEL でも check の不一致が変わらなければ元データ側の不一致（端数処理のずれなど）とみなし、
+    source を渡した場合は iter_cloab001 の集計後の再質問をしないよう区間を記録する（_run_state の "settled"）。
+    """
+    model = llm.section_model(section)
+    if model == llm.MODEL:
+        return attempt(model)
+    try:
+        result = attempt(model)
+    except Exception as e:
+        logger.warning("%s: %s の出力が使えないため %s でやり直します: %s", label, model, llm.MODEL, e)
+        return attempt(llm.MODEL)
+    problems = check(result) if check is not None else []
+    if problems:
+        logger.warning(
+            "%s: %s の出力が検算で不一致のため %s でやり直します: %s",
+            label, model, llm.MODEL, [p.get("行番号", p) if isinstance(p, dict) else p for p in problems],
+        )
+        result = attempt(llm.MODEL)
+        if source is not None and _same_problems(check(result), problems):
+            _run_state(source).setdefault("settled", set()).add(section)
+    return result
+
+
+def _same_problems(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> bool:
+    """検算の不一致（validation の結果）が同じ行・同じ差異か。"""
+
+    def _key(problems: List[Dict[str, Any]]) -> List[Any]:
+        return sorted((p["行番号"], tuple(sorted(p["差異"].items()))) for p in problems)
+
+    return _key(a) == _key(b)
+
+
+def _finalized_problems(section: str, rows: List[Dict[str, Any]], source: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    PL 区間の出力を区間内だけで補正（finalize）してから検算する（_run_tiered の check 用。rows は変更しない）。
+    他の区間の行（121〜154 から見た行120 など）を参照する式は調べない（validation.verify_totals）。
+    """
+    row_dict = {r["行番号"]: dict(r) for r in rows}
+    if section == "112_120":
+        finalize_rows_112_120(row_dict, source)
+    else:
+        finalize_rows_121_154(row_dict, source)
+    return validation.validate_section(section, list(row_dict.values()), source)
+
+
+# ============================================================
+# 【A】 1〜78行（BS）
+# ============================================================
+
+def _check_lean_lines(lines: List[str], expected: Sequence[int], label: str) -> None:
+    """省略形の出力の検証：各行が解析でき、行番号が expected の範囲内で重複しないこと（行数は問わない）。"""
+    seen = set()
+    for l in lines:
+        n = _check_row_line(l)
+        if n not in expected or n in seen:
+            raise ValueError(f"{label}: 対象外または重複した行番号です: {n}")
+        seen.add(n)
+
+
+def _scoped_prompts(
+    system: str, spec: str, head: str, total: int, skip: Sequence[int], other: Sequence[int] = ()
+) -> Tuple[str, str, str]:
+    system, spec, head = scope_prompts(system, spec, head, total, tuple(skip), tuple(other))
+    if not llm.LLM_VERBOSE_OUTPUT:
+        system, head = lean_prompts(system, head)
+    return system, spec, head
+
+
+def _fill_blank_rows(rows: List[Dict[str, Any]], expected: Sequence[int]) -> List[Dict[str, Any]]:
+    """省略形の出力で出力されなかった（金額 0 の）行を補う。"""
+    got = {r["行番号"] for r in rows}
+    return rows + [rules.blank_row(n) for n in expected if n not in got]
+
+
+def _bs_1_78_lines(raw_text: str, expected: Sequence[int] = SECTION_ROWS["1_78"], lean: bool = False) -> List[str]:
+    if not raw_text.strip():
+        raise RuntimeError("LLM 出力が取得できませんでした。")
+    lines = _extract_lines(raw_text, r"^\d{1,3}｜")
+    if lean:
+        _check_lean_lines(lines, expected, "1〜78行")
+        return lines
+    if len(lines) != len(expected):
+        logger.warning("1〜78行 LLM出力:\n%s", raw_text)
+        raise ValueError(f"行数が{len(expected)}行ではありません（{len(lines)}行）。")
+    return lines
+
+
+def run_bs_1_78(
+    source: Dict[str, Any], client: Optional[Any] = None, findings: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    BS 1〜78行を LLM で集計し、行6/37/42 の補正を適用した行リストを返す（CASHAI_BS_SPLIT=1 では資産・負債純資産の2回に分けて並列に呼ぶ）。
+    前回までの科目対応を記憶している会社は、記憶している科目は記憶どおりに割り当て、記憶に無い科目はすべて LLM に分類させる
+    （ルールの同義語で割り当てられる科目も LLM に聞く。ルールを先に使うのは hybrid モード）。
+    findings（集計後の検算の不一致）を渡した場合は、記憶を使わず、不一致の内容を添えて MODEL で集計し直す。
+    読み取った科目対応は _propose_mapping で渡し、記憶するのは iter_cloab001 の検算で採用された場合だけ。
+    """
+    known = account_mapping_store.load(company_key(source), "1_78") if findings is None else {}
+    if known:
+        return _bs_1_78_by_mapping(source, client, known, rules_first=False)
+    feedback = build_validation_feedback(findings) if findings else None
+
+    def _attempt(model: str) -> List[Dict[str, Any]]:
+        if BS_SPLIT:
+            # 資産（1〜45）と負債・純資産（46〜78）を並列に集計し、Step A の row_data_map を合わせてから補正する
+            row_data_map: Dict[Any, Dict[str, Any]] = {}
+            with ThreadPoolExecutor(max_workers=len(BS_SPLIT_RANGES), thread_name_prefix="cloab001-bs") as ex:
+                futures = [
+                    ex.submit(_bs_row_map_by_llm, source, client, rows, label, 4096, model, feedback)
+                    for rows, label in BS_SPLIT_RANGES
+                ]
+                for fut in futures:
+                    row_data_map.update(fut.result())
+        else:
+            row_data_map = _bs_row_map_by_llm(
+                source, client, SECTION_ROWS["1_78"], "1〜78行", 8192, model, feedback
+            )
+        return rows_1_78_from_row_map(row_data_map, source)
+
+    if findings:
+        rows = _attempt(llm.MODEL)
+    else:
+        rows = _run_tiered("bs_1_78", "1〜78行", _attempt, lambda r: validation.bs_problems(r, source), source)
+    _propose_mapping(source, "1_78", learn_bs(rows, source), "llm")
+    return rows
+
+
+def _bs_row_map_by_llm(
+    source: Dict[str, Any],
+    client: Optional[Any],
+    rows: Sequence[int],
+    label: str,
+    max_tokens: int,
+    model: str = llm.MODEL,
+    feedback: Optional[str] = None,
+) -> Dict[Any, Dict[str, Any]]:
+    """1〜78行のうち rows の行を LLM で集計し、Step A の row_data_map（補正前）を返す（feedback は検算結果の追加指示）。"""
+    lean = not llm.LLM_VERBOSE_OUTPUT
+    skip = skipped_rows("1_78", source)
+    expected = [n for n in llm_rows("1_78", source) if n in rows]
+    other = [n for n in SECTION_ROWS["1_78"] if n not in rows]
+    system, spec, head = _scoped_prompts(
+        SYSTEM_PROMPT_BS_1_78, SPEC_TEXT_BS_1_78, USER_PROMPT_BS_1_78_HEAD, 78, skip, other
+    )
+    parts = build_user_parts(spec, head, compact_source(source, SOURCE_KEYS_BS_1_78))
+    if feedback:
+        parts.append(feedback)
+    if llm.LLM_OUTPUT_FORMAT == "tool":
+        tool_rows = _create_rows_tool(
+            system, parts, expected, max_tokens=max_tokens, client=client, label=label, lean=lean, model=model
+        )
+        return {r["行番号"]: {k: v for k, v in r.items() if k != "行番号"} for r in tool_rows}
+    validate = functools.partial(_bs_1_78_lines, expected=expected, lean=lean)
+    raw_text = _create_rows_text(
+        system, parts, expected, LINE_FORMAT,
+        max_tokens=max_tokens, client=client, validate=validate, label=label, lean=lean, model=model,
+    )
+    return _row_map_from_lines(validate(raw_text))
+
+
+def rows_1_78_from_lines(lines: List[str], source: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return rows_1_78_from_row_map(_row_map_from_lines(lines), source)
+
+
+def _row_map_from_lines(lines: List[str]) -> Dict[Any, Dict[str, Any]]:
+    # --- Step A: 一旦すべての行を辞書に格納（再計算しやすくするため） ---
+    row_data_map: Dict[Any, Dict[str, Any]] = {}
+
+    for l in lines[:78]:
+        parts = l.split("｜", 6)
+        if len(parts) != 7:
+            continue
+
+        try:
+            row_num = int(parts[0])
+            val_konki = int(parts[2])
+            val_zenki = int(parts[3])
+            val_zenzenki = int(parts[4])
+        except ValueError:
+            row_num = parts[0]
+            val_konki, val_zenki, val_zenzenki = 0, 0, 0
+
+        row_data_map[row_num] = {
+            "勘定科目": parts[1],
+            "今期": val_konki,
+            "前期": val_zenki,
+            "前々期": val_zenzenki,
+            "区分": parts[5],
+            "集計方法": parts[6]
+        }
+    return row_data_map
+
+
+def rows_1_78_from_row_map(row_data_map: Dict[Any, Dict[str, Any]], source: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Step A の row_data_map（LLM 出力 or ルール集計）に補正を適用し、1〜78 行のリストにする。"""
+    # --- Step A2: 1〜78行を必ず存在させる（空行でも出力。省略形の出力では 0 の行がここで補われる） ---
+    for i in range(1, 79):
+        if i not in row_data_map:
+            row_data_map[i] = {
+                "勘定科目": rules.BS_LABELS.get(i, ""),
+                "今期": 0,
+                "前期": 0,
+                "前々期": 0,
+                "区分": "",
+                "集計方法": ""
+            }
+
+    # Python 側で確定する行（LLM に出力させていない行）は勘定科目・区分をレジストリから補う
+    for i in skipped_rows("1_78", source):
+        row_data_map[i] = {k: v for k, v in placeholder(i).items() if k != "行番号"}
+
+    _fix_row_37(row_data_map)
+    # 行6（当座資産合計：記載値 or 1+3+4+5）・行42（投資等小計：重複排除後の 34〜41 − 40）
+    formulas.apply_to_row_map(row_data_map, formulas.BS_RECALC_FORMULAS, source)
+
+    # --- Step C: 出力用リストへの変換 ---
+    rows = []
+    for row_num in sorted(row_data_map.keys(), key=lambda x: int(x)):
+        d = row_data_map[row_num]
+        rows.append({
+            "行番号": row_num,
+            "勘定科目": d["勘定科目"],
+            "前々期": d["前々期"],
+            "前期": d["前期"],
+            "今期": d["今期"],
+            "区分": d["区分"],
+            "集計方法": d["集計方法"]
+        })
+    return rows
+
+
+def _fix_row_37(row_data_map: Dict[Any, Dict[str, Any]]) -> None:
+    # --- Step B2: 行37（その他の投資等）の二重計上を防止する ---
+    check_rows = [34, 35, 36, 38, 39, 41]
+    for term in PERIODS:
+        val_37 = row_data_map[37].get(term, 0)
+        for r_num in check_rows:
+            other_val = row_data_map.get(r_num, {}).get(term, 0)
+            if val_37 != 0 and val_37 == other_val:
+                row_data_map[37][term] = 0
+                row_data_map[37]["集計方法"] = f"Python側で重複排除(行{r_num}と一致)"
+                break
+
+
+# ============================================================
+# 【B-1】 81〜111行（製造原価報告書：data.json の「製造原価」配列のみで確定）
+# ============================================================
+
+_SEIZO_DENY_WORDS = [
+    "合計", "小計", "総計", "当期経費", "経費合計", "当期総製造費用", "当期製品製造原価",
+    "期首", "期末", "仕掛品", "棚卸", "増減"
+]
+
+# 93〜104 の候補から除く科目（合計行の「経費」単独名 / 90〜92 で拾う典型語）
+_SEIZO_TOTAL_NAME_RE = re.compile(r"(経費|製造原価)")
+_SEIZO_DEDICATED_RE = re.compile(r"減価償却|償却費|外注加工|加工外注|消耗品|副資材")
+
+
+def _apply_seizo_only_81_111(row_dict: Dict[int, Dict[str, Any]], source_data: Dict[str, Any]) -> None:
+    seizo_list = get_index(source_data).items("製造原価")
+
+    def _set_row(line_no, account_name, vals, method):
+        if line_no not in row_dict:
+            row_dict[line_no] = {"行番号": line_no}
+        row_dict[line_no]["行番号"] = line_no
+        row_dict[line_no]["勘定科目"] = account_name
+        row_dict[line_no]["今期"], row_dict[line_no]["前期"], row_dict[line_no]["前々期"] = vals
+        # 製造原価報告書は区分が必要な行のみ設定（不明なら空）
+        if "区分" not in row_dict[line_no]:
+            row_dict[line_no]["区分"] = ""
+        row_dict[line_no]["集計方法"] = method if (method and str(method).strip()) else "該当なし"
+
+    def _has_any(raw_name, words):
+        s = str(raw_name or "")
+        return any(w in s for w in words)
+
+    def _method(matched):
+        return ("製造原価より: " + "、".join(matched)) if matched else "製造原価より: 該当なし"
+
+    # 科目ごとに SEIZO_PATTERN_RULES の全行を1回で判定して合算しておく
+    sums = seizo_sums(source_data)
+
+    # -----------------------------
+    # 81〜84 材料費
+    # -----------------------------
+    v81, m81 = sums[81]
+    _set_row(81, "材料棚卸高", v81, _method(m81))
+
+    v82, m82 = sums[82]
+    _set_row(82, "当期材料仕入高", v82, _method(m82))
+
+    v83, m83 = sums[83]
+    _set_row(83, "期末材料棚卸高", v83, _method(m83))
+
+    # 84・89・105・107・110・111 の金額は build_rows_81_111 で formulas.SEIZO_FORMULAS により計算する
+    _set_row(84, "当期材料費（Ｖ）", [0, 0, 0], "")
+    row_dict[84]["区分"] = "V"
+
+    # -----------------------------
+    # 85〜89 労務費
+    # -----------------------------
+    v85, m85 = sums[85]
+    _set_row(85, "賃金", v85, _method(m85))
+
+    v86, m86 = sums[86]
+    _set_row(86, "賞与", v86, _method(m86))
+
+    v87, m87 = sums[87]
+    _set_row(87, "退職金", v87, _method(m87))
+
+    v88, m88 = sums[88]
+    _set_row(88, "厚生費", v88, _method(m88))
+
+    _set_row(89, "当期労務費", [0, 0, 0], "")
+
+    # 区分（労務費は原則F）
+    for ln in [85, 86, 87, 88]:
+        row_dict[ln]["区分"] = "F"
+
+    # -----------------------------
+    # 90〜104 製造経費
+    # -----------------------------
+    v90, m90 = sums[90]
+    _set_row(90, "減価償却費", v90, _method(m90))
+
+    v91, m91 = sums[91]
+    _set_row(91, "外注加工費", v91, _method(m91))
+
+    v92, m92 = sums[92]
+    _set_row(92, "消耗品費", v92, _method(m92))
+
+    used_norm = set(_normalize_account_name(x) for x in (m90 + m91 + m92))
+
+    # 93〜104 に割り当てる候補：合計/小計/期首期末/仕掛品などは除外
+    expense_candidates = []
+    for rec in seizo_list:
+        raw_nm = rec.name
+        nm = rec.norm
+        if nm == "" or nm in used_norm:
+            continue
+        bunrui = rec.bunrui
+        # 分類が経費以外（例: 労務費/材料、空）は除外
+        if ("経費" not in bunrui) and ("製造経費" not in bunrui):
+            continue
+        if _has_any(raw_nm, _SEIZO_DENY_WORDS):
+            continue
+        # 合計行の「経費」単独名は 93〜104 に入れない（105で扱う）
+        if _SEIZO_TOTAL_NAME_RE.fullmatch(raw_nm):
+            continue
+        # 90-92で拾う典型語はここでは除外（二重計上抑止）
+        if _SEIZO_DEDICATED_RE.search(nm):
+            continue
+        expense_candidates.append(rec)
+
+    # 93〜103 に単独配置、足りなければ空
+    for ln in range(93, 104):
+        if expense_candidates:
+            rec = expense_candidates.pop(0)
+            _set_row(ln, rec.name, rec.vals, "製造原価より: 単独計上")
+        else:
+            _set_row(ln, "", [0, 0, 0], "製造原価より: 該当なし")
+
+    # 104 は溢れ合算
+    remain_total = [0, 0, 0]
+    remain_names = []
+    for rec in expense_candidates:
+        raw_nm = rec.name
+        if raw_nm == "" or _has_any(raw_nm, _SEIZO_DENY_WORDS):
+            continue
+        if rec.norm == "":
+            continue
+        for j in range(3):
+            remain_total[j] += rec.vals[j]
+        remain_names.append(raw_nm)
+
+    if remain_names:
+        _set_row(104, "製造経費スロット溢れ対応", remain_total, "製造原価より溢れ分合算: " + "、".join(remain_names))
+    else:
+        _set_row(104, "", [0, 0, 0], "製造原価より: 該当なし")
+
+    # 区分（製造経費は原則V）
+    row_dict[90]["区分"] = "F"
+    for ln in range(91, 105):
+        row_dict[ln]["区分"] = "V"
+
+    _set_row(105, "当期製造経費", [0, 0, 0], "")
+    row_dict[105]["区分"] = ""
+
+    # -----------------------------
+    # 106〜111 仕掛品・製造原価
+    # -----------------------------
+    v106, m106 = sums[106]
+    _set_row(106, "期首仕掛品", v106, _method(m106))
+
+    v108, m108 = sums[108]
+    _set_row(108, "期末仕掛品", v108, _method(m108))
+
+    v109, m109 = sums[109]
+    _set_row(109, "他勘定振替高", v109, _method(m109))
+
+    _set_row(107, "小計", [0, 0, 0], "")
+    _set_row(110, "期首-期末仕掛品差額(V)", [0, 0, 0], "")
+    row_dict[110]["区分"] = "V"
+    _set_row(111, "当期製造原価", [0, 0, 0], "")
+
+
+class _RowAccessor:
+    """originals の set_vals / set_method をインスタンス単位で持つ（グローバル row_dict を使わない）。"""
+
+    def __init__(self, row_dict: Dict[int, Dict[str, Any]]):
+        self.row_dict = row_dict
+
+    def set_vals(self, line_no, vals):
+        if line_no in self.row_dict:
+            self.row_dict[line_no]["今期"], self.row_dict[line_no]["前期"], self.row_dict[line_no]["前々期"] = vals
+            self.row_dict[line_no]["集計方法"] = "自動計算"
+
+    def set_method(self, line_no, method):
+        if line_no in self.row_dict:
+            self.row_dict[line_no]["集計方法"] = method
+
+
+def build_rows_81_111(source: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+    """製造原価配列のみから 81〜111 行を確定する（LLM不要）。"""
+    row_dict: Dict[int, Dict[str, Any]] = {}
+    _apply_seizo_only_81_111(row_dict, source)
+
+    # 85～88 行は必ず F
+    for rn in range(85, 89):
+        row_dict[rn]["区分"] = "F"
+
+    # 84: 当期材料費 / 89: 当期労務費 / 105: 当期製造経費 / 107: 小計 / 110・111
+    formulas.apply_to_row_map(row_dict, formulas.SEIZO_FORMULAS, source)
+    row_dict[107]["勘定科目"] = "小計"
+    return row_dict
+
+
+# ============================================================
+# 【B-2】 112〜120行（PL：売上高〜売上総利益）
+# ============================================================
+
+def _pl_112_120_rows(
+    raw_text: str, expected: Sequence[int] = SECTION_ROWS["112_120"], lean: bool = False
+) -> List[Dict[str, Any]]:
+    if not raw_text.strip():
+        raise RuntimeError("PL 112〜120 用 LLM 出力が取得できませんでした。")
+    lines = _extract_lines(raw_text, r"^\d{3}｜")
+    if lean:
+        _check_lean_lines(lines, expected, "PL 112〜120")
+        return _parse_pl_lines(lines, "PL 112〜120")
+    if len(lines) != len(expected):
+        logger.warning("PL 112〜120 LLM出力:\n%s", raw_text)
+        raise ValueError(f"PL 112〜120 部分の行数が {len(expected)} 行ではありません（{len(lines)} 行でした）。")
+
+    rows = _parse_pl_lines(lines, "PL 112〜120")
+    actual = sorted(r["行番号"] for r in rows)
+    if actual != list(expected):
+        raise ValueError(f"PL 112〜120 部分の行番号が期待した行番号と一致しません: {actual}")
+    return rows
+
+
+def run_pl_112_120(source: Dict[str, Any], client: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """PL 112〜120行を LLM で集計し、行112を PL 記載値で上書きした行リストを返す。"""
+    skip = skipped_rows("112_120", source)
+    expected = llm_rows("112_120", source)
+    lean = not llm.LLM_VERBOSE_OUTPUT
+    system, spec, head = _scoped_prompts(
+        SYSTEM_PROMPT_PL_112_120, SPEC_TEXT_PL_112_120, USER_PROMPT_PL_112_120_HEAD, 9, skip
+    )
+    parts = build_user_parts(spec, head, compact_source(source, SOURCE_KEYS_PL_112_120))
+
+    def _attempt(model: str) -> List[Dict[str, Any]]:
+        if llm.LLM_OUTPUT_FORMAT == "tool":
+            rows = _create_rows_tool(
+                system, parts, expected, max_tokens=4096, client=client, label="PL 112〜120", lean=lean, model=model
+            )
+        else:
+            validate = functools.partial(_pl_112_120_rows, expected=expected, lean=lean)
+            raw_text = _create_rows_text(
+                system, parts, expected, LINE_FORMAT,
+                max_tokens=4096, client=client, validate=validate, label="PL 112〜120", lean=lean, model=model,
+            )
+            rows = validate(raw_text)
+        rows = _fill_blank_rows(rows, expected) + [placeholder(n) for n in skip]
+        rows.sort(key=lambda r: r["行番号"])
+        _override_row112_from_pl(rows, source)
+        return rows
+
+    return _run_tiered(
+        "pl_112_120", "PL 112〜120", _attempt, lambda r: _finalized_problems("112_120", r, source), source
+    )
+
+
+def _override_row112_from_pl(rows_pl_112_120: List[Dict[str, Any]], source_data: Dict[str, Any]) -> None:
+    """
+    data.json の PL 配列から売上高合計を取得して行112を上書きする。
+    複数列ある場合は「一番右（最後に出現する売上合計行）」を採用。
+    """
+    found = find_pl_sales_total(source_data)
+    if found is None:
+        logger.info("行112: data.json に売上高合計行が見つからなかったため、LLM出力をそのまま使用します。")
+        return
+    chosen, method_note = found
+
+    now_val, prev_val, prev2_val = _get_amount_triplet(chosen)
+    for row in rows_pl_112_120:
+        if row["行番号"] == 112:
+            row["今期"] = now_val
+            row["前期"] = prev_val
+            row["前々期"] = prev2_val
+            row["集計方法"] = method_note
+            break
+
+
+def _dynamic_aggregate_by_llm_method(target_row_idx, f_map, source_recs) -> None:
+    """
+    f_map[target_row_idx] の『集計方法』に記載された科目名を読み取り、
+    source_recs（全生データ）から動的に数値を合算する
+    """
+    target_row = f_map.get(target_row_idx)
+    if not target_row:
+        return
+
+    method_text = target_row.get("集計方法", "")
+    clean_method = method_text.split(" (")[0]
+    keywords = [k.strip() for k in re.split(r'[、, \s]+', clean_method) if k.strip()]
+    if not keywords:
+        return
+
+    new_totals = {"前々期": 0, "前期": 0, "今期": 0}
+    matched_subjects = []
+
+    for row in source_recs:
+        if not isinstance(row, dict):
+            continue
+        orig_subject = str(row.get("勘定科目", "")).strip()
+        clean_subject = re.sub(r'[()\s　（）]', '', orig_subject)
+        for kw in keywords:
+            clean_kw = re.sub(r'[()\s　（）]', '', kw)
+            if clean_kw and clean_kw in clean_subject:
+                for term in ["前々期", "前期", "今期"]:
+                    new_totals[term] += to_int_safe_bs(row.get(term, 0))
+                matched_subjects.append(orig_subject)
+                break
+
+    if matched_subjects:
+        f_map[target_row_idx]["前々期"] = new_totals["前々期"]
+        f_map[target_row_idx]["前期"] = new_totals["前期"]
+        f_map[target_row_idx]["今期"] = new_totals["今期"]
+        f_map[target_row_idx]["集計方法"] = "再集計: " + "、".join(matched_subjects)
+    else:
+        f_map[target_row_idx]["集計方法"] = "再集計: 該当なし"
+
+
+def finalize_rows_112_120(row_dict: Dict[int, Dict[str, Any]], source: Dict[str, Any]) -> None:
+    """112〜120 行に PL 原本優先の再集計を適用する（row_dict を直接更新）。"""
+    acc = _RowAccessor(row_dict)
+    idx = get_index(source)
+    cost_records = idx.by_bunrui("PL", "売上原価")
+
+    # 114・115 を「集計方法（科目名列挙）」で動的再集計
+    all_source_records = []
+    for _k, _v in source.items():
+        if isinstance(_v, list):
+            all_source_records.extend(_v)
+    _dynamic_aggregate_by_llm_method(114, row_dict, all_source_records)
+
+    # 114 商品仕入高を強制再集計（売上原価分類のみ対象。リベート等はマイナス値のまま加算）
+    sum114 = [0, 0, 0]
+    matched114 = []
+    for rec in cost_records:
+        name = rec.name
+        if any(keyword in name for keyword in ["仕入", "購入", "商品材料仕入高", "ネット仕入", "リベート"]) and "合計" not in name:
+            for j in range(3):
+                sum114[j] += rec.vals[j]
+            matched114.append(name)
+
+    if 114 in row_dict:
+        row_dict[114]["今期"], row_dict[114]["前期"], row_dict[114]["前々期"] = sum114
+        row_dict[114]["集計方法"] = "PL売上原価より再集計: " + "、".join(matched114)
+
+    # 116: 他勘定振替高（製品売上原価 + 原価算入諸費用 + 労務費）
+    sum116 = [0, 0, 0]
+    matched116 = []
+    for rec in cost_records:
+        if rec.name in ["製品売上原価", "原価算入諸費用", "労務費"]:
+            for j in range(3):
+                sum116[j] += rec.vals[j]
+            matched116.append(rec.name)
+
+    acc.set_vals(116, sum116)
+    acc.set_method(116, ("PLより合算: " + "、".join(matched116)) if matched116 else "該当なし")
+
+    # 118: 期首-期末製品差額 / 119: 売上原価（PL原本優先）/ 120: 売上総利益（PL原本優先）
+    formulas.apply_to_row_map(row_dict, formulas.PL_112_120_FORMULAS, source)
+
+
+# ============================================================
+# 【B-3】 121〜154行（PL：販管費〜当期利益）
+# ============================================================
+
+def _pl_121_154_rows(
+    raw_text: str, expected: Sequence[int] = SECTION_ROWS["121_154"], lean: bool = False
+) -> List[Dict[str, Any]]:
+    if not raw_text.strip():
+        raise RuntimeError("PL 用 LLM 出力が取得できませんでした。")
+    lines = _extract_lines(raw_text, r"^\d{3}｜")
+    if lean:
+        _check_lean_lines(lines, expected, "PL 121〜154")
+        return _parse_pl_lines(lines, "PL")
+    if len(lines) != len(expected):
+        logger.warning("PL 121〜154 LLM出力:\n%s", raw_text)
+        raise ValueError(f"PL 部分の行頭が『数字｜』の行数が {len(expected)} 行ではありません（{len(lines)} 行でした）。")
+
+    rows = _parse_pl_lines(lines, "PL")
+    actual = sorted(r["行番号"] for r in rows)
+    if actual != list(expected):
+        raise ValueError(f"PL 部分の行番号が期待した行番号と一致しません: {actual}")
+    return rows
+
+
+def run_pl_121_154(
+    source: Dict[str, Any], client: Optional[Any] = None, findings: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    PL 121〜154行を LLM で集計した行リスト（Python補正前。Python 側で確定する行は空行）を返す。
+    販売費の科目対応を記憶している会社は、run_bs_1_78 と同じく記憶に無い科目をすべて LLM に分類させる。
+    findings を渡した場合は run_bs_1_78 と同じく、記憶を使わず不一致の内容を添えて MODEL で集計し直す。
+    """
+    known = account_mapping_store.load(company_key(source), "121_154") if findings is None else {}
+    if known:
+        return _pl_121_154_by_mapping(source, client, known, rules_first=False)
+    skip = skipped_rows("121_154", source)
+    expected = llm_rows("121_154", source)
+    lean = not llm.LLM_VERBOSE_OUTPUT
+    system, spec, head = _scoped_prompts(
+        SYSTEM_PROMPT_PL_121_154, SPEC_TEXT_PL_121_154, USER_PROMPT_PL_121_154_HEAD, 34, skip
+    )
+    parts = build_user_parts(spec, head, compact_source(source, SOURCE_KEYS_PL_121_154))
+    if findings:
+        parts.append(build_validation_feedback(findings))
+
+    def _attempt(model: str) -> List[Dict[str, Any]]:
+        if llm.LLM_OUTPUT_FORMAT == "tool":
+            rows = _create_rows_tool(
+                system, parts, expected, max_tokens=4096, client=client, label="PL 121〜154", lean=lean, model=model
+            )
+        else:
+            validate = functools.partial(_pl_121_154_rows, expected=expected, lean=lean)
+            raw_text = _create_rows_text(
+                system, parts, expected, LINE_FORMAT,
+                max_tokens=4096, client=client, validate=validate, label="PL 121〜154", lean=lean, model=model,
+            )
+            rows = validate(raw_text)
+        rows = _fill_blank_rows(rows, expected) + [placeholder(n) for n in skip]
+        rows.sort(key=lambda r: r["行番号"])
+        return rows
+
+    if findings:
+        rows = _attempt(llm.MODEL)
+    else:
+        rows = _run_tiered(
+            "pl_121_154", "PL 121〜154", _attempt, lambda r: _finalized_problems("121_154", r, source), source
+        )
+    _propose_mapping(source, "121_154", learn_sga(rows, source), "llm")
+    return rows
+
+
+def finalize_rows_121_154(row_dict: Dict[int, Dict[str, Any]], source: Dict[str, Any]) -> None:
+    """121〜154 行に PL 原本優先の再集計を適用する（行120 確定後に呼ぶこと）。"""
+    acc = _RowAccessor(row_dict)
+    idx = get_index(source)
+
+    # 125: 減価償却費（販売費内訳 → 無ければ PL）
+    sum125 = [0, 0, 0]
+    matched125 = []
+    for key in ["販売費", "PL"]:
+        if matched125:
+            break
+        for rec in idx.items(key):
+            if "減価償却" in rec.name:
+                for j in range(3):
+                    sum125[j] += rec.vals[j]
+                matched125.append(rec.name)
+
+    if 125 in row_dict:
+        row_dict[125]["今期"], row_dict[125]["前期"], row_dict[125]["前々期"] = sum125
+        row_dict[125]["集計方法"] = ("減価償却費抽出: " + "、".join(matched125)) if matched125 else "減価償却費該当なし"
+
+    # 138: その他雑費はPL内訳を直接採用（差額計算は行わない）
+    acc.set_vals(138, [0, 0, 0])
+    rec = idx.first("PL", ["その他販売費及び一般管理費"], "販売費及び一般管理費")
+    if rec is not None:
+        acc.set_vals(138, rec.vals)
+        acc.set_method(138, "PL内訳科目を直接採用")
+
+    # 139 販管費 / 140 営業利益 / 145 営業外収入合計 / 148 営業外支出合計 / 147（148 − 146）/ 149 経常利益 / 152 税引前当期利益
+    # （PL記載値があればそれを最優先し、無ければ計算する）
+    formulas.apply_to_row_map(row_dict, formulas.PL_121_154_RECALC_FORMULAS, source)
+
+    # 143: 営業外収入（その他）＝賃貸料収入のみ（行145 は上書き前の値で計算済み）
+    acc.set_vals(143, [0, 0, 0])
+    rec = idx.first("PL", ["賃貸料収入"], "営業外収益")
+    if rec is not None:
+        acc.set_vals(143, rec.vals)
+        acc.set_method(143, "賃貸料収入を採用")
+
+    # 153: 法人税等充当額（PL原本優先・表記ゆれ対応）
+    sum153 = [0, 0, 0]
+    matched153 = []
+    for rec in idx.items("PL"):
+        name = rec.name
+        norm_name = name.replace(" ", "").replace("　", "")
+        if (
+            ("法人" in norm_name and "税" in norm_name)
+            or "法人税等" in norm_name
+            or "法人税・住民税及び事業税" in norm_name
+            or "法人税及び住民税" in norm_name
+            or "法人税等調整額" in norm_name
+        ):
+            for j in range(3):
+                sum153[j] += rec.vals[j]
+            matched153.append(name)
+
+    if 153 in row_dict:
+        row_dict[153]["今期"], row_dict[153]["前期"], row_dict[153]["前々期"] = sum153
+        row_dict[153]["集計方法"] = ("PLより合算: " + "、".join(matched153)) if matched153 else "該当なし"
+
+
+# ============================================================
+# ルールベース（mode=rules / hybrid）
+# ============================================================
+
+def _replay_mappings(source: Dict[str, Any], section: str) -> Dict[str, int]:
+    """金額だけの修正で再実行する場合（runner の fast path）に _meta で渡される前回の科目対応。"""
+    return ((source.get("_meta") or {}).get("mappings") or {}).get(section) or {}
+
+
+def learn_mappings(rows: Sequence[Dict[str, Any]], source: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """集計結果（1〜154行）から {区間: {科目名: 行番号}} を読み取る。"""
+    return {"1_78": learn_bs(rows, source), "121_154": learn_sga(rows, source)}
+
+
+def mappings_cover(source: Dict[str, Any], mappings: Dict[str, Dict[str, int]]) -> bool:
+    """
+    mappings だけで全科目を割り当てられる（LLM なしで前回の集計を再現できる）か。
+    ルールで割り当てられても mappings に無い科目があれば False（ルールの割り当ては LLM の結果と一致するとは限らない）。
+    """
+    return all(
+        set(rules.section_accounts(source, section)) <= set(mappings.get(section) or {})
+        for section in ("1_78", "121_154")
+    )
+
+
+def run_bs_1_78_rules(source: Dict[str, Any], client: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """BS 1〜78行をルールのみで集計する（LLM なし）。"""
+    row_data_map, _unmatched = rules.bs_row_map(source, _replay_mappings(source, "1_78"))
+    return rows_1_78_from_row_map(row_data_map, source)
+
+
+def run_pl_112_120_rules(source: Dict[str, Any], client: Optional[Any] = None) -> List[Dict[str, Any]]:
+    rows, _unmatched = rules.pl_112_120_rows(source)
+    _override_row112_from_pl(rows, source)
+    return rows
+
+
+def run_pl_121_154_rules(source: Dict[str, Any], client: Optional[Any] = None) -> List[Dict[str, Any]]:
+    rows, _unmatched = rules.pl_121_154_rows(source, _replay_mappings(source, "121_154"))
+    return rows
+
+
+def _parse_classify_lines(raw_text: str, names: Sequence[str], candidates: Dict[int, str]) -> Dict[str, int]:
+    """「勘定科目｜行番号」の行から、names のうち候補行（または 0）に分類できた科目だけを返す。"""
+    wanted = set(names)
+    assign: Dict[str, int] = {}
+    for line in raw_text.splitlines():
+        parts = [p.strip() for p in line.strip().split("｜")]
+        if len(parts) < 2 or parts[0] not in wanted:
+            continue
+        m = re.match(r"^\d+", parts[1])
+        if m is None:
+            continue
+        n = int(m.group(0))
+        if n == 0 or n in candidates:
+            assign[parts[0]] = n
+    return assign
+
+
+def _check_classify(raw_text: str, names: Sequence[str], candidates: Dict[int, str]) -> Dict[str, int]:
+    assign = _parse_classify_lines(raw_text, names, candidates)
+    missing = [n for n in names if n not in assign]
+    if missing:
+        raise ValueError(f"分類できなかった科目があります: {missing}")
+    return assign
+
+
+def classify_accounts(
+    section: str,
+    candidates: Dict[int, str],
+    accounts: Sequence[Dict[str, str]],
+    client: Optional[Any] = None,
+) -> Dict[str, int]:
+    """
+    ルールで判断できなかった科目だけを LLM に行番号で分類させる（科目名 -> 行番号、0 は集計対象外）。
+    元データ全体は送らず、候補行の一覧と科目名・分類だけを送る。答えられなかった科目は含めない。
+    """
+    names = [a["勘定科目"] for a in accounts]
+    check = functools.partial(_check_classify, names=names, candidates=candidates)
+
+    def _attempt(model: str) -> str:
+        return llm.create_text(
+            SYSTEM_PROMPT_CLASSIFY,
+            build_classify_parts(section, candidates, accounts),
+            max_tokens=max(256, 48 * len(names)),
+            client=client,
+            model=model,
+            validate=check,
+        )
+
+    def _unclassified(raw_text: str) -> List[str]:
+        return [n for n in names if n not in _parse_classify_lines(raw_text, names, candidates)]
+
+    raw_text = _run_tiered("classify", section, _attempt, _unclassified)
+    assign = _parse_classify_lines(raw_text, names, candidates)
+    left = [n for n in names if n not in assign]
+    if left:
+        logger.warning("%s: LLM でも分類できなかった科目はルールの既定の行に残します: %s", section, left)
+    return assign
+
+
+def _run_state(source: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    区間の関数から iter_cloab001 へ、行リスト以外に渡す情報（source["_meta"]["run"]。iter_cloab001 が実行ごとに作り直す）。
+    区間の関数は並列に動くが、書き込むキーは区間ごとに別。
+    """
+    return source.setdefault("_meta", {}).setdefault("run", {})
+
+
+def _propose_mapping(source: Dict[str, Any], section: str, mapping: Dict[str, int], origin: str) -> None:
+    """区間の集計で得た科目対応を渡す（記憶するのは iter_cloab001 の検算で採用が決まった場合だけ）。"""
+    _run_state(source).setdefault("pending_mappings", {})[section] = (mapping, origin)
+
+
+def _unknown_accounts(source: Dict[str, Any], section: str, known: Dict[str, int]) -> List[str]:
+    return [n for n in rules.section_accounts(source, section) if n not in known]
+
+
+def _bs_1_78_by_mapping(
+    source: Dict[str, Any],
+    client: Optional[Any],
+    known: Dict[str, int],
+    rules_first: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    記憶（known）の科目は記憶どおりに割り当て、残りを LLM に分類させて rules.bs_row_map で集計する。
+    rules_first=True（hybrid）はルールでも判断できない科目だけ、False（llm）は記憶に無い科目をすべて LLM に分類させる。
+    """
+    row_data_map, unmatched = rules.bs_row_map(source, known)
+    if not rules_first:
+        unmatched = _unknown_accounts(source, "1_78", known)
+    if unmatched:
+        logger.info("1〜78行: %s科目を LLM で分類します: %s", "ルール・記憶で判断できない" if rules_first else "記憶に無い", unmatched)
+        accounts = rules.describe_accounts(source, ["BS"], unmatched)
+        assign = classify_accounts("1〜78行（貸借対照表）", rules.BS_CANDIDATE_ROWS, accounts, client)
+        _propose_mapping(source, "1_78", assign, "classify")
+        row_data_map, _unmatched = rules.bs_row_map(source, {**known, **assign})
+    return rows_1_78_from_row_map(row_data_map, source)
+
+
+def _pl_121_154_by_mapping(
+    source: Dict[str, Any],
+    client: Optional[Any],
+    known: Dict[str, int],
+    rules_first: bool = True,
+) -> List[Dict[str, Any]]:
+    """販売費の科目について _bs_1_78_by_mapping と同じ（LLM に分類させる範囲は rules_first で決める）。"""
+    rows, unmatched = rules.pl_121_154_rows(source, known)
+    if not rules_first:
+        unmatched = _unknown_accounts(source, "121_154", known)
+    if unmatched:
+        logger.info(
+            "PL 121〜154: %s販売費の科目を LLM で分類します: %s", "ルール・記憶で判断できない" if rules_first else "記憶に無い", unmatched
+        )
+        accounts = rules.describe_accounts(source, [rules.sga_source_key(source)], unmatched)
+        assign = classify_accounts("121〜138行（販売費及び一般管理費の内訳）", rules.SGA_CANDIDATE_ROWS, accounts, client)
+        _propose_mapping(source, "121_154", assign, "classify")
+        rows, _unmatched = rules.pl_121_154_rows(source, {**known, **assign})
+    return rows
+
+
+def run_bs_1_78_hybrid(source: Dict[str, Any], client: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """記憶・ルールで分類し、判断できなかった科目だけを LLM に分類させてから同じ集計・補正を通す。"""
+    return _bs_1_78_by_mapping(source, client, account_mapping_store.load(company_key(source), "1_78"))
+
+
+def run_pl_112_120_hybrid(source: Dict[str, Any], client: Optional[Any] = None) -> List[Dict[str, Any]]:
+    # 112〜120 は科目の分類に迷う行が無い（売上・棚卸・製造原価のみ）ためルールと同じ
+    return run_pl_112_120_rules(source, client)
+
+
+def run_pl_121_154_hybrid(source: Dict[str, Any], client: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """販売費のうち記憶・ルールで判断できなかった科目だけを LLM に分類させる（分類できなければ 138 その他雑費）。"""
+    return _pl_121_154_by_mapping(source, client, account_mapping_store.load(company_key(source), "121_154"))
+
+
+SECTION_RUNNERS = {
+    "llm": {"bs_1_78": run_bs_1_78, "pl_112_120": run_pl_112_120, "pl_121_154": run_pl_121_154},
+    "rules": {"bs_1_78": run_bs_1_78_rules, "pl_112_120": run_pl_112_120_rules, "pl_121_154": run_pl_121_154_rules},
+    "hybrid": {"bs_1_78": run_bs_1_78_hybrid, "pl_112_120": run_pl_112_120_hybrid, "pl_121_154": run_pl_121_154_hybrid},
+}
+
+
+# ============================================================
+# 構成比・統合
+# ============================================================
+
+def _calc_ratio(val, total) -> float:
+    if not total:
+        return 0.0
+    return round((val / total) * 100, 2)
+
+
+def apply_kouseihi(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """全行の構成比（資産=45, 負債純資産=75, 製造原価=111, PL=112 基準）を付与して行番号順に返す。"""
+    data_map = {int(row["行番号"]): row for row in rows}
+    table = RowTable.from_rows(data_map.values())
+    sorted_rows = []
+    for no in sorted(data_map.keys()):
+        row = data_map[no]
+        if 1 <= no <= 45:
+            denom_no = 45
+        elif 46 <= no <= 78:
+            denom_no = 75
+        elif 81 <= no <= 111:
+            denom_no = 111
+        elif 112 <= no <= 154:
+            denom_no = 112
+        else:
+            denom_no = None
+
+        if denom_no and table.has(denom_no):
+            vals, totals = table.get(no), table.get(denom_no)
+            for j, p in enumerate(ROW_PERIOD_KEYS):
+                row[f"{p}構成比"] = _calc_ratio(vals[j], totals[j])
+
+        sorted_rows.append(row)
+    return sorted_rows
+
+
+def merge_rows(rows_1_78: List[Dict[str, Any]], row_dict: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """1〜78 と 81〜154 を統合し、行番号で重複排除＆ソートしたうえで構成比を付与する。"""
+    final_output_list = list(rows_1_78) + [row_dict[k] for k in sorted(row_dict.keys())]
+
+    seen_rows = set()
+    unique_list = []
+    for item in final_output_list:
+        if item["行番号"] not in seen_rows:
+            unique_list.append(item)
+            seen_rows.add(item["行番号"])
+    unique_list.sort(key=lambda x: int(x["行番号"]))
+    return apply_kouseihi(unique_list)
+
+
+def _timed(fn, *args) -> Tuple[Any, int]:
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, int((time.perf_counter() - t0) * 1000)
+
+
+def _section_event(section: str, rows: List[Dict[str, Any]], extra: List[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    # 配信用にコピーし、区間内で完結する構成比を付与する（extra は分母行の参照用）
+    copies = copy.deepcopy(list(rows))
+    apply_kouseihi(copies + copy.deepcopy(list(extra)))
+    return {"section": section, "rows": copies}
+
+
+def iter_cloab001(
+    source: Dict[str, Any],
+    client: Optional[Any] = None,
+    parallel: Optional[bool] = None,
+    mode: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    確定した区間から順にイベントを返すジェネレータ。
+      {"section": "81_111" | "1_78" | "112_120" | "121_154", "rows": [...]}  ※構成比付き
+      {"section": "all", "rows": output.json 相当の全行, "timings": {...}, "validation": {...}}   ※最後に1回
+    3つの LLM 呼び出し（1〜78 / 112〜120 / 121〜154）は互いの出力を使わないため、
+    parallel=True（既定：環境変数 CASHAI_LLM_PARALLEL）では同時に発行し、完了順に後処理する。
+    mode（既定：環境変数 CASHAI_PIPELINE_MODE）で区間の集計方法を選ぶ（llm / rules / hybrid）。
+    1〜78 / 121〜154 は補正後に検算し、llm モードで不一致があればその区間だけを再質問して、不一致の少ない方を採用する。
+    """
+    if parallel is None:
+        parallel = LLM_PARALLEL
+    mode = mode or PIPELINE_MODE
+    if mode not in SECTION_RUNNERS:
+        raise ValueError(f"mode は {', '.join(PIPELINE_MODES)} のいずれかを指定してください: {mode}")
+    if mode == "rules":
+        # ルールのみの場合は数ミリ秒で終わるためスレッドを使わない
+        parallel = False
+    t0 = time.perf_counter()
+    timings: Dict[str, int] = {}
+
+    sections = SECTION_RUNNERS[mode]
+    run_state = source.setdefault("_meta", {})["run"] = {"pending_mappings": {}, "settled": set()}
+    # 元データの索引は区間の並列実行の前に1回だけ作る（以降の照合・抽出はすべて索引を引く）
+    get_index(source)
+
+    # 81〜111 は製造原価配列のみで確定するため LLM を待たずに返す
+    rows_81_111 = build_rows_81_111(source)
+    yield _section_event("81_111", [rows_81_111[k] for k in sorted(rows_81_111)])
+
+    row_dict: Dict[int, Dict[str, Any]] = {}
+    rows_1_78: List[Dict[str, Any]] = []
+    rows_pl: Optional[List[Dict[str, Any]]] = None
+    pl_112_120_done = False
+    findings: List[Dict[str, Any]] = []
+    retried: List[str] = []
+
+    def _validated(section: str, name: str, result: Any, apply: Callable[[Any], Any]) -> Tuple[Any, Any]:
+        """
+        apply(result)（補正後の行）を検算し、llm モードで不一致があれば不一致の内容を添えて区間を再質問する。
+        再質問の結果は不一致が減った場合だけ採用する。戻り値は (result, apply(result))。
+        区間の関数が渡した科目対応は、採用した結果の検算が一致した場合だけ記憶する（不一致のまま採用した結果は記憶しない）。
+        """
+        mapping = run_state["pending_mappings"].pop(section, None)
+        applied = apply(result)
+        problems = validation.validate_section(section, list(applied.values()), source)
+        retries = VALIDATION_RETRIES if mode == "llm" else 0
+        if problems and retries and name in run_state["settled"]:
+            # 小さいモデルと MODEL で同じ不一致だった区間は、再質問しても変わらない（元データ側の不一致）とみなす
+            logger.info("%s: MODEL でも検算の不一致が変わらなかったため再質問しません: %s", section, [p["行番号"] for p in problems])
+            retries = 0
+        for _ in range(retries):
+            if not problems:
+                break
+            logger.warning("%s: 集計後の検算で不一致のため再質問します: %s", section, [p["行番号"] for p in problems])
+            retried.append(section)
+            try:
+                again, ms = _timed(sections[name], source, client, problems)
+            except Exception as e:
+                logger.warning("%s: 再質問の出力が使えないため前回の結果を使います: %s", section, e)
+                break
+            timings[name] += ms
+            again_mapping = run_state["pending_mappings"].pop(section, None)
+            again_applied = apply(again)
+            again_problems = validation.validate_section(section, list(again_applied.values()), source)
+            if len(again_problems) >= len(problems):
+                break
+            result, applied, problems, mapping = again, again_applied, again_problems, again_mapping
+        findings.extend(problems)
+        if mapping and not problems:
+            account_mapping_store.remember(company_key(source), section, *mapping)
+        return result, applied
+
+    def _apply_pl(result: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        # 112〜120 は参照のみ（finalize_rows_121_154 が更新するのは 121〜154 行）
+        d = {n: r for n, r in row_dict.items() if 112 <= n <= 120}
+        d.update({r["行番号"]: r for r in result})
+        finalize_rows_121_154(d, source)
+        rules.finish_rows_121_154(d, source)
+        return d
+
+    def _on_done(name: str, result: Any) -> Iterator[Dict[str, Any]]:
+        nonlocal rows_1_78, rows_pl, pl_112_120_done
+        if name == "bs_1_78":
+            rows_1_78, _ = _validated("1_78", name, result, lambda rows: {r["行番号"]: r for r in rows})
+            yield _section_event("1_78", rows_1_78)
+        elif name == "pl_112_120":
+            row_dict.update({r["行番号"]: r for r in result})
+            finalize_rows_112_120(row_dict, source)
+            pl_112_120_done = True
+            yield _section_event("112_120", result)
+        else:
+            rows_pl = result
+        # 121〜154 の補正は行120（売上総利益）の確定後に行う
+        if pl_112_120_done and rows_pl is not None and 121 not in row_dict:
+            rows_pl, applied = _validated("121_154", "pl_121_154", rows_pl, _apply_pl)
+            row_dict.update(applied)
+            yield _section_event("121_154", rows_pl, [row_dict[112]])
+
+    if parallel:
+        with ThreadPoolExecutor(max_workers=len(sections), thread_name_prefix="cloab001") as ex:
+            futures = {ex.submit(_timed, fn, source, client): name for name, fn in sections.items()}
+            for fut in as_completed(futures):
+                name = futures[fut]
+                result, timings[name] = fut.result()
+                yield from _on_done(name, result)
+    else:
+        for name, fn in sections.items():
+            result, timings[name] = _timed(fn, source, client)
+            yield from _on_done(name, result)
+    timings["llm"] = int((time.perf_counter() - t0) * 1000)
+
+    t1 = time.perf_counter()
+    row_dict.update(rows_81_111)
+    rows = merge_rows(rows_1_78, row_dict)
+    timings["postprocess"] = int((time.perf_counter() - t1) * 1000)
+    timings["total"] = int((time.perf_counter() - t0) * 1000)
+
+    logger.info("cloab001 timings(ms): %s", timings)
+    yield {"section": "all", "rows": rows, "timings": timings, "validation": validation.summarize(findings, retried)}
+
+
+def run_cloab001(
+    source: Dict[str, Any],
+    client: Optional[Any] = None,
+    parallel: Optional[bool] = None,
+    mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    data.json 相当の dict から output.json 相当の行リストを作る。
+    戻り値: {"rows": [...], "timings": {区間名: ミリ秒}, "validation": 検算の要約（validation.summarize）}
+    """
+    for event in iter_cloab001(source, client, parallel, mode):
+        if event["section"] == "all":
+            return {"rows": event["rows"], "timings": event["timings"], "validation": event["validation"]}
+    raise RuntimeError("cloab001 の集計結果が得られませんでした。")
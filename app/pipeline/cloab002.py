@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+cloab002（構成比・前年比増加率・増減額の付与）をプロセス内で実行するための関数。
+originals/cloab002.py の計算ロジックを移植（入出力ファイルは扱わない）。
+金額は行リストから一度だけ RowTable に読み込んで参照する。
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+
+from app.pipeline.row_table import RowTable
+
+PERIOD_KEYS = ["前々期", "前期", "今期"]
+
+
+def _base_periods(table: RowTable, row_no: int) -> Dict[str, Any]:
+    return dict(zip(PERIOD_KEYS, table.get(row_no)))
+
+
+def _ratio(val, base) -> float:
+    if base != 0 and val is not None:
+        return round((val / base) * 100, 2)
+    return 0.00
+
+
+def _growth(cur, prev) -> float:
+    if prev is not None and prev != 0:
+        return round(((cur / prev) - 1) * 100, 1)
+    # 基準期が 0 または None の場合は仮の大きな値
+    if cur is not None and cur > 0:
+        return 1000.0
+    if cur is not None and cur < 0:
+        return -1000.0
+    return 0.0
+
+
+def calculate_ratios_and_changes(
+    data, asset_periods, liability_equity_periods, sales_revenue_periods, table: Optional[RowTable] = None
+):
+    """
+    各行に対して、構成比、前年比増加率、増減額を計算して追加する。
+    構成比は小数点第2位（0.01%単位）で四捨五入し、
+    増加率は小数点第1位（0.1%単位）で四捨五入する。
+    """
+    if table is None:
+        table = RowTable.from_rows(data)
+    calculated_rows = []
+
+    for row in data:
+        n = row["行番号"]
+        # 製造原価報告書エリア（81-111行）は構成比計算の対象外
+        if 81 <= n <= 111:
+            # 95〜105行に合計値らしき名前が入っていたら、内訳以外は排除
+            if 95 <= n <= 105:
+                if "合計" in row["勘定科目"] or "製造原価" in row["勘定科目"]:
+                    row["勘定科目"] = ""
+                    row["今期"] = 0
+                    row["前期"] = 0
+                    row["前々期"] = 0
+            calculated_rows.append(row)
+            continue
+
+        base_periods = None
+        if 1 <= n <= 45:
+            base_periods = asset_periods
+        elif 46 <= n <= 78:
+            base_periods = liability_equity_periods
+        elif 112 <= n <= 154:
+            base_periods = sales_revenue_periods
+
+        two_ago, previous, current = table.get(n)
+
+        # 1. 構成比（資産合計(45), 純資産・負債合計(75) は 100%）
+        if base_periods:
+            is_100_percent_row = (n == 45 or n == 75)
+            for pk, val in (("前々期", two_ago), ("前期", previous), ("今期", current)):
+                row[f"{pk}構成比"] = 100.00 if is_100_percent_row else _ratio(val, base_periods[pk])
+
+        # 2. 増減額
+        row["前期増減額"] = previous - two_ago
+        row["今期増減額"] = current - previous
+
+        # 3. 前年比増加率（小数点第1位で四捨五入）
+        row["前期前年比増加率"] = _growth(previous, two_ago)
+        row["今期前年比増加率"] = _growth(current, previous)
+
+        calculated_rows.append(row)
+
+    return calculated_rows
+
+
+def run_cloab002(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """output.json 相当の行リストに構成比・増減を付与し、行番号順に返す。"""
+    table = RowTable.from_rows(rows)
+    calculated_rows = calculate_ratios_and_changes(
+        rows,
+        _base_periods(table, 45),   # 資産合計
+        _base_periods(table, 75),   # 純資産・負債合計
+        _base_periods(table, 112),  # 売上高
+        table,
+    )
+    data_dict = {row["行番号"]: row for row in calculated_rows}
+    return [data_dict[k] for k in sorted(data_dict.keys())]
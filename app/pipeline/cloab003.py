@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+cloab003（77〜80行・155〜164行の追加項目とセル参照の付与）をプロセス内で実行するための関数。
+originals/cloab003.py の計算部分のみを移植（HTML表示・Colab callback は扱わない）。
+金額の参照は RowTable から行い、追加した行は行 dict と RowTable の両方に書く。
+"""
+from __future__ import annotations
+import math
+from typing import Any, Dict, List
+
+from app.pipeline import formulas
+from app.pipeline.cloab002 import _ratio
+from app.pipeline.row_table import RowTable
+
+PERIOD_KEYS = ["前々期", "前期", "今期"]
+
+SHEET_NAME = "財務諸表（入力）"
+
+# 行番号 → Excel行番号（連続していない箇所 76→77, 111→112 などを含む）
+ROW_MAPPING = {
+    1: 6, 2: 7, 3: 8, 4: 9, 5: 10, 6: 11, 7: 12, 8: 13, 9: 14, 10: 15,
+    11: 16, 12: 17, 13: 18, 14: 19, 15: 20, 16: 21, 17: 22, 18: 23, 19: 24, 20: 25,
+    21: 26, 22: 27, 23: 28, 24: 29, 25: 30, 26: 31, 27: 32, 28: 33, 29: 34, 30: 35,
+    31: 36, 32: 37, 33: 38, 34: 39, 35: 40, 36: 41, 37: 42, 38: 43, 39: 44, 40: 45,
+    41: 46, 42: 47, 43: 48, 44: 49, 45: 50, 46: 51, 47: 52, 48: 53, 49: 54, 50: 55,
+    51: 56, 52: 57, 53: 58, 54: 59, 55: 60, 56: 61, 57: 62, 58: 63, 59: 64, 60: 65,
+    61: 66, 62: 67, 63: 68, 64: 69, 65: 70, 66: 71, 67: 72, 68: 73, 69: 74, 70: 75,
+    71: 76, 72: 77, 73: 78, 74: 79, 75: 80, 76: 81,
+    77: 83, 78: 84, 79: 87, 80: 88, 81: 93, 82: 94, 83: 95, 84: 96, 85: 97, 86: 98,
+    87: 99, 88: 100, 89: 101, 90: 102, 91: 103, 92: 104, 93: 105, 94: 106, 95: 107, 96: 108,
+    97: 109, 98: 110, 99: 111, 100: 112, 101: 113, 102: 114, 103: 115, 104: 116, 105: 117, 106: 118,
+    107: 119, 108: 120, 109: 121, 110: 122, 111: 123, 112: 129, 113: 130, 114: 131, 115: 132, 116: 133,
+    117: 134, 118: 135, 119: 136, 120: 137, 121: 138, 122: 139, 123: 140, 124: 141, 125: 142, 126: 143,
+    127: 144, 128: 145, 129: 146, 130: 147, 131: 148, 132: 149, 133: 150, 134: 151, 135: 152, 136: 153,
+    137: 154, 138: 155, 139: 156, 140: 157, 141: 158, 142: 159, 143: 160, 144: 161, 145: 162, 146: 163,
+    147: 164, 148: 165, 149: 166, 150: 167, 151: 168, 152: 169, 153: 170, 154: 171, 155: 173, 156: 174,
+    157: 177, 158: 178, 159: 179, 160: 181, 161: 182, 162: 183, 163: 184, 164: 185
+}
+
+# 名称の定義・修正
+ROW_NAMES = {
+    77: "受取手形割引高",
+    78: "受取手形裏書譲渡高",
+    79: "経営資本額",
+    80: "経常運転資金額",
+    118: "期首-期末製品差額(V)",
+    155: "配当金",
+    156: "役員賞与",
+    157: "常用従業員数（ﾊﾟｰﾄも換算）①",
+    158: "行金役員数②",
+    159: "①＋②",
+    160: "加工高",
+    161: "減価償却費合計",
+    162: "キャッシュフロー（当期利益＋減価償却費－配当金－役員賞与）",
+    163: "借入金合計",
+    164: "人件費合計",
+}
+
+# 手入力項目
+INPUT_ROWS = [77, 78, 155, 156, 157, 158]
+
+
+def add_precise_cell_references_to_data(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """行番号→Excel行番号のマッピングから「シート名」「セル」を付与する。"""
+    for entry in data:
+        row_num = entry.get("行番号")
+        if row_num in ROW_MAPPING:
+            entry["シート名"] = SHEET_NAME
+            entry["セル"] = f"{ROW_MAPPING[row_num]}"
+    return data
+
+
+class _DerivedCalculator:
+    """originals/cloab003.py の data_dict 操作をインスタンス単位で行う。"""
+
+    def __init__(self, data_dict: Dict[int, Dict[str, Any]]):
+        self.data_dict = data_dict
+        self.table = RowTable.from_rows(data_dict.values())
+
+    def get_num(self, row_no, col) -> float:
+        return float(self.table.value(row_no, col))
+
+    def set_row_data(self, row_no, name, vals) -> None:
+        data_dict = self.data_dict
+        if row_no not in data_dict:
+            data_dict[row_no] = {"行番号": row_no, "勘定科目": name}
+        data_dict[row_no]["勘定科目"] = name
+
+        # 既存の「集計方法」を保持し、無ければ補完する
+        if "集計方法" not in data_dict[row_no] or data_dict[row_no].get("集計方法") in (None, "", '""', '\"\"'):
+            data_dict[row_no]["集計方法"] = "自動計算"
+
+        for pk in PERIOD_KEYS:
+            data_dict[row_no][pk] = int(round(vals.get(pk, 0)))
+        self.table.set(row_no, [data_dict[row_no][pk] for pk in PERIOD_KEYS])
+
+        vv, vp, vc = [float(data_dict[row_no][k]) for k in PERIOD_KEYS]
+        data_dict[row_no]["前期増減額"] = int(vp - vv)
+        data_dict[row_no]["今期増減額"] = int(vc - vp)
+        data_dict[row_no]["前期前年比増加率"] = int(round((vp / vv - 1) * 100)) if vv else 0
+        data_dict[row_no]["今期前年比増加率"] = int(round((vc / vp - 1) * 100)) if vp else 0
+
+        for k in ["前々期構成比", "前期構成比", "今期構成比"]:
+            if k not in data_dict[row_no]:
+                data_dict[row_no][k] = 0
+
+
+def run_cloab003(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    output.json 相当の行リストに 77〜80・155〜164 行を追加し、
+    output_updated.json 相当（シート名・セル付き）の行リストを返す。
+    """
+    data_dict = {item["行番号"]: item for item in rows}
+    calc = _DerivedCalculator(data_dict)
+
+    for k, v in ROW_NAMES.items():
+        if k in data_dict:
+            data_dict[k]["勘定科目"] = v
+
+    # 77-78行目：入力項目（前々期/前期/今期は手入力）
+    for rn in [77, 78]:
+        name = ROW_NAMES.get(rn, f"項目{rn}")
+        if rn not in data_dict:
+            data_dict[rn] = {"行番号": rn, "勘定科目": name}
+            for pk in PERIOD_KEYS:
+                data_dict[rn][pk] = 0
+        data_dict[rn]["勘定科目"] = name
+        data_dict[rn]["集計方法"] = "入力"
+        calc.set_row_data(rn, name, {pk: calc.get_num(rn, pk) for pk in PERIOD_KEYS})
+        data_dict[rn]["集計方法"] = "入力"
+
+    # 155-158行目：入力項目（手入力の値をそのまま使う）
+    for rn in [155, 156, 157, 158]:
+        calc.set_row_data(rn, ROW_NAMES[rn], {pk: calc.get_num(rn, pk) for pk in PERIOD_KEYS})
+
+    # 79-80・159-164行目：集計項目（79 経営資本額 / 80 経常運転資金額 / 160 加工高 / 161 減価償却費合計 /
+    # 162 キャッシュフロー / 163 借入金合計（Excel式準拠：48 + 57 + 58 + 77）/ 164 人件費合計。式は formulas.DERIVED_FORMULAS）
+    derived = formulas.evaluate(calc.table, formulas.DERIVED_FORMULAS, create=True)
+    for rn in [79, 80] + list(range(159, 165)):
+        vals, _method = derived[rn]
+        calc.set_row_data(rn, ROW_NAMES[rn], dict(zip(PERIOD_KEYS, vals)))
+
+    for rn in [155, 156, 157, 158]:
+        data_dict[rn]["集計方法"] = "入力"
+    data_dict[159]["集計方法"] = "自動計算(JS)"
+
+    json_output = sorted(data_dict.values(), key=lambda x: x.get("行番号", 0))
+    return add_precise_cell_references_to_data(json_output)
+
+
+def _input_value(rn: int, pk: str, v: Any) -> float:
+    """手入力の金額（数値または数値の文字列）。null・真偽値・数値でない文字列・NaN/無限大は ValueError。"""
+    if v is None or isinstance(v, bool):
+        raise ValueError(f"行{rn} の{pk} は数値で指定してください: {v!r}")
+    try:
+        x = float(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"行{rn} の{pk} は数値で指定してください: {v!r}") from None
+    if not math.isfinite(x):
+        raise ValueError(f"行{rn} の{pk} は有限の数値で指定してください: {v!r}")
+    return x
+
+
+def update_inputs(rows: List[Dict[str, Any]], inputs: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    run_cloab003 の結果（rows）の手入力行（INPUT_ROWS）を inputs {行番号: {期: 金額}} で書き換え、
+    その行を参照している集計項目（DERIVED_FORMULAS の依存関係で決まる行）だけを計算し直す。
+    rows を直接更新し、変更した行（入力行＋再計算した行、行番号順）を返す。
+    """
+    bad = [n for n in inputs if n not in INPUT_ROWS]
+    if bad:
+        raise ValueError(f"手入力の行ではありません: {bad}（{INPUT_ROWS} のみ変更できます）")
+    # 行を書き換える前にすべての値を検証する（途中でエラーになっても rows は変更しない）
+    values = {
+        rn: {pk: _input_value(rn, pk, v) for pk, v in vals.items() if pk in PERIOD_KEYS}
+        for rn, vals in inputs.items()
+    }
+    data_dict = {item["行番号"]: item for item in rows}
+    calc = _DerivedCalculator(data_dict)
+
+    for rn, vals in values.items():
+        calc.set_row_data(rn, ROW_NAMES[rn], {pk: vals.get(pk, float(calc.get_num(rn, pk))) for pk in PERIOD_KEYS})
+        data_dict[rn]["集計方法"] = "入力"
+        if rn in (77, 78) and "今期構成比" in data_dict[rn]:
+            # 1〜78 行は純資産・負債合計（75）に対する構成比を持つ（cloab002 と同じ計算）
+            for pk in PERIOD_KEYS:
+                data_dict[rn][f"{pk}構成比"] = _ratio(calc.get_num(rn, pk), calc.get_num(75, pk))
+
+    targets = formulas.dependents(formulas.DERIVED_FORMULAS, inputs)
+    derived = formulas.evaluate(calc.table, {rn: formulas.DERIVED_FORMULAS[rn] for rn in targets}, create=True)
+    for rn in targets:
+        vals, _method = derived[rn]
+        is_new = rn not in data_dict
+        calc.set_row_data(rn, ROW_NAMES[rn], dict(zip(PERIOD_KEYS, vals)))
+        if is_new:
+            rows.append(data_dict[rn])
+            add_precise_cell_references_to_data([data_dict[rn]])
+    rows.sort(key=lambda x: x.get("行番号", 0))
+    return [data_dict[rn] for rn in sorted(set(inputs) | set(targets))]
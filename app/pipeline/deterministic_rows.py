@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Python 側で確定する行（LLM に出力させない行）のレジストリ
+
+cloab001 の後処理で、LLM の出力値に依存せず必ず上書きされる行をここに登録する。
+プロンプト生成はこの表を参照して対象行を仕様・出力行数から外し、
+後処理の前に勘定科目・区分だけを持つ空行（placeholder）を補ってから、従来どおり Python で値を確定する。
+  - 81〜111 行（製造原価）はもともと LLM に出力させておらず、build_rows_81_111 で確定する
+  - when がある行は、その条件を満たす入力の場合のみ Python で確定する（満たさなければ LLM に出力させる）
+
+登録する行は、後処理で「値と集計方法の両方」が上書きされ、かつ上書き前の LLM 値を他の行の計算に使わないこと。
+例：行143 は「営業外収益」が PL に無い場合、行145 の自動計算（141〜144 の合計）に LLM 値が使われるため条件付き。
+"""
+from __future__ import annotations
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from app.pipeline.source_index import get_index
+from app.pipeline.utils import find_pl_sales_total
+
+# "0" で従来どおり全行を LLM に出力させる
+DETERMINISTIC_ROWS_ENABLED = os.environ.get("CASHAI_SKIP_DETERMINISTIC_ROWS", "1") != "0"
+
+
+def _has_pl_account(*names: str) -> Callable[[Dict[str, Any]], bool]:
+    def _pred(source: Dict[str, Any]) -> bool:
+        idx = get_index(source)
+        return any(idx.by_name("PL", name) for name in names)
+    return _pred
+
+
+def _has_pl_sales_total(source: Dict[str, Any]) -> bool:
+    return find_pl_sales_total(source) is not None
+
+
+def _row(section: str, label: str, kubun: str = "", when: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Dict[str, Any]:
+    return {"section": section, "勘定科目": label, "区分": kubun, "when": when}
+
+
+# 行番号 -> {"section", "勘定科目", "区分", "when"}（確定処理は cloab001 側）
+DETERMINISTIC_ROWS: Dict[int, Dict[str, Any]] = {
+    # formulas.BS_RECALC_FORMULAS：当座資産合計（記載値 or 1+3+4+5）
+    6: _row("1_78", "当座資産の合計"),
+    # formulas.BS_RECALC_FORMULAS：投資等小計（34+35+36+37+38+39+41-40）
+    42: _row("1_78", "投資等小計"),
+    # _override_row112_from_pl：PL の売上高合計がある場合のみ
+    112: _row("112_120", "売上高", when=_has_pl_sales_total),
+    # finalize_rows_112_120（118〜120 は formulas.PL_112_120_FORMULAS）
+    114: _row("112_120", "商品仕入高"),
+    116: _row("112_120", "他勘定振替高"),
+    118: _row("112_120", "期首-期末製品差額(V)", "V"),
+    119: _row("112_120", "売上原価"),
+    120: _row("112_120", "売上総利益"),
+    # finalize_rows_121_154（139〜152 の合計・差引行は formulas.PL_121_154_RECALC_FORMULAS）
+    125: _row("121_154", "減価償却費", "F"),
+    138: _row("121_154", "その他雑費", "F"),
+    139: _row("121_154", "販売費及び一般管理費", "F"),
+    140: _row("121_154", "営業利益"),
+    143: _row("121_154", "賃貸料収入", when=_has_pl_account("営業外収益")),
+    145: _row("121_154", "営業外収入合計"),
+    147: _row("121_154", "営業外支出その他"),
+    148: _row("121_154", "営業外支出合計"),
+    149: _row("121_154", "経常利益"),
+    152: _row("121_154", "税引前当期利益"),
+    153: _row("121_154", "法人税等充当額"),
+}
+
+SECTION_ROWS: Dict[str, range] = {
+    "1_78": range(1, 79),
+    "112_120": range(112, 121),
+    "121_154": range(121, 155),
+}
+
+
+def skipped_rows(section: str, source: Dict[str, Any]) -> List[int]:
+    """section のうち、この入力では Python 側で確定する（LLM に出力させない）行番号。"""
+    if not DETERMINISTIC_ROWS_ENABLED:
+        return []
+    out = []
+    for n in SECTION_ROWS[section]:
+        entry = DETERMINISTIC_ROWS.get(n)
+        if entry is None or entry["section"] != section:
+            continue
+        if entry["when"] is None or entry["when"](source):
+            out.append(n)
+    return out
+
+
+def llm_rows(section: str, source: Dict[str, Any]) -> List[int]:
+    """section のうち LLM に出力させる行番号（行番号順）。"""
+    skip = set(skipped_rows(section, source))
+    return [n for n in SECTION_ROWS[section] if n not in skip]
+
+
+def placeholder(line_no: int) -> Dict[str, Any]:
+    """Python 側で値を確定する前の空行（勘定科目・区分のみ）。"""
+    entry = DETERMINISTIC_ROWS[line_no]
+    return {
+        "行番号": line_no,
+        "勘定科目": entry["勘定科目"],
+        "今期": 0,
+        "前期": 0,
+        "前々期": 0,
+        "区分": entry["区分"],
+        "集計方法": "",
+    }
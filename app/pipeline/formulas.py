@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+合計・小計・差引行の計算式の表
+
+cloab001 / cloab003 で行ごとに書いていた「N = A + B − C」「元データに記載があればそれを採用」を表にまとめ、
+依存関係の順（トポロジカル順）に1行1回だけ、3期まとめて計算する。
+  - terms   : [(行番号, 符号)]。行が無い場合は 0 として扱う
+  - prefer  : 元データ（source[key]）に names の科目があれば、計算せずにその金額を採用する（最初に見つかった科目）。
+              科目名で引けない行は find(source) -> ((前々期, 前期, 今期), method) または None で探す
+  - fn      : 式で書けない行（区分 V の合計・科目名で拾う行など）の計算関数 fn(table) -> (前々期, 前期, 今期)。deps に参照行を書く
+  - method  : 計算した場合の集計方法（prefer で採用した場合は prefer の method）
+  - check   : 集計後の検算（validation）で「行の値 = check の合計」を調べる行は [(行番号, 符号)]（通常は terms と同じ）。
+              検算しない行は None
+表に無い行（LLM・ルール・元データの抽出で決まる行）は入力として扱い、表の行より前に確定させておくこと。
+"""
+from __future__ import annotations
+from graphlib import TopologicalSorter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.pipeline.row_table import RowTable
+from app.pipeline.seizo_patterns import seizo_sums
+from app.pipeline.source_index import get_index
+
+Terms = Sequence[Tuple[int, int]]
+
+
+def _plus(*line_nos: int) -> List[Tuple[int, int]]:
+    return [(n, 1) for n in line_nos]
+
+
+def _minus(*line_nos: int) -> List[Tuple[int, int]]:
+    return [(n, -1) for n in line_nos]
+
+
+def _rng(lo: int, hi: int) -> List[Tuple[int, int]]:
+    """lo〜hi 行（両端を含む）の合計。"""
+    return _plus(*range(lo, hi + 1))
+
+
+def _prefer(key: str, names: Sequence[str], method: str, bunrui: Optional[str] = None) -> Dict[str, Any]:
+    return {"key": key, "names": tuple(names), "bunrui": bunrui, "method": method, "find": None}
+
+
+def _prefer_found(find: Callable[[Dict[str, Any]], Optional[Tuple[List[int], str]]]) -> Dict[str, Any]:
+    return {"find": find}
+
+
+def _prefer_last(key: str, norms: Sequence[str], method: str) -> Dict[str, Any]:
+    """表記ゆれを除いた科目名が norms の合計行のうち最後に出現したものを採用する（method の {} は採用した科目名）。"""
+
+    def find(source: Dict[str, Any]) -> Optional[Tuple[List[int], str]]:
+        rec = get_index(source).last(key, norms)
+        if rec is None:
+            return None
+        now_val, prev_val, prev2_val = rec.vals
+        return [prev2_val, prev_val, now_val], method.format(rec.name)
+
+    return _prefer_found(find)
+
+
+def _formula(
+    terms: Terms = (),
+    method: str = "自動計算",
+    prefer: Optional[Dict[str, Any]] = None,
+    fn: Optional[Callable[[RowTable], Sequence[int]]] = None,
+    deps: Iterable[int] = (),
+    check: Union[bool, Terms] = False,
+) -> Dict[str, Any]:
+    """check=True は terms で検算する（terms と異なる恒等式で検算する行は check に式を渡す）。"""
+    return {
+        "terms": list(terms),
+        "method": method,
+        "prefer": prefer,
+        "fn": fn,
+        "deps": sorted({n for n, _ in terms} | set(deps)),
+        "check": list(terms) if check is True else (list(check) if check else None),
+    }
+
+
+_PL_VALUE = "PL記載値を採用"
+
+
+# data.json に合計行があればそのまま転記する行（正規化後の科目名）
+BS_TOTAL_NAMES: Dict[int, Sequence[str]] = {
+    11: ["棚卸資産", "棚卸資産合計", "棚卸資産計", "棚卸資産小計"],
+    23: ["流動資産", "流動資産合計", "流動資産計", "流動資産の部合計"],
+    32: ["有形固定資産", "有形固定資産合計", "有形固定資産計"],
+    33: ["無形固定資産", "無形固定資産合計", "無形固定資産計"],
+    43: ["繰延資産", "繰延資産合計"],
+    44: ["固定資産", "固定資産合計", "固定資産計", "固定資産の部合計"],
+    45: ["資産合計", "資産の部合計", "資産計", "総資産"],
+    56: ["流動負債", "流動負債合計", "流動負債計", "流動負債の部合計"],
+    64: ["固定負債", "固定負債合計", "固定負債計", "固定負債の部合計"],
+    65: ["負債合計", "負債の部合計", "負債計"],
+    67: ["資本剰余金", "資本剰余金合計"],
+    68: ["利益剰余金", "利益剰余金合計"],
+    71: ["株主資本", "株主資本合計", "資本等小計"],
+    73: ["評価換算差額等", "評価換算差額等合計"],
+    74: ["純資産", "純資産合計", "純資産の部合計", "純資産計"],
+    75: ["負債純資産合計", "負債及び純資産合計", "負債および純資産合計", "負債純資産の部合計", "負債と純資産の合計"],
+}
+
+
+def _bs_total(line_no: int) -> Dict[str, Any]:
+    return _prefer_last("BS", BS_TOTAL_NAMES[line_no], "data.json記載の{}を採用")
+
+
+# 1〜78 行の合計・小計・差引行
+#   ルール集計（rules.bs_row_map）は全行を計算する（合計行が data.json にあればそれを採用）
+#   LLM の出力は 6 / 42 だけを計算し直し（BS_RECALC_FORMULAS）、他の行は LLM の値のまま check で検算する
+BS_FORMULAS: Dict[int, Dict[str, Any]] = {
+    6: _formula(
+        _plus(1, 3, 4, 5),
+        "Python再計算(行1+3+4+5)",
+        _prefer(
+            "BS",
+            ["当座資産", "当座資産計", "当座資産小計", "当座資産合計", "当座資産の合計"],
+            "data.json記載の当座資産合計を採用",
+        ),
+    ),
+    11: _formula(_rng(7, 10), "ルール計算(7+8+9+10)", _bs_total(11), check=True),
+    22: _formula(_rng(12, 19) + _plus(21) + _minus(20), "ルール計算(12〜19+21-20)", check=True),
+    23: _formula(_plus(6, 11, 22), "ルール計算(6+11+22)", _bs_total(23), check=True),
+    32: _formula(_rng(24, 31), "ルール計算(24〜31)", _bs_total(32), check=True),
+    42: _formula(_plus(34, 35, 36, 37, 38, 39, 41) + _minus(40), "Python側で再計算(34+35+36+37+38+39+41-40)"),
+    44: _formula(_plus(32, 33, 42), "ルール計算(32+33+42)", _bs_total(44), check=True),
+    45: _formula(_plus(23, 44, 43), "ルール計算(23+44+43)", _bs_total(45), check=True),
+    56: _formula(_rng(46, 55), "ルール計算(46〜55)", _bs_total(56), check=True),
+    64: _formula(_rng(57, 63), "ルール計算(57〜63)", _bs_total(64), check=True),
+    65: _formula(_plus(56, 64), "ルール計算(56+64)", _bs_total(65), check=True),
+    # 69 / 70 は 68 の内訳（うち〜）のため、LLM の値は検算しない
+    68: _formula(_plus(69, 70), "ルール計算(69+70)", _bs_total(68)),
+    71: _formula(_plus(66, 67, 68), "ルール計算(66+67+68)", _bs_total(71), check=True),
+    74: _formula(_plus(71, 73) + _minus(72), "ルール計算(71-72+73)", _bs_total(74), check=True),
+    75: _formula(_plus(65, 74), "ルール計算(65+74)", _bs_total(75), check=True),
+    76: _formula(_plus(45) + _minus(75), "ルール計算(45-75)", check=True),
+}
+
+# rows_1_78_from_row_map の補正（全モード共通。行37 の重複排除の後に計算する）
+BS_RECALC_FORMULAS: Dict[int, Dict[str, Any]] = {n: BS_FORMULAS[n] for n in (6, 42)}
+
+def _seizo_direct_84(source: Dict[str, Any]) -> Optional[Tuple[List[int], str]]:
+    # 製造原価に当期材料費の記載（合計・小計を除く）があり金額が 0 でなければ採用する
+    vals, matched = seizo_sums(source)[84]
+    if not matched or vals == [0, 0, 0]:
+        return None
+    return [vals[2], vals[1], vals[0]], "製造原価より: " + "、".join(matched)
+
+
+# 81〜111 行（製造原価。build_rows_81_111 で元データから抽出した後に計算する）
+SEIZO_FORMULAS: Dict[int, Dict[str, Any]] = {
+    84: _formula(_plus(81, 82) + _minus(83), "製造原価のみで計算（81+82-83）", _prefer_found(_seizo_direct_84)),
+    89: _formula(_plus(85, 86, 87, 88), "製造原価のみで計算（85+86+87+88）"),
+    105: _formula(_rng(90, 104)),
+    107: _formula(_plus(84, 89, 105, 106)),
+    110: _formula(_plus(106) + _minus(108)),
+    111: _formula(_plus(107) + _minus(108, 109)),
+}
+
+# 112〜120 行（finalize_rows_112_120。114 / 116 の再集計の後に計算する）
+PL_112_120_FORMULAS: Dict[int, Dict[str, Any]] = {
+    118: _formula(_plus(113) + _minus(117)),
+    # 119 の自動計算は originals と同じ 113〜118 の合計。検算は仕様の構造（期首＋仕入＋製造原価＋振替−期末）で行う
+    119: _formula(
+        _rng(113, 118),
+        prefer=_prefer("PL", ["売上原価"], _PL_VALUE, bunrui="売上原価"),
+        check=_plus(114, 115, 116, 118),
+    ),
+    120: _formula(
+        _plus(112) + _minus(119), "自動計算（売上高−売上原価）", _prefer("PL", ["売上総利益"], _PL_VALUE), check=True
+    ),
+}
+
+# 121〜154 行（finalize_rows_121_154。125 / 138 の再集計の後、143 / 153 の上書きの前に計算する）
+#   145 は上書き前の 143（LLM の値）で計算する（originals と同じ）
+#   148 の自動計算は 146 のみ（147 は 148 確定後の差額で決まるため、originals では 0 を仮置きしてから合計していた）
+#   154 は LLM の値を残して検算し、ルール集計だけが 153 の確定後に計算する（rules.finish_rows_121_154）
+PL_121_154_FORMULAS: Dict[int, Dict[str, Any]] = {
+    139: _formula(
+        _rng(121, 138), "自動計算（121〜138合計）", _prefer("PL", ["販売費及び一般管理費"], _PL_VALUE), check=True
+    ),
+    140: _formula(_plus(120) + _minus(139), prefer=_prefer("PL", ["営業利益"], _PL_VALUE), check=True),
+    145: _formula(_rng(141, 144), prefer=_prefer("PL", ["営業外収益"], _PL_VALUE), check=True),
+    148: _formula(_plus(146), prefer=_prefer("PL", ["営業外費用"], _PL_VALUE), check=_plus(146, 147)),
+    147: _formula(_plus(148) + _minus(146), "148行目 - 146行目"),
+    149: _formula(_plus(140, 145) + _minus(148), prefer=_prefer("PL", ["経常利益"], _PL_VALUE), check=True),
+    152: _formula(_plus(149, 150) + _minus(151), prefer=_prefer("PL", ["税引前当期純利益"], _PL_VALUE), check=True),
+    154: _formula(
+        _plus(152) + _minus(153),
+        "ルール計算(152-153)",
+        _prefer_last("PL", ["当期純利益", "当期利益", "当期純損失", "当期純利益金額"], "PL記載の{}を採用"),
+        check=True,
+    ),
+}
+
+# finalize_rows_121_154 の補正（全モード共通）
+PL_121_154_RECALC_FORMULAS: Dict[int, Dict[str, Any]] = {n: f for n, f in PL_121_154_FORMULAS.items() if n != 154}
+
+
+# 77〜80・155〜164 行（cloab003。77 / 78 / 155〜158 の入力行の後に計算する）
+
+def _sum_v(table: RowTable, lo: int, hi: int, j: int) -> int:
+    # 区分 V の行の合計（89行目 当期労務費 合計は SUMIF 対象から除外）
+    return sum(
+        table.amounts[r * 3 + j]
+        for r in range(lo, hi + 1)
+        if r != 89 and table.kubun[r].strip().upper() in ("V", "Ｖ")
+    )
+
+
+def _kakou(table: RowTable) -> List[int]:
+    # 160 加工高 = 112 − 114 − (84 + ΣV(85〜104) + 110 + 118 + ΣV(121〜138) − 109)
+    out = []
+    for j in range(3):
+        v = lambda n: table.amounts[n * 3 + j]  # noqa: E731
+        out.append(v(112) - v(114) - (v(84) + _sum_v(table, 85, 104, j) + v(110) + v(118) + _sum_v(table, 121, 138, j) - v(109)))
+    return out
+
+
+def _depreciation(table: RowTable) -> List[int]:
+    # 161 減価償却費合計 = 製造経費・販管費のうち科目名に「減価償却」を含む行の合計
+    rows = [r for r in list(range(85, 105)) + list(range(121, 139)) if "減価償却" in table.labels[r]]
+    return [sum(table.amounts[r * 3 + j] for r in rows) for j in range(3)]
+
+
+DERIVED_FORMULAS: Dict[int, Dict[str, Any]] = {
+    79: _formula(_plus(45) + _minus(30, 34)),
+    80: _formula(_plus(4, 3, 11, 77, 78) + _minus(46, 47, 78)),
+    159: _formula(_plus(157, 158)),
+    160: _formula(fn=_kakou, deps=[112, 114, 84, 110, 118, 109] + list(range(85, 105)) + list(range(121, 139))),
+    161: _formula(fn=_depreciation, deps=list(range(85, 105)) + list(range(121, 139))),
+    162: _formula(_plus(154, 161) + _minus(155, 156)),
+    163: _formula(_plus(48, 57, 58, 77)),
+    164: _formula(_plus(89, 121, 122, 123, 124)),
+}
+
+
+# ============================================================
+# 評価
+# ============================================================
+
+def _preferred(source: Dict[str, Any], prefer: Dict[str, Any]) -> Optional[Tuple[List[int], str]]:
+    """prefer の科目が元データにあれば ((前々期, 前期, 今期), 集計方法)。"""
+    if prefer["find"] is not None:
+        return prefer["find"](source)
+    rec = get_index(source).first(prefer["key"], prefer["names"], prefer["bunrui"])
+    if rec is None:
+        return None
+    now_val, prev_val, prev2_val = rec.vals
+    return [prev2_val, prev_val, now_val], prefer["method"]
+
+
+def evaluate(
+    table: RowTable,
+    formulas: Dict[int, Dict[str, Any]],
+    source: Optional[Dict[str, Any]] = None,
+    create: bool = False,
+) -> Dict[int, Tuple[List[int], str]]:
+    """
+    formulas の行を依存順に計算して table を更新し、{行番号: ((前々期, 前期, 今期), 集計方法)} を返す。
+    create=False では table に無い行は計算結果を書かない（後続の行からは 0 に見える。cloab001 の set_vals と同じ）。
+    """
+    order = TopologicalSorter({n: f["deps"] for n, f in formulas.items()}).static_order()
+    amounts = table.amounts
+    results: Dict[int, Tuple[List[int], str]] = {}
+    for n in order:
+        f = formulas.get(n)
+        if f is None:
+            continue
+        vals = None
+        method = f["method"]
+        if f["prefer"] is not None and source is not None:
+            found = _preferred(source, f["prefer"])
+            if found is not None:
+                vals, method = found
+        if vals is None:
+            if f["fn"] is not None:
+                vals = list(f["fn"](table))
+            else:
+                vals = [sum(sign * amounts[m * 3 + j] for m, sign in f["terms"]) for j in range(3)]
+        if create or table.has(n):
+            table.set(n, vals)
+            results[n] = (vals, method)
+    return results
+
+
+def dependents(formulas: Dict[int, Dict[str, Any]], changed: Iterable[int]) -> List[int]:
+    """changed の行を（直接・間接に）参照している formulas の行番号（行番号順）。"""
+    found = set()
+    frontier = set(changed)
+    while frontier:
+        nxt = {n for n, f in formulas.items() if n not in found and frontier.intersection(f["deps"])}
+        found |= nxt
+        frontier = nxt
+    return sorted(found)
+
+
+def apply_to_row_map(
+    row_map: Dict[Any, Dict[str, Any]], formulas: Dict[int, Dict[str, Any]], source: Optional[Dict[str, Any]] = None
+) -> None:
+    """行番号 -> 行 dict の表に formulas を適用する（金額と集計方法を書き換える。無い行は作らない）。"""
+    table = RowTable.from_row_map(row_map)
+    for n, (vals, method) in evaluate(table, formulas, source).items():
+        row = row_map[n]
+        row["前々期"], row["前期"], row["今期"] = vals
+        row["集計方法"] = method
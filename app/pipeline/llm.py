@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Anthropic クライアント（プロセス内で1つを共有し、接続を再利用する）
+"""
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from app.pipeline.llm_cache import LLM_CACHE_ENABLED, llm_response_cache, make_key
+
+logger = logging.getLogger(__name__)
+
+MODEL = os.environ.get("CASHAI_MODEL", "claude-sonnet-4-20250514")
+# 区間ごとに最初に使うモデル（既定は小さく速いモデル）。出力が不正・検算不一致なら MODEL でやり直す
+# CASHAI_MODEL_FAST="" で全区間 MODEL のみ（従来どおり）
+MODEL_FAST = os.environ.get("CASHAI_MODEL_FAST", "claude-haiku-4-5-20251001") or MODEL
+SECTION_MODELS: Dict[str, str] = {
+    section: os.environ.get(f"CASHAI_MODEL_{section.upper()}", MODEL_FAST) or MODEL
+    for section in ("bs_1_78", "pl_112_120", "pl_121_154", "classify")
+}
+# 行の受け取り方：text（「｜」区切りのテキスト）/ tool（ツール呼び出しの JSON。金額は整数型）
+LLM_OUTPUT_FORMAT = os.environ.get("CASHAI_LLM_OUTPUT", "text")
+# 既定は省略形の出力（金額がすべて 0 の行は出力させず、集計方法は採用科目名の列挙のみ）。
+# "1" で従来どおり全行・集計方法の文章を出力させる（デバッグ用）
+LLM_VERBOSE_OUTPUT = os.environ.get("CASHAI_LLM_VERBOSE", "0") == "1"
+# Anthropic のプロンプトキャッシュ（system・仕様文などの固定部分に cache_control を付ける）
+PROMPT_CACHE_ENABLED = os.environ.get("CASHAI_PROMPT_CACHE", "1") != "0"
+
+_usage_lock = threading.Lock()
+_usage_totals = {
+    "calls": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cache_read_input_tokens": 0,
+    "cache_creation_input_tokens": 0,
+}
+
+_usage_by_model: Dict[str, int] = {}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> Any:
+    """共有クライアントを返す（初回のみ生成）。"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import anthropic
+
+                api_key = os.environ.get("ANTHROPIC_API_KEY")
+                if not api_key:
+                    raise RuntimeError("環境変数 'ANTHROPIC_API_KEY' が設定されていません。")
+                _client = anthropic.Anthropic(api_key=api_key)
+    return _client
+
+
+def _text_block(text: str, cache: bool) -> Dict[str, Any]:
+    block: Dict[str, Any] = {"type": "text", "text": text}
+    if cache:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def section_model(section: str) -> str:
+    """区間（bs_1_78 / pl_112_120 / pl_121_154 / classify）で最初に使うモデル。"""
+    return SECTION_MODELS.get(section, MODEL)
+
+
+def _record_usage(response: Any, model: str) -> None:
+    """response.usage をログに出し、累計に加算する（プロンプトキャッシュのヒット確認用）。"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    counts = {k: int(getattr(usage, k, 0) or 0) for k in _usage_totals if k != "calls"}
+    logger.info(
+        "LLM usage: input=%d output=%d cache_read=%d cache_creation=%d",
+        counts["input_tokens"],
+        counts["output_tokens"],
+        counts["cache_read_input_tokens"],
+        counts["cache_creation_input_tokens"],
+    )
+    with _usage_lock:
+        _usage_totals["calls"] += 1
+        _usage_by_model[model] = _usage_by_model.get(model, 0) + 1
+        for k, v in counts.items():
+            _usage_totals[k] += v
+
+
+def usage_stats() -> Dict[str, Any]:
+    """累計トークン使用量と、プロンプトキャッシュの読み出し率。"""
+    with _usage_lock:
+        totals: Dict[str, Any] = dict(_usage_totals)
+        totals["calls_by_model"] = dict(_usage_by_model)
+    prompt_tokens = totals["input_tokens"] + totals["cache_read_input_tokens"] + totals["cache_creation_input_tokens"]
+    totals["cache_read_ratio"] = round(totals["cache_read_input_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+    return totals
+
+
+def _request_params(system: str, parts: List[str]) -> Tuple[Any, Any]:
+    """
+    system / 最初の user メッセージを組み立てる（固定部分には cache_control を付ける）。
+    parts[0] が固定部分（仕様＋指示）で、以降は案件ごとの可変部分（元データJSON・検算結果の追加指示など）。
+    """
+    if PROMPT_CACHE_ENABLED and len(parts) > 1:
+        system_param: Any = [_text_block(system, cache=True)]
+        user_content: Any = [_text_block(p, cache=(i == 0)) for i, p in enumerate(parts)]
+    else:
+        system_param = system
+        user_content = "".join(parts)
+    return system_param, user_content
+
+
+def _send(client: Any, model: str, system_param: Any, messages: List[Dict[str, Any]], max_tokens: int) -> str:
+    response = client.messages.create(
+        model=model,
+        system=system_param,
+        messages=messages,
+        temperature=0.0,
+        max_tokens=max_tokens,
+    )
+    _record_usage(response, model)
+
+    raw_text = ""
+    for item in response.content:
+        if item.type == "text":
+            raw_text += item.text
+    return raw_text
+
+
+class StreamAborted(Exception):
+    """ストリーミング中に出力の不正を検知し、生成を打ち切るときに on_line から送出する。"""
+
+
+def _cache_key(
+    model: str,
+    system: str,
+    parts: List[str],
+    max_tokens: int,
+    use_cache: Optional[bool],
+    tool: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    if use_cache is None:
+        use_cache = LLM_CACHE_ENABLED
+    if not use_cache:
+        return None
+    if tool is None:
+        return make_key(model, system, "".join(parts), max_tokens)
+    return make_key(model, system, "".join(parts), max_tokens, tool)
+
+
+def _cache_lookup(key: Optional[str], validate: Optional[Callable[[str], Any]]) -> Optional[str]:
+    if key is None:
+        return None
+    cached = llm_response_cache.get(key)
+    if cached is None:
+        return None
+    try:
+        if validate is not None:
+            validate(cached)
+    except Exception:
+        llm_response_cache.delete(key)
+        return None
+    logger.info("LLM cache hit: %s", key[:12])
+    return cached
+
+
+def _cache_store(key: Optional[str], raw_text: str, validate: Optional[Callable[[str], Any]]) -> None:
+    if key is None or not raw_text.strip():
+        return
+    if validate is not None:
+        try:
+            validate(raw_text)
+        except Exception:
+            return
+    llm_response_cache.set(key, raw_text)
+
+
+def create_text(
+    system: str,
+    content: Union[str, Sequence[str]],
+    max_tokens: int,
+    client: Optional[Any] = None,
+    model: str = MODEL,
+    validate: Optional[Callable[[str], Any]] = None,
+    use_cache: Optional[bool] = None,
+) -> str:
+    """
+    messages.create を1回呼び、text ブロックを連結して返す。
+    content を [固定部分, ..., 可変部分] のリストで渡した場合、system と最後の固定部分に cache_control を付け、
+    可変部分（案件ごとの JSON）を末尾に置く。モデルに渡るテキストは "".join(content) と同じ。
+    応答はディスクキャッシュ（llm_cache）に保存し、同じ model・プロンプトの再呼び出しでは LLM を呼ばない。
+    validate を渡した場合、例外を送出した応答はキャッシュに保存しない（キャッシュ上のものは破棄して再取得）。
+    応答自体はそのまま返すので、不完全な出力の扱い（再質問など）は呼び出し側で行う。
+    """
+    parts: List[str] = [content] if isinstance(content, str) else list(content)
+    key = _cache_key(model, system, parts, max_tokens, use_cache)
+    cached = _cache_lookup(key, validate)
+    if cached is not None:
+        return cached
+
+    client = client or get_client()
+    system_param, user_content = _request_params(system, parts)
+    raw_text = _send(client, model, system_param, [{"role": "user", "content": user_content}], max_tokens)
+    _cache_store(key, raw_text, validate)
+    return raw_text
+
+
+def create_tool_json(
+    system: str,
+    content: Union[str, Sequence[str]],
+    tool: Dict[str, Any],
+    max_tokens: int,
+    client: Optional[Any] = None,
+    model: str = MODEL,
+    validate: Optional[Callable[[str], Any]] = None,
+    use_cache: Optional[bool] = None,
+) -> str:
+    """
+    tool を必ず呼ばせて（tool_choice）1回呼び、tool_use の input を JSON 文字列で返す（呼ばれなければ ""）。
+    キャッシュ・validate の扱いは create_text と同じ（キャッシュキーには tool の定義も含める）。
+    """
+    parts: List[str] = [content] if isinstance(content, str) else list(content)
+    key = _cache_key(model, system, parts, max_tokens, use_cache, tool)
+    cached = _cache_lookup(key, validate)
+    if cached is not None:
+        return cached
+
+    client = client or get_client()
+    system_param, user_content = _request_params(system, parts)
+    response = client.messages.create(
+        model=model,
+        system=system_param,
+        messages=[{"role": "user", "content": user_content}],
+        tools=[tool],
+        tool_choice={"type": "tool", "name": tool["name"]},
+        temperature=0.0,
+        max_tokens=max_tokens,
+    )
+    _record_usage(response, model)
+
+    raw_json = ""
+    for item in response.content:
+        if item.type == "tool_use" and item.name == tool["name"]:
+            raw_json = json.dumps(item.input, ensure_ascii=False)
+            break
+    _cache_store(key, raw_json, validate)
+    return raw_json
+
+
+def stream_text(
+    system: str,
+    content: Union[str, Sequence[str]],
+    max_tokens: int,
+    on_line: Callable[[str], Any],
+    client: Optional[Any] = None,
+    model: str = MODEL,
+    validate: Optional[Callable[[str], Any]] = None,
+    use_cache: Optional[bool] = None,
+) -> Tuple[str, bool]:
+    """
+    create_text のストリーミング版。改行が届くたびに on_line(行) を呼ぶ。
+    on_line が StreamAborted を送出した場合は接続を閉じて生成を打ち切る。
+    戻り値は (それまでの出力テキスト, 打ち切ったか)。打ち切った出力はキャッシュしない。
+    キャッシュヒット時も、保存済みテキストを1行ずつ on_line に渡す。
+    """
+    parts: List[str] = [content] if isinstance(content, str) else list(content)
+    key = _cache_key(model, system, parts, max_tokens, use_cache)
+    cached = _cache_lookup(key, validate)
+    if cached is not None:
+        try:
+            for line in cached.splitlines():
+                on_line(line)
+        except StreamAborted:
+            return cached, True
+        return cached, False
+
+    client = client or get_client()
+    system_param, user_content = _request_params(system, parts)
+    chunks: List[str] = []
+    buf = ""
+    aborted = False
+    with client.messages.stream(
+        model=model,
+        system=system_param,
+        messages=[{"role": "user", "content": user_content}],
+        temperature=0.0,
+        max_tokens=max_tokens,
+    ) as stream:
+        try:
+            for text in stream.text_stream:
+                chunks.append(text)
+                buf += text
+                while "\n" in buf:
+                    line, buf = buf.split("\n", 1)
+                    on_line(line)
+            if buf:
+                on_line(buf)
+        except StreamAborted:
+            aborted = True
+        if not aborted:
+            _record_usage(stream.get_final_message(), model)
+
+    raw_text = "".join(chunks)
+    if aborted:
+        logger.warning("LLM ストリームを打ち切りました（%d 文字受信済み）", len(raw_text))
+        return raw_text, True
+    _cache_store(key, raw_text, validate)
+    return raw_text, False
+
+
+def create_followup(
+    system: str,
+    content: Union[str, Sequence[str]],
+    previous: str,
+    instruction: str,
+    max_tokens: int,
+    client: Optional[Any] = None,
+    model: str = MODEL,
+) -> str:
+    """
+    create_text と同じ system / user に、直前の応答（assistant）と追加指示（user）を続けて1回呼ぶ。
+    固定部分はプロンプトキャッシュが効くため、欠落行だけを聞き直す短い呼び出しになる。
+    """
+    parts: List[str] = [content] if isinstance(content, str) else list(content)
+    client = client or get_client()
+    system_param, user_content = _request_params(system, parts)
+    messages = [
+        {"role": "user", "content": user_content},
+        {"role": "assistant", "content": previous.rstrip() or "(出力なし)"},
+        {"role": "user", "content": instruction},
+    ]
+    return _send(client, model, system_param, messages, max_tokens)
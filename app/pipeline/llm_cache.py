@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 応答のディスクキャッシュ（SQLite）
+
+temperature=0.0 の呼び出しは同じプロンプトなら同じ結果になるため、
+model + プロンプト一式のハッシュをキーに応答テキストを保存し、再投入時は LLM を呼ばずに返す。
+  - TTL を過ぎたエントリは無効
+  - 件数・バイト数の上限を超えたら最終アクセスの古い順に削除（LRU）
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+LLM_CACHE_ENABLED = os.environ.get("CASHAI_LLM_CACHE", "1") != "0"
+LLM_CACHE_PATH = os.environ.get("CASHAI_LLM_CACHE_PATH", "/tmp/cashai_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("CASHAI_LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("CASHAI_LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("CASHAI_LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def make_key(*parts: Any) -> str:
+    """JSON 化した parts の sha256。"""
+    s = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+class SQLiteLRUCache:
+    """TTL・LRU 付きの文字列 KV ストア（1テーブル）。スレッド間で共有してよい。"""
+
+    def __init__(
+        self,
+        path: str,
+        table: str,
+        max_entries: int,
+        max_bytes: int,
+        ttl_seconds: int,
+    ):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        # 呼び出し側でロック取得済みであること
+        if self._conn is None:
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table}(accessed_at)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    db.commit()
+                self.misses += 1
+                return None
+            db.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            db = self._db()
+            db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(db, now)
+            db.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl_seconds,))
+        count, total = db.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 最終アクセスの古い順に、上限を下回るまで削除
+        for key, size in db.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at ASC").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._db().execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+llm_response_cache = SQLiteLRUCache(
+    LLM_CACHE_PATH,
+    "llm_responses",
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    max_bytes=LLM_CACHE_MAX_BYTES,
+    ttl_seconds=LLM_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+会社ごとの「勘定科目 -> 行番号」対応の記憶（SQLite）
+
+同じ会社は毎期ほぼ同じ科目体系で来るため、前回までに決まった対応を保存しておき、
+次回以降はルールより優先して直接割り当てる（LLM には未知の科目だけを分類させる）。
+  - キーは 会社（payload の company_id、無ければ ai_case_id）× 区間（1_78 / 121_154）× 科目名
+  - 学習元：llm モードは出力の「集計方法」に書かれた科目名とスロット行の勘定科目、hybrid は LLM の分類結果
+  - スロット（12〜19 / 48〜52 / 57〜63）に入った科目は、行番号ではなく「その他」枠（21 / 55 / 63）として覚える
+"""
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from app.pipeline import rules
+from app.pipeline.llm_cache import LLM_CACHE_PATH
+
+MAPPING_MEMORY_ENABLED = os.environ.get("CASHAI_MAPPING_MEMORY", "1") != "0"
+MAPPING_MEMORY_PATH = os.environ.get("CASHAI_MAPPING_MEMORY_PATH", LLM_CACHE_PATH)
+
+# スロット行 -> 覚えるときの「その他」枠
+_SLOT_TO_OTHER: Dict[int, int] = {
+    **{n: 21 for n in range(12, 20)},
+    **{n: 55 for n in range(48, 53)},
+    **{n: 63 for n in (57, 58, 60, 61, 62, 63)},
+}
+
+
+def company_key(source: Dict[str, Any]) -> Optional[str]:
+    """source["_meta"] の company_id（無ければ ai_case_id）。どちらも無ければ記憶しない。"""
+    meta = source.get("_meta") or {}
+    for k in ("company_id", "ai_case_id"):
+        v = meta.get(k)
+        if v not in (None, ""):
+            return f"{k}:{v}"
+    return None
+
+
+class AccountMappingStore:
+    """会社 × 区間 × 科目名 -> 行番号 の表。スレッド間で共有してよい。"""
+
+    def __init__(self, path: str, table: str = "account_mappings"):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        # 呼び出し側でロック取得済みであること
+        if self._conn is None:
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " company TEXT NOT NULL,"
+                " section TEXT NOT NULL,"
+                " account TEXT NOT NULL,"
+                " line_no INTEGER NOT NULL,"
+                " origin TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (company, section, account))"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def load(self, company: Optional[str], section: str) -> Dict[str, int]:
+        if not MAPPING_MEMORY_ENABLED or company is None:
+            return {}
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT account, line_no FROM {self.table} WHERE company = ? AND section = ?", (company, section)
+            ).fetchall()
+        return {account: line_no for account, line_no in rows}
+
+    def remember(self, company: Optional[str], section: str, mapping: Dict[str, int], origin: str) -> None:
+        if not MAPPING_MEMORY_ENABLED or company is None or not mapping:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (company, section, account, line_no, origin, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(company, section, account, int(n), origin, now) for account, n in mapping.items()],
+            )
+            db.commit()
+
+    def forget(self, company: str) -> int:
+        with self._lock:
+            db = self._db()
+            cur = db.execute(f"DELETE FROM {self.table} WHERE company = ?", (company,))
+            db.commit()
+            return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, companies = self._db().execute(
+                f"SELECT COUNT(*), COUNT(DISTINCT company) FROM {self.table}"
+            ).fetchone()
+        return {"enabled": MAPPING_MEMORY_ENABLED, "entries": count, "companies": companies}
+
+
+# ============================================================
+# llm モードの出力から対応を読み取る
+# ============================================================
+
+def _names_in_text(text: str, names: Sequence[str]) -> List[str]:
+    """text に現れる科目名（長い名前を優先し、その一部分だけの一致は数えない。例：定期預金 の中の 預金）。"""
+    claimed = [False] * len(text)
+    found = []
+    for name in sorted(names, key=len, reverse=True):
+        start = text.find(name)
+        hit = False
+        while start >= 0:
+            end = start + len(name)
+            if not any(claimed[start:end]):
+                for i in range(start, end):
+                    claimed[i] = True
+                hit = True
+            start = text.find(name, end)
+        if hit:
+            found.append(name)
+    return found
+
+
+def _learn(rows: Iterable[Dict[str, Any]], names: Sequence[str], candidates: Iterable[int]) -> Dict[str, int]:
+    cand = set(candidates)
+    hits: Dict[str, set] = {}
+    for r in rows:
+        n = r.get("行番号")
+        if not isinstance(n, int):
+            continue
+        label = str(r.get("勘定科目", "")).strip()
+        if n in _SLOT_TO_OTHER and label in names:
+            hits.setdefault(label, set()).add(_SLOT_TO_OTHER[n])
+            continue
+        if n not in cand:
+            continue
+        for name in _names_in_text(str(r.get("集計方法", "")), names):
+            hits.setdefault(name, set()).add(n)
+    learned = {}
+    for name, line_nos in hits.items():
+        if line_nos == {1, 2}:
+            # 定期預金は 2 行（内訳）と 1 行（現金・預金）の両方に記載される
+            line_nos = {2}
+        if len(line_nos) == 1:
+            learned[name] = line_nos.pop()
+    return learned
+
+
+def learn_bs(rows_1_78: Sequence[Dict[str, Any]], source: Dict[str, Any]) -> Dict[str, int]:
+    """1〜78 行の出力から、科目名が1つの行にだけ記載されている科目の対応を読み取る。"""
+    return _learn(rows_1_78, rules.section_accounts(source, "1_78"), rules.BS_CANDIDATE_ROWS)
+
+
+def learn_sga(rows_121_154: Sequence[Dict[str, Any]], source: Dict[str, Any]) -> Dict[str, int]:
+    """
+    121〜138 行の出力から、販売費の科目の対応を読み取る。
+    138 その他雑費は finalize で PL の記載値から確定するため 集計方法 に科目名が残らない。
+    121〜138 のどの行にも記載されていない科目は 138 に集計したものとして読み取る。
+    """
+    names = rules.section_accounts(source, "121_154")
+    learned = _learn(rows_121_154, names, rules.SGA_CANDIDATE_ROWS)
+    mentioned = set()
+    for r in rows_121_154:
+        if r.get("行番号") in rules.SGA_CANDIDATE_ROWS:
+            mentioned.add(str(r.get("勘定科目", "")).strip())
+            mentioned.update(_names_in_text(str(r.get("集計方法", "")), names))
+    for name in names:
+        if name not in learned and name not in mentioned:
+            learned[name] = 138
+    return learned
+
+
+account_mapping_store = AccountMappingStore(MAPPING_MEMORY_PATH)
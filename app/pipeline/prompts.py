@@ -0,0 +1,694 @@
+# -*- coding: utf-8 -*-
+"""
+cloab001 のプロンプト定義（originals/cloab001.py から移植・文言は完全保持）
+"""
+from __future__ import annotations
+
+import functools
+import json
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+
+# ============================================================
+# 1〜78行（BS）
+# ============================================================
+
+SYSTEM_PROMPT_BS_1_78 = """
+あなたは日本の企業の決算書の専門家です。
+【最重要ルール：金額の抽出と時系列】
+データ抽出の際、時系列の取り違えを防止するため、以下のルールを全行に厳格に適用してください：
+1. 「今期」列の金額：必ず data.json の各科目の "今期" -> "金額" から取得すること。
+2. 「前期」列の金額：必ず data.json の各科目の "前期" -> "金額" から取得すること。
+3. 「前々期」列の金額：必ず data.json の各科目の "前々期" -> "金額" から取得すること。
+4. 出力順序の固定：各行は必ず「行番号｜勘定科目｜前々期｜前期｜今期｜区分｜集計方法」の順で出力し、列の順番を絶対に入れ替えないでください。
+5. 金額が空文字、null、または存在しない場合は 0 としてください。
+【出力フォーマットに関して、次のルールを絶対に守ってください】
+1. 出力は 78行のテキストのみとし、それ以外の行や説明文、空行、コメントは一切出力してはいけません。
+2. 各行は次の形式とします（カンマではなく全角の縦棒「｜」で区切る）：
+   行番号｜勘定科目｜前々期｜前期｜今期｜区分｜集計方法
+3. 行番号は 1 〜 78 の整数とし、1 行目は 1、2 行目は 2、…、78行目は 78 です。
+4. 「前々期」「前期」「今期」は整数のみとし、カンマ区切りや単位（円、千円など）は付けません。金額が無い場合は 0 とします。
+5. 「区分」は、変動費なら "V"、固定費なら "F"、該当しない行は空文字 "" とします。
+6. 区切り文字として使用する全角縦棒「｜」は、フィールドの中（特に「集計方法」）では絶対に使わないでください。
+7. ヘッダ行は出力してはいけません。
+"""
+
+SPEC_TEXT_BS_1_78 = """
+■目的
+与えられた data.json の BS 部分（貸借対照表）および製造原価報告書に相当する情報を、
+1〜78 行のフォーマットに集計します。
+
+■前提
+- data.json は概ね次のような構造を持つとします（一例）:
+  {
+    "BS": [
+      {
+        "勘定科目": "...",
+        "分類": "...",  // 例: 流動資産, 固定資産, 流動負債, 固定負債, 純資産, 製造原価, 販管費 など
+        "前々期": { "金額": 数値または空文字, "page_no": ... },
+        "前期": { "金額": 数値または空文字, "page_no": ... },
+        "今期": { "金額": 数値または空文字, "page_no": ... }
+      },
+      ...
+    ],
+    "PL": [...],
+    "販売費": [...]
+  }
+
+- 集計対象は原則として "BS" 配列内のデータです。製造原価・労務費・製造経費なども "BS" 又は別セクションから読み取ってください。
+- 金額が空文字の場合は 0 とみなします。
+- 「前々期」「前期」「今期」の金額をそれぞれ集計してください。
+- 「表記ゆれ」（例：什器備品 / 什器・備品、建物附属設備 / 建物付属設備、賃金 / 工員賃金 / 直接工賃金 など）や漢字違いなどは、あなたの判断で同一科目として扱ってください。
+- JSON 内に「合計」行（例：流動資産合計、固定資産合計、資産合計、負債合計、株主資本合計、純資産合計、製造原価合計など）がある場合、それを利用する。自動計算は禁止。
+
+■出力形式（重要）
+- あなたの出力は 78 行のテキストのみです。
+- 各行の形式：
+  行番号｜勘定科目｜今期｜前期｜前々期｜区分｜集計方法
+- 区切りはすべて全角の縦棒「｜」とし、フィールド内では使用しないでください。
+- 「集計方法」は日本語の文章で構いませんが、「｜」は使用禁止です。
+- 「区分」は変動費なら "V"、固定費なら "F"、それ以外の行は ""（空文字）とします。
+- 行番号は 1〜78で、行番号順に並べてください。
+
+------------------------------------------------------------
+■1〜78 行：BS（貸借対照表）
+------------------------------------------------------------
+
+1,現金・預金,現金と預金の合計
+ -（例）●●銀行預金、●●信金、など銀行名が入った科目
+2,（うち定期預金）,定期預金の合計
+3,受取手形,受取手形の合計
+4,売掛金,売掛金の合計
+5,当座資産(その他),有価証券と1～4に含まれない当座資産
+ -（例）預け金
+6,当座資産の合計,該当する勘定科目がない場合は1+3+4+5
+7,製品・商品,製品・商品の合計
+8,原材料,原材料の合計
+9,仕掛品,仕掛品の合計、未成工事支出金を含める
+10,棚卸資産(その他),製品・商品、原材料、仕掛品以外の棚卸資産の合計（該当する勘定科目が１つの場合はその勘定科目を表示）
+11,棚卸資産小計,""
+
+12～19,その他流動資産に属する貸倒引当金以外を1科目ずつ配置
+20,貸倒引当金（▲）,貸倒引当金（▲）の合計
+21,その他流動資産(その他),12～16行および20行以外の「その他流動資産」に属する科目の合計。
+22,その他流動資産小計,12行目から19行目および21行目の合計から、20行目（貸倒引当金）を差し引いた純額を算出してください。
+23,流動資産合計,「流動資産合計」の値を data.json から直接転記。再計算不可。
+24,建物付属設備,- 以下の関連科目をすべて合算し、一つの「建物付属設備」として集計してください。
+  ・「建物」「建物付属設備」「建物附属設備」「建物備品」
+  ・「建築物」「建物（減価償却累計額を除く）」
+- 建物本体と付属設備が別々に計上されている場合は、その合計値を記載してください。
+- 「建物減価償却累計額」などのマイナス科目は、ここには含めず、純粋な取得価額（または帳簿価額）の合算を行ってください。
+- 絶対に合算してはいけない科目（構築物、機械装置、車両運搬具、什器・備品、土地）
+- 集計方法には「建物、建物附属設備を合算」のように、どの用語を統合したか簡潔に記述してください。
+25,構築物,構築物に関係する科目の金額を集計してください。
+26,機械装置,機械装置に関係する科目の金額を集計してください。
+27,車両運搬具,- 以下の関連科目をすべて合算し、一つの「車両運搬具」として集計してください。
+  ・「車両運搬具」「車輛運搬具（旧字体）」
+  ・「車両」「車輛」「運搬具」
+  ・「車両及び運搬具」「車輛及び運搬具」
+- 社用車、トラック、フォークリフトなどの具体的な車両名称が別掲されている場合も、すべてこの行に統合してください。
+- 「車両運搬具減価償却累計額」などのマイナス科目は含めず、取得価額（または帳簿価額）の合算を行ってください。
+- 集計方法には「車両、車輛運搬具を合算」のように、統合した用語を簡潔に記述してください。
+28,什器・備品,- 以下の関連科目をすべて合算し、一つの「什器・備品」として集計してください。
+  ・「工具器具備品」「工具・器具・備品」「器具備品」
+  ・「什器」「備品」「什器備品」
+  ・「事務機器」「事務備品」
+- 工具、金型、測定器などが別掲されている場合も、ここに含めてください。
+- ただし、「ソフトウェア」や「商標権」などの無形固定資産は含めないでください。
+- 「工具器具備品減価償却累計額」などのマイナス科目は含めず、取得価額（または帳簿価額）の合算を行ってください。
+- 集計方法には「工具器具備品、什器備品を合算」のように、統合した用語を簡潔に記述してください。
+29,土地
+30,建設仮勘定
+31,その他有形固定資産
+32,有形固定資産小計,""
+33,無形固定資産小計
+------------------------------------------------------------
+■34〜42 行：投資その他の資産
+------------------------------------------------------------
+34,投資有価証券,「投資有価証券」の金額のみ。
+35,出資金,「出資金」の金額のみ。
+36,保証金,保証金または権利金に該当する科目。
+37,その他の投資等,34〜36および38〜41行の【いずれにも該当しない】個別の投資資産のみを合算。
+※注意：39行の「保険積立金」など、他の行に抽出した科目をここに含めてはいけません（二重計上禁止）。「投資その他の資産合計」等の合計行の数値も使用禁止です。
+38,関係会社株式,関係会社株式の金額。
+39,保険積立金,保険積立金、保険掛金、解約返戻金相当額等の保険に関わる金額。
+40,貸倒引当金（▲）,投資その他の資産に対応する貸倒引当金をプラスの数値（絶対値）で抽出。
+41,長期前払費用,長期前払費用、長期延滞税などの金額。
+42,投資等小計,自動計算（34+35+36+37+38+39+41 - 40）。
+43,繰延資産
+44,固定資産合計,「固定資産合計」の値を data.json から直接転記。再計算不可。
+45,資産合計,「資産合計」または「資産の部合計」の値を data.json から直接転記。絶対に内訳から再計算しないでください。
+46,支払手形,勘定科目名は必ず「支払手形」として固定し、data.json の「支払手形」に該当する金額をそのまま転記する。該当がない場合は0。
+47,買掛金,勘定科目名は必ず「買掛金」として固定し、data.json の「買掛金」に該当する金額をそのまま転記する。該当がない場合は0。
+48〜52,流動負債スロット1〜5,
+- 「分類＝流動負債」に属する科目のうち、46行（支払手形）、47行（買掛金）、53行（未払法人税）、54行（未払消費税）に該当しない科目を、
+  出現順に1科目ずつ配置する。
+- 各行には1科目のみを設定し、合算はしない。
+- 合計行（例：流動負債合計、流動負債の部合計等）は絶対に含めない。
+- 該当科目が不足する場合は、勘定科目は空文字とする（ダブルクォートは出力しない）、金額を0とする。
+53,未払法人税,勘定科目名は必ず「未払法人税」として固定し、「未払法人税」「未払法人税等」など法人税に該当する科目の金額を合算して転記する。該当がない場合は0。
+54,未払消費税,勘定科目名は必ず「未払消費税」として固定し、「未払消費税」「仮受消費税」等、消費税に該当する科目の金額を合算して転記する。該当がない場合は0。
+55,流動負債（その他）,
+- 「分類＝流動負債」に属する科目のうち、
+  46〜54行のいずれにも配置されなかった残りの科目をすべて合算して計上する。
+- 48〜52行に入りきらなかった科目がある場合も、ここに累計する。
+- 合計行（例：流動負債合計、流動負債の部合計等）は絶対に含めない。
+56,流動負債合計,""
+57,固定負債スロット1,BSの「分類=固定負債」から、設備支払手形(59行)以外の固定負債内訳科目を1科目抽出して金額をそのまま入れる。固定負債の合計行（例:「固定負債」「固定負債合計」「固定負債の部合計」等）は二重計上防止のため絶対にスロットに入れない。該当が無い場合は勘定科目を""、金額を0。
+58,固定負債スロット2,同上（2科目目）。同じ科目を重複して入れない。該当が無い場合は勘定科目を""、金額を0。
+59,設備支払手形は、勘定科目名を必ず「設備支払手形」と出力する。金額が0の場合でも勘定科目名を省略してはいけない（例：59｜設備支払手形｜0｜0｜0｜｜設備支払手形なし）。
+60,固定負債スロット3,57,58と同様に固定負債内訳科目を抽出（3科目目）。該当が無い場合は勘定科目を""、金額を0。
+61,固定負債スロット4,同上（4科目目）。該当が無い場合は勘定科目を""、金額を0。
+62,固定負債スロット5,同上（5科目目）。該当が無い場合は勘定科目を""、金額を0。
+63,固定負債スロット6,同上（6科目目）。該当が無い場合は勘定科目を""、金額を0。
+64,固定負債合計,BSに存在する固定負債の合計行（例:「固定負債」「固定負債合計」「固定負債の部合計」等）の金額をそのまま取得して出力する。57〜63の合計から再計算してはならない（Python側で検算するため）。該当の合計行が無い場合のみ、57+58+59+60+61+62+63の合計で補完してよい。
+
+65,負債合計,""
+
+66,資本金
+67,資本剰余金
+68,利益剰余金
+69,うち準備金、積立金
+70,うち繰越利益剰余金
+71,資本等小計,資本等小計が無い場合は"資本金"+"資本剰余金"+"利益剰余金"の合計
+72,自己株式（▲）
+73,評価換算差額等
+74,純資産合計,""
+75,純資産・負債合計,""
+76,借方／貸方照合（資産合計－純資産・負債合計）
+77,受取手形割引高
+78,受取手形裏書譲渡高
+
+- 全ての行において、金額が計上される場合は必ず適切な勘定科目名を付与してください。
+- 行15〜19などの未使用スロットで、金額が0の場合のみ、勘定科目を "" としても構いません。
+"""
+
+USER_PROMPT_BS_1_78_HEAD = (
+    "以下が元データ(JSON)です。この BS および製造原価関連データを、直前の仕様にしたがって 1〜78 行に集計してください。\n"
+    "出力は必ず 78 行のテキストのみとし、各行を「行番号｜勘定科目｜今期｜前期｜前々期｜区分｜集計方法」の形式で出力してください。\n"
+    "ヘッダ行や説明文は絶対に出力しないでください。\n"
+    "=== 元データ(JSON) ===\n"
+    "<JSON_START>\n"
+)
+
+# ============================================================
+# 112〜120行（PL：売上高〜売上総利益）
+# ============================================================
+
+SYSTEM_PROMPT_PL_112_120 = """
+あなたは日本の中小企業の決算書（単体）の専門家です。
+
+出力フォーマットに関して、次のルールを絶対に守ってください：
+1. 出力は 9 行のテキストのみとし（112〜120行）、それ以外の行や説明文、空行、コメントは一切出力してはいけません。
+2. 各行は次の形式とします（カンマではなく全角の縦棒「｜」で区切る）：
+   行番号｜勘定科目｜今期｜前期｜前々期｜区分｜集計方法
+3. 行番号は 112 〜 120 の整数とし、112 行目は 112、…、120 行目は 120 です。
+4. 「今期」「前期」「前々期」は整数のみとし、カンマ区切りや単位（円、千円など）は付けません。金額が無い場合は 0 とします。
+5. 「区分」は、変動費なら "V"、固定費なら "F"、該当しない行は空文字 "" とします。
+6. 区切り文字として使用する全角縦棒「｜」は、フィールドの中（特に「集計方法」）では絶対に使わないでください。
+7. ヘッダ行（「行番号｜勘定科目｜…」など）は出力してはいけません。1 行目からいきなり「112｜売上高｜…」の形式で始めてください。
+8. 9 行ちょうど出力してください。10 行以上や 8 行以下になってはいけません。
+
+以上のフォーマットに違反すると、後段の処理が失敗します。
+"""
+
+SPEC_TEXT_PL_112_120 = """
+■目的
+与えられた data.json の PL 部分および製造原価情報を用いて、
+112〜120 行（売上高〜売上総利益）を集計します。
+
+■前提
+- data.json の "PL" 配列には、「売上高」「売上値引」「売上割戻」「売上戻り」「完成工事高」「完成工事原価」「売上原価」「期首商品棚卸高」「期末商品棚卸高」「工事原価」などの科目が含まれていると想定します。
+- 金額が空文字の場合は 0 とみなします。
+- 「表記ゆれ」はあなたの判断で同一科目として扱ってください（例：売上高／完成工事高、売上原価／完成工事原価 など）。
+
+■行定義（112〜120行）
+
+112,売上高,売上高の合計（売上高の合計は、単純に一番大きな値ではなく、売上値引きなどマイナスされる売上項目がある事を考慮して下さい。）
+113,期首製品・商品棚高,期首製品・商品棚高の合計（期首工事棚卸高も含む）
+114,商品仕入高,商品仕入高の合計（製品売上原価を含む）※期首棚卸を含めないこと
+115,当期製造原価,当期製造原価の合計（完成工事原価を含む）
+116,他勘定振替高,製品売上原価、原価算入諸費用、労務費及び他勘定振替高の合計。
+117,期末製品・商品棚卸高,期末製品・商品棚卸高の合計（未成工事支出金を含む）
+118,期首-期末製品差額(V),期首-期末製品差額(V)の合計。113 − 117　自動計算と明示すること。
+119,売上原価,PL記載の「売上原価」をそのまま採用すること
+120,売上総利益,PL記載の売上総利益をそのまま採用すること
+
+■各行の具体的な集計ルール
+
+●112 行：売上高
+- 最優先：PL 配列に「売上高」という勘定科目が存在する場合は、その金額をそのまま 112 行に採用してください（他科目を足し引きして組み替えない）。
+- 「売上高」が存在しない場合のみ、以下のルールで集計して正味売上高を算出してください。
+
+【加算（プラス）する科目】
+- 「売上高」「事業収入」「売電収入」「完成工事高」など売上・収入系の科目
+- 「ネット売上高」は売上控除ではないため、必ずプラス（加算）として扱う（マイナスにしない）
+
+【控除（マイナス）してよい科目（売上値引き系のみ）】
+- 科目名に次の語を含むものだけを売上控除として扱い、マイナス（控除）する：
+  「売上値引」「値引」「売上戻り」「戻り」「売上割戻」「割戻」「返品」「リベート」「相殺」「キャンセル」
+- ただし「ネット売上高」は上記に該当しても控除扱いにしない（常に加算）。
+
+- 集計方法には、採用した勘定科目（加算/控除）を簡潔に列挙してください。
+- 区分は "" とします。
+
+
+●113 行：期首製品・商品棚高
+- 「期首商品棚卸高」「期首製品棚卸高」「期首製品及び商品棚卸高」「期首工事棚卸高」など、
+  売上原価計算における期首在庫（商品・製品・工事等）を合算してください。
+- 区分は "" とします。
+
+●114 行：商品仕入高
+- 114 行は、「期首棚卸高を含まない、当期中に発生した純粋な仕入金額（購入額）」を表す行とする。
+- 原則として、PL 配列のうち「分類＝売上原価」に属し、かつ次の条件をすべて満たす科目を対象に集計する。
+
+【114 に含める条件】
+- 当期中の「仕入」「購入」「材料購入」「商品購入」等を表す科目であること。
+- 当期製造原価・売上原価合計・仕入合計などの合計・調整概念ではないこと。
+- 外部からの商品調達・仕入に関する項目をすべて合算（リベート等の調整を含む）
+
+【典型的に 114 に含まれる科目例（名称は例示）】
+- 商品材料仕入高、商品仕入高、材料仕入高、原材料仕入高
+- ネット仕入高、ネット仕入
+- リベート、リベート等収入
+- 購入高
+※上記は例示であり、名称一致ではなく「当期の仕入（購入）金額」という意味内容で判断する。
+
+【114 に含めてはいけない科目】
+- 期首商品棚卸高、期首製品棚卸高
+- 期末商品棚卸高、期末製品棚卸高
+- 棚卸資産増減、在庫増減
+- 当期製造原価、売上原価、売上原価合計
+- 仕入合計、差引仕入高等の合計・調整科目
+
+- 集計方法には、勘定科目と金額を記載する。
+- 区分は "" とする。
+
+
+●115 行：当期製造原価
+- 製造業の場合は「当期製造原価」「製品製造原価」「当期工事原価」などに該当する科目を合算してください。
+- 可能であれば、BS・製造原価パートで計算した行111「当期製造原価」と整合するように金額を合わせてください（JSON に該当科目がある範囲で構いません）。
+- 区分は "" とします。
+
+●116 行：他勘定振替高
+- 「他勘定振替高」「製造原価振替高」「完成工事原価振替高」などを合算してください。
+- 区分は "" とします。
+
+●117 行：期末製品・商品棚卸高
+- 「期末商品棚卸高」「期末製品棚卸高」「期末商品及び製品棚卸高」「未成工事支出金」など、
+  売上原価計算における期末在庫（商品・製品・工事等）を合算してください。
+- 区分は "" とします。
+
+●118 行：期首-期末製品差額(V)
+- 原則として、113 行の期首製品・商品棚高から 117 行の期末製品・商品棚卸高を差し引いた金額（113 - 117）を計上してください。
+- もし PL 上に「製品棚卸差額」「工事棚卸差額」など同趣旨の科目が存在する場合は、それらを優先的に用いても構いません。
+- 区分は "V"（変動費）とします。
+
+●119 行：売上原価合計
+- 売上原価全体として「売上原価」「完成工事原価」など PL 上の売上原価科目を合算してください。
+- 売上原価の内訳として 113〜118 行で示した構造（期首在庫＋仕入高＋当期製造原価＋他勘定振替高−期末在庫）の考え方と大きく矛盾しないようにしてください。
+- PL 上に明確な「売上原価」が存在する場合は、そちらの合計金額を優先し、113〜118 行との関係は「集計方法」で説明してください。
+- 区分は "" とします。
+
+●120 行：売上総利益
+- 売上総利益は、原則として 112 行「売上高」から 119 行「売上原価合計」を差し引いた金額（売上高−売上原価）としてください。
+- PL 上に「売上総利益」「粗利益」「完成工事総利益」などがある場合は、そちらの金額に合わせることを優先して構いません。
+- 区分は "" とします。
+
+■注意
+- 112〜120 行の「区分」は 118 行のみ "V" で、それ以外の行は "" としてください。
+- 9 行すべてを必ず出力し、行番号は 112〜120 の連番にしてください。
+"""
+
+USER_PROMPT_PL_112_120_HEAD = (
+    "以下が元データ(JSON)です。この PL データおよび製造原価データを、直前の仕様にしたがって 112〜120 行に集計してください。\n"
+    "出力は必ず 9 行のテキストのみとし、各行を「行番号｜勘定科目｜今期｜前期｜前々期｜区分｜集計方法」の形式で出力してください。\n"
+    "ヘッダ行や説明文は絶対に出力しないでください。\n"
+    "=== 元データ(JSON) ===\n"
+    "<JSON_START>\n"
+)
+
+# ============================================================
+# 121〜154行（PL：販管費〜当期利益）
+# ============================================================
+
+SYSTEM_PROMPT_PL_121_154 = """
+あなたは日本の中小企業の決算書（単体）の専門家です。
+
+出力フォーマットに関して、次のルールを絶対に守ってください：
+1. 出力は 34 行のテキストのみとし（121〜154行）、それ以外の行や説明文、空行、コメントは一切出力してはいけません。
+2. 各行は次の形式とします（カンマではなく全角の縦棒「｜」で区切る）：
+   行番号｜勘定科目｜今期｜前期｜前々期｜区分｜集計方法
+3. 行番号は 121 〜 154 の整数とし、121 行目は 121、122 行目は 122、…、154 行目は 154 です。
+4. 「今期」「前期」「前々期」は整数のみとし、カンマ区切りや単位（円、千円など）は付けません。金額が無い場合は 0 とします。
+5. 「区分」は、変動費なら "V"、固定費なら "F"、該当しない行は空文字 "" とします。
+6. 区切り文字として使用する全角縦棒「｜」は、フィールドの中（特に「集計方法」）では絶対に使わないでください。
+7. ヘッダ行（「行番号｜勘定科目｜…」など）は出力してはいけません。1 行目からいきなり「121｜役員報酬｜…」の形式で始めてください。
+8. 34 行ちょうど出力してください。35 行以上や 33 行以下になってはいけません。
+
+以上のフォーマットに違反すると、後段の処理が失敗します。
+"""
+
+SPEC_TEXT_PL_121_154 = """
+■目的
+与えられた data.json の PL 部分および「販売費」セクションを用いて、
+121〜154 行のフォーマットに集計します。
+
+■前提
+- data.json は概ね次のような構造を持つとします:
+  {
+    "BS": [...],
+    "PL": [...],
+    "販売費": [...]
+  }
+- 金額が空文字の場合は 0 とみなします。
+- 「表記ゆれ」は、あなたの判断で同一科目として扱ってください。
+
+------------------------------------------------------------
+■121〜139 行：販売費及び一般管理費の内訳
+------------------------------------------------------------
+
+121,役員報酬,役員報酬の合計,F
+122,給与・賞与,給与・賞与の合計,F
+123,退職金,退職金の合計,F
+124,法定福利費・福利厚生費,法定福利費・福利厚生費の合計,F
+125,減価償却費,減価償却費の合計,F
+126,貸倒償却費,貸倒償却費の合計,F
+127,取扱手数料,取扱手数料の合計,F
+128,旅費交通費,旅費交通費の合計,F
+129,支払手数料,支払手数料の合計,F
+130,荷造運賃,荷造運賃の合計,F
+131,地代家賃,地代家賃の合計,F
+132,保険料,保険料の合計,F
+133,租税公課,租税公課の合計,F
+134,広告宣伝費,広告宣伝費の合計,F
+135,水道光熱費,水道光熱費の合計,F
+136,事務用・備品消耗品費,事務用・備品消耗品費の合計,F
+137,通信費,通信費の合計,F
+138,その他雑費,その他雑費の合計,F
+139,販売費及び一般管理費,販売費及び一般管理費,F
+
+- "販売費" 配列の科目を、上記行にマッピングします。
+- 行121〜137の定義に該当する科目は、それぞれの行に集約して合算してください。
+- 行121〜137のいずれにも該当しない販売費科目は、すべて行138「その他雑費」に集計します。
+
+
+------------------------------------------------------------
+■140〜154 行：営業利益以降の PL
+------------------------------------------------------------
+
+140,営業利益,営業利益
+141,受取利息・配当,受取利息・配当の合計
+142,雑収入,雑収入の合計
+143は営業外収入で141,142以外の科目が入る。空の場合は""とする
+144は営業外収入で141,142,143以外の科目が入る。複数残っている場合は、営業外収入（その他）として金額を集計する。空の場合は""とする
+145,営業外収入合計,営業外収入の合計
+146,支払利息割引料,支払利息割引料の合計
+147,営業外支出その他,営業外支出その他の合計
+148,営業外支出合計,営業外支出の合計
+149,経常利益,経常利益の合計
+150,特別利益,特別利益の合計
+151,特別損失,特別損失の合計
+152,税引前当期利益,税引前当期利益の合計
+153,法人税等充当額,法人税及び住民税に該当する科目。表記ゆれを考慮すること。
+154,当期利益,当期利益の合計
+
+- 行140〜154の「区分」はすべて "" としてください。
+- 営業外収入／営業外支出の科目分類は、PL の「営業外収益」「営業外費用」区分を参考にしてください。
+"""
+
+USER_PROMPT_PL_121_154_HEAD = (
+    "以下が元データ(JSON)です。この PL および販売費データを、直前の仕様にしたがって 121〜154 行に集計してください。\n"
+    "出力は必ず 34 行のテキストのみとし、各行を「行番号｜勘定科目｜今期｜前期｜前々期｜区分｜集計方法」の形式で出力してください。\n"
+    "ヘッダ行や説明文は絶対に出力しないでください。\n"
+    "=== 元データ(JSON) ===\n"
+    "<JSON_START>\n"
+)
+
+
+def build_user_prompt(head: str, source_data: Dict[str, Any]) -> str:
+    """ユーザープロンプト末尾に元データ(JSON)を埋め込む。"""
+    return (
+        head
+        + json.dumps(source_data, ensure_ascii=False)
+        + "\n<JSON_END>"
+    )
+
+
+# 区間ごとに LLM へ渡す配列（後処理の Python 側は従来どおり全データを使う）
+SOURCE_KEYS_BS_1_78 = ("BS", "製造原価")
+SOURCE_KEYS_PL_112_120 = ("PL", "製造原価")
+SOURCE_KEYS_PL_121_154 = ("PL", "販売費")
+
+_PERIOD_KEYS = ("前々期", "前期", "今期")
+
+
+def _is_empty_amount(v: Any) -> bool:
+    if v is None:
+        return True
+    if isinstance(v, str):
+        t = v.strip().replace(",", "")
+        if t == "":
+            return True
+        try:
+            return float(t) == 0
+        except ValueError:
+            return False
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return v == 0
+    return False
+
+
+def compact_source(source_data: Dict[str, Any], keys: Sequence[str]) -> Dict[str, Any]:
+    """
+    プロンプト用に元データを縮める。
+      - keys で指定した配列のみ残す
+      - 各科目は 勘定科目・分類 と各期の 金額 のみ（page_no などは落とす）
+      - 金額が空・0 の期は省略（仕様上「存在しない場合は 0」と同じ扱い）、全期が空の科目は省略
+    """
+    out: Dict[str, Any] = {}
+    for key in keys:
+        items = []
+        for item in source_data.get(key) or []:
+            if not isinstance(item, dict):
+                continue
+            c: Dict[str, Any] = {}
+            for k in ("勘定科目", "分類"):
+                if item.get(k) not in (None, ""):
+                    c[k] = item[k]
+            has_amount = False
+            for period in _PERIOD_KEYS:
+                p = item.get(period)
+                amount = p.get("金額") if isinstance(p, dict) else None
+                if not _is_empty_amount(amount):
+                    c[period] = {"金額": amount}
+                    has_amount = True
+            if has_amount:
+                items.append(c)
+        out[key] = items
+    return out
+
+
+def build_user_parts(spec: str, head: str, source_data: Dict[str, Any]) -> List[str]:
+    """
+    ユーザーメッセージを [固定部分（仕様＋指示）, 可変部分（元データJSON）] に分けて返す。
+    JSON は区切りの空白を省いて埋め込む。
+    """
+    return [
+        spec + "\n\n" + head,
+        json.dumps(source_data, ensure_ascii=False, separators=(",", ":")) + "\n<JSON_END>",
+    ]
+
+
+# ============================================================
+# 欠落行の再質問（repair）
+# ============================================================
+
+# BS / PL とも出力の指示・パーサ（parts[2] が今期）と同じ列順
+LINE_FORMAT = "行番号｜勘定科目｜今期｜前期｜前々期｜区分｜集計方法"
+
+
+def build_repair_prompt(row_nos: Sequence[int], line_format: str) -> str:
+    """直前の出力で欠落・形式不正だった行だけを出し直させる追加指示。"""
+    nums = ", ".join(str(n) for n in row_nos)
+    return (
+        f"直前の出力では、次の行番号の行が欠落しているか形式が正しくありませんでした：{nums}\n"
+        f"これらの行番号の行のみを、直前の仕様にしたがって「{line_format}」の形式で1行ずつ出力してください。\n"
+        "金額は整数のみ（カンマ・単位なし）とし、他の行・ヘッダ行・説明文は絶対に出力しないでください。\n"
+    )
+
+
+def build_validation_feedback(findings: Sequence[Dict[str, Any]]) -> str:
+    """集計後の検算で不一致だった合計行を伝え、区間全体を集計し直させる追加指示（validation.validate_section の結果）。"""
+    lines = []
+    for f in findings:
+        diff = "、".join(f"{p} {v:+d}" for p, v in f["差異"].items() if v)
+        lines.append(f"- {f['行番号']} {f['勘定科目']}：{diff}")
+    return (
+        "\n\n【検算結果】\n"
+        "前回の集計結果を検算したところ、次の合計行が内訳から計算した値と一致しませんでした（差異 = 内訳の合計 − 合計行の値）。\n"
+        + "\n".join(lines)
+        + "\n元データの科目の漏れ・重複・行の割り当てを見直し、仕様にしたがって集計をやり直してください。"
+        "出力の形式は上記の指示のとおりとします。\n"
+    )
+
+
+# ============================================================
+# ツール呼び出しでの出力（CASHAI_LLM_OUTPUT=tool）
+# ============================================================
+
+ROWS_TOOL_NAME = "submit_rows"
+# プロパティ名はツール定義の制約に合わせて英字とし、cloab001 で日本語のキーに戻す
+ROWS_TOOL: Dict[str, Any] = {
+    "name": ROWS_TOOL_NAME,
+    "description": "集計表の行を提出する。1要素が1行で、金額は整数（円）。",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "rows": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "line_no": {"type": "integer", "description": "行番号"},
+                        "account": {"type": "string", "description": "勘定科目"},
+                        "current": {"type": "integer", "description": "今期の金額"},
+                        "previous": {"type": "integer", "description": "前期の金額"},
+                        "before_previous": {"type": "integer", "description": "前々期の金額"},
+                        "kubun": {"type": "string", "description": "区分（F / V / 空文字）"},
+                        "method": {"type": "string", "description": "集計方法"},
+                    },
+                    "required": ["line_no", "account", "current", "previous", "before_previous", "kubun", "method"],
+                },
+            }
+        },
+        "required": ["rows"],
+    },
+}
+
+TOOL_OUTPUT_NOTE = (
+    "【出力方法（最優先）】\n"
+    f"行はテキストではなく {ROWS_TOOL_NAME} ツールの rows に1行1要素で渡してください。\n"
+    "上記の「行番号｜勘定科目｜…」の各項目は、line_no / account / current（今期） / previous（前期） / "
+    "before_previous（前々期） / kubun（区分） / method（集計方法）に対応します。\n"
+    "金額は整数（カンマ・単位なし）で、該当が無い場合は 0 としてください。\n"
+)
+
+
+def build_tool_repair_prompt(row_nos: Sequence[int]) -> str:
+    """ツール出力で欠落していた行だけを出し直させる追加指示。"""
+    nums = ", ".join(str(n) for n in row_nos)
+    return (
+        "\n\n【再提出】\n"
+        f"前回の提出では次の行番号の行が欠落していました：{nums}\n"
+        f"これらの行番号の行のみを、仕様にしたがって {ROWS_TOOL_NAME} ツールで提出してください。\n"
+    )
+
+
+# ============================================================
+# Python 側で確定する行を出力対象から外す
+# ============================================================
+
+def _drop_spec_rows(spec: str, skip: Sequence[int]) -> str:
+    """仕様から対象行の定義行（「N,…」「Nは…」）と「●N 行：」の説明ブロックを取り除く。"""
+    skip_set = {str(n) for n in skip}
+    out: List[str] = []
+    in_block = False
+    for line in spec.split("\n"):
+        if in_block:
+            if line.startswith(("●", "■")):
+                in_block = False
+            else:
+                continue
+        m = re.match(r"^●(\d+) *行", line)
+        if m and m.group(1) in skip_set:
+            in_block = True
+            continue
+        m = re.match(r"^(\d+)[,は]", line)
+        if m and m.group(1) in skip_set:
+            continue
+        out.append(line)
+    return "\n".join(out)
+
+
+def _format_row_nos(nums: Sequence[int]) -> str:
+    """行番号の並びを「1〜5, 8, 10〜12」の形にまとめる。"""
+    out: List[str] = []
+    nums = sorted(nums)
+    i = 0
+    while i < len(nums):
+        j = i
+        while j + 1 < len(nums) and nums[j + 1] == nums[j] + 1:
+            j += 1
+        out.append(str(nums[i]) if j - i < 2 else f"{nums[i]}〜{nums[j]}")
+        if j - i == 1:
+            out.append(str(nums[j]))
+        i = j + 1
+    return ", ".join(out)
+
+
+@functools.lru_cache(maxsize=64)
+def scope_prompts(
+    system: str, spec: str, head: str, total: int, skip: Tuple[int, ...], other: Tuple[int, ...] = ()
+) -> Tuple[str, str, str]:
+    """
+    skip の行を出力対象から外した (system, spec, head) を返す。skip が空なら元の文言のまま。
+    other は別の呼び出しで出力させる行（区間を分割して並列に呼ぶ場合）で、skip と同様に外す。
+    system / head の行数指定は書き換えず、末尾の追加指示で上書きする（元の文言は保持）。
+    """
+    if not skip and not other:
+        return system, spec, head
+    excluded = set(skip) | set(other)
+    n = total - len(excluded)
+    note = "【出力対象外の行（最優先）】\n"
+    if skip:
+        note += f"次の行番号は後段の Python 処理で確定するため、出力しないでください：{', '.join(str(x) for x in skip)}\n"
+    if other:
+        note += f"次の行番号は別の呼び出しで出力するため、出力しないでください：{_format_row_nos(other)}\n"
+    note += f"出力する行数は {n} 行です（上記の行数指定より、この指示を優先してください）。\n"
+    head = head.replace(f"出力は必ず {total} 行", f"出力は必ず {n} 行")
+    head = head.replace("=== 元データ(JSON) ===\n", note + "=== 元データ(JSON) ===\n")
+    return system.rstrip("\n") + "\n\n" + note, _drop_spec_rows(spec, sorted(excluded)), head
+
+
+# ============================================================
+# hybrid：ルールで判断できなかった科目だけを行番号に分類させる
+# ============================================================
+
+SYSTEM_PROMPT_CLASSIFY = (
+    "あなたは日本の決算書の勘定科目を、指定された集計表の行番号に分類する担当者です。\n"
+    "出力は「勘定科目｜行番号」の形式で、与えられた科目ごとに1行ずつ出力してください。\n"
+    "勘定科目は与えられた表記をそのまま写し、行番号は候補一覧の番号から1つだけ選んでください。\n"
+    "合計・見出しなど集計対象にすべきでない科目は行番号 0 としてください。\n"
+    "説明文・ヘッダ行・コードブロックは出力しないでください。\n"
+)
+
+
+def build_classify_parts(section: str, candidates: Dict[int, str], accounts: Sequence[Dict[str, str]]) -> List[str]:
+    """[固定部分（区間と候補行の一覧）, 可変部分（分類する科目）] を返す。候補一覧は区間ごとに不変のためキャッシュされる。"""
+    cand = "\n".join(f"{n}：{label}" for n, label in sorted(candidates.items()))
+    head = f"=== 集計区間 ===\n{section}\n\n=== 候補行（行番号：勘定科目） ===\n{cand}\n"
+    body = "\n".join(f"{a['勘定科目']}（分類：{a.get('分類') or '不明'}）" for a in accounts)
+    return [head, f"=== 分類する勘定科目（{len(accounts)} 件） ===\n{body}\n"]
+
+
+# ============================================================
+# 省略形の出力（0 の行と集計方法の文章を出力させない）
+# ============================================================
+
+LEAN_OUTPUT_NOTE = (
+    "【出力の省略（最優先）】\n"
+    "今期・前期・前々期の金額がすべて 0 の行は出力しないでください（後段で 0 の行として補います）。\n"
+    "集計方法には、採用した元データの勘定科目名だけを「、」区切りで書いてください（文章・金額・計算式の説明は不要）。"
+    "元データの科目を使わず計算した行は「計算」とだけ書いてください。\n"
+    "行数の指定（必ず N 行出力する等）より、この指示を優先してください。\n"
+)
+
+
+@functools.lru_cache(maxsize=64)
+def lean_prompts(system: str, head: str) -> Tuple[str, str]:
+    """金額 0 の行を省略し、集計方法を科目名の列挙だけにさせる (system, head) を返す。"""
+    head = re.sub(r"出力は必ず (\d+) 行", r"出力は金額が 0 でない行のみ（最大 \1 行）", head)
+    head = head.replace("=== 元データ(JSON) ===\n", LEAN_OUTPUT_NOTE + "=== 元データ(JSON) ===\n")
+    return system.rstrip("\n") + "\n\n" + LEAN_OUTPUT_NOTE, head
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+パイプライン結果キャッシュ
+
+同じ BS/PL/SGA/MFG を再実行したとき、LLM 3回＋後処理をやり直さずに前回の最終出力を返す。
+キーは「正規化した入力のハッシュ」＋「PIPELINE_VERSION（プロンプト・モデル・ルールのバージョン）」。
+  - 入力の正規化：dict のキー順は無視、金額は "1,000" / "1000" / 1000 / 1000.0 を同一視
+  - プロンプト文言・モデル（区間ごとの小さいモデルを含む）・RULES_VERSION・出力形式（text / tool・省略形かどうか）のいずれかが変われば別キーになる（古い結果は TTL/LRU で自然に消える）
+
+金額だけを直して再投入された場合（科目名・分類の並びが前回と同じ）に備え、
+前回の「科目 -> 行番号」対応を「金額を除いた構成のハッシュ」で保存する（structure_* 関数）。
+"""
+from __future__ import annotations
+import json
+import os
+import re
+from typing import Any, Dict, Optional
+
+from app.pipeline import prompts
+from app.pipeline.llm import LLM_OUTPUT_FORMAT, LLM_VERBOSE_OUTPUT, MODEL, SECTION_MODELS
+from app.pipeline.llm_cache import LLM_CACHE_PATH, SQLiteLRUCache, make_key
+
+RESULT_CACHE_ENABLED = os.environ.get("CASHAI_RESULT_CACHE", "1") != "0"
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("CASHAI_RESULT_CACHE_MAX_ENTRIES", "500"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("CASHAI_RESULT_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("CASHAI_RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Python 側の集計ルール（cloab001 の補正・構成比など）を変更したら上げる
+RULES_VERSION = "8"
+
+_NUMBER_RE = re.compile(r"^[+-]?\d+(\.\d+)?$")
+
+
+def _prompt_fingerprint() -> str:
+    texts = [
+        getattr(prompts, name)
+        for name in sorted(dir(prompts))
+        if name.isupper() and isinstance(getattr(prompts, name), str)
+    ]
+    return make_key(*texts)[:16]
+
+
+PIPELINE_VERSION = (
+    f"{MODEL}:{_prompt_fingerprint()}:r{RULES_VERSION}:{LLM_OUTPUT_FORMAT}"
+    + f":{make_key(sorted(SECTION_MODELS.items()))[:8]}"
+    + (":verbose" if LLM_VERBOSE_OUTPUT else "")
+)
+
+
+def _canonical(obj: Any) -> Any:
+    """キャッシュキー用の正規化（値の意味を変えない範囲で表記ゆれを吸収する）。"""
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, bool) or obj is None:
+        return obj
+    if isinstance(obj, float):
+        return int(obj) if obj.is_integer() else obj
+    if isinstance(obj, str):
+        s = obj.strip()
+        t = s.replace(",", "")
+        if _NUMBER_RE.match(t):
+            f = float(t)
+            return int(f) if f.is_integer() else f
+        return s
+    return obj
+
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    """BS/PL/SGA/MFG を正規化したハッシュ（キー順・数値表記に依存しない）。"""
+    body = {k: _canonical(payload.get(k, [])) for k in ("BS", "PL", "SGA", "MFG")}
+    return make_key(body)
+
+
+def structure_hash(payload: Dict[str, Any]) -> str:
+    """金額を除いた構成（各配列の 勘定科目・分類 の並び）のハッシュ。金額だけの修正では変わらない。"""
+    body = {
+        k: [
+            [_canonical(item.get("勘定科目", "")), _canonical(item.get("分類", ""))]
+            for item in payload.get(k, []) or []
+            if isinstance(item, dict)
+        ]
+        for k in ("BS", "PL", "SGA", "MFG")
+    }
+    return make_key(body)
+
+
+def _structure_key(payload: Dict[str, Any], company: str) -> str:
+    # 科目対応は会社（mapping_store.company_key）ごと。構成が同じでも別の会社の対応は使わない
+    return make_key(PIPELINE_VERSION, company, structure_hash(payload))
+
+
+def get_structure_mappings(payload: Dict[str, Any], company: Optional[str]) -> Optional[Dict[str, Dict[str, int]]]:
+    """同じ会社・同じ構成の前回実行で使った {区間: {科目名: 行番号}}。無ければ（会社が不明な場合も）None。"""
+    if not RESULT_CACHE_ENABLED or company is None:
+        return None
+    raw = structure_mapping_cache.get(_structure_key(payload, company))
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+def store_structure_mappings(
+    payload: Dict[str, Any], company: Optional[str], mappings: Dict[str, Dict[str, int]]
+) -> None:
+    if not RESULT_CACHE_ENABLED or company is None:
+        return
+    structure_mapping_cache.set(_structure_key(payload, company), json.dumps(mappings, ensure_ascii=False))
+
+
+def result_cache_key(payload: Dict[str, Any], mode: str = "llm") -> str:
+    return make_key(PIPELINE_VERSION, mode, payload_hash(payload))
+
+
+def get_cached_result(payload: Dict[str, Any], mode: str = "llm") -> Optional[Dict[str, Any]]:
+    if not RESULT_CACHE_ENABLED:
+        return None
+    raw = pipeline_result_cache.get(result_cache_key(payload, mode))
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+def store_result(payload: Dict[str, Any], result: Dict[str, Any], mode: str = "llm") -> None:
+    if not RESULT_CACHE_ENABLED:
+        return
+    pipeline_result_cache.set(result_cache_key(payload, mode), json.dumps(result, ensure_ascii=False))
+
+
+pipeline_result_cache = SQLiteLRUCache(
+    LLM_CACHE_PATH,
+    "pipeline_results",
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+)
+
+structure_mapping_cache = SQLiteLRUCache(
+    LLM_CACHE_PATH,
+    "structure_mappings",
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+)
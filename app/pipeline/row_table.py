@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+集計表（行番号 1〜164 × 3期）の金額を array('q') 1本で持つ表
+
+集計後の段階（構成比・増減・追加項目・検算）は、行 dict の「今期」などを読むたびに数値へ変換していたため、
+行リストを一度だけ読み込んで金額を整数の配列に、勘定科目・区分・集計方法を行番号で引けるリストに持つ。
+  - 金額の並びは 行番号 × (前々期, 前期, 今期)。amounts[n * 3 + j] が行 n・期 j（PERIOD_KEYS の順）
+  - 行の範囲の合計は呼び出し側が amounts[r * 3 + j] を直接足して取る（formulas の区分 V の合計など）
+  - 計算した金額は呼び出し側が行 dict に書き戻す（formulas.apply_to_row_map など）。表に無い項目（構成比など）は行 dict 側に置く
+"""
+from __future__ import annotations
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.pipeline.utils import to_int_safe_bs
+
+ROW_MAX = 164
+PERIOD_KEYS = ("前々期", "前期", "今期")
+
+
+class RowTable:
+    __slots__ = ("amounts", "labels", "kubun", "methods", "present")
+
+    def __init__(self) -> None:
+        self.amounts = array("q", bytes(8 * 3 * (ROW_MAX + 1)))
+        self.labels: List[str] = [""] * (ROW_MAX + 1)
+        self.kubun: List[str] = [""] * (ROW_MAX + 1)
+        self.methods: List[str] = [""] * (ROW_MAX + 1)
+        self.present = bytearray(ROW_MAX + 1)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "RowTable":
+        """行 dict のリストから作る（金額は to_int_safe_bs で1回だけ変換。範囲外の行番号は無視）。"""
+        table = cls()
+        for row in rows:
+            table._load(row.get("行番号"), row)
+        return table
+
+    @classmethod
+    def from_row_map(cls, row_map: Dict[Any, Dict[str, Any]]) -> "RowTable":
+        """行番号 -> 行 dict（cloab001 の row_dict / row_data_map）から作る。"""
+        table = cls()
+        for n, row in row_map.items():
+            table._load(n, row)
+        return table
+
+    def _load(self, line_no: Any, row: Dict[str, Any]) -> None:
+        try:
+            n = int(line_no)
+        except (TypeError, ValueError):
+            return
+        if not 0 < n <= ROW_MAX:
+            return
+        base = n * 3
+        for j, p in enumerate(PERIOD_KEYS):
+            v = row.get(p, 0)
+            if isinstance(v, dict):
+                v = v.get("金額", 0)
+            self.amounts[base + j] = to_int_safe_bs(v)
+        self.labels[n] = str(row.get("勘定科目", "") or "")
+        self.kubun[n] = str(row.get("区分", "") or "")
+        self.methods[n] = str(row.get("集計方法", "") or "")
+        self.present[n] = 1
+
+    def has(self, n: int) -> bool:
+        return 0 < n <= ROW_MAX and self.present[n] == 1
+
+    def get(self, n: int) -> Tuple[int, int, int]:
+        """(前々期, 前期, 今期)。無い行は 0。"""
+        if not 0 < n <= ROW_MAX:
+            return (0, 0, 0)
+        base = n * 3
+        return (self.amounts[base], self.amounts[base + 1], self.amounts[base + 2])
+
+    def value(self, n: int, period: str) -> int:
+        if not 0 < n <= ROW_MAX:
+            return 0
+        return self.amounts[n * 3 + PERIOD_KEYS.index(period)]
+
+    def set(self, n: int, vals: Sequence[int], label: Optional[str] = None, method: Optional[str] = None) -> None:
+        """行 n の金額（前々期, 前期, 今期）を置き換える（無い行は追加する）。"""
+        base = n * 3
+        self.amounts[base:base + 3] = array("q", vals)
+        if label is not None:
+            self.labels[n] = label
+        if method is not None:
+            self.methods[n] = method
+        self.present[n] = 1
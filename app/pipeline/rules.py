@@ -0,0 +1,546 @@
+# -*- coding: utf-8 -*-
+"""
+ルールベース集計（LLM を使わないモード）
+
+SPEC_TEXT_BS_1_78 / SPEC_TEXT_PL_* に書かれている行定義・同義語を Python のパターン表に落としたもの。
+LLM 経路と同じ形（1〜78 行は row_data_map、112〜154 行は行リスト）を返し、
+行6/37/42 の補正や PL 原本優先の再集計は cloab001 の後処理をそのまま通す。
+
+各関数は (結果, unmatched) を返す。unmatched はどの行にも割り当てられなかった（＝ルールで判断できなかった）
+科目名のリストで、hybrid モードではこの科目だけを LLM に行番号で分類させ、assign（科目名 -> 行番号）として
+渡し直して集計する。assign はルールより優先し、0 は「集計対象外」を表す。
+"""
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.pipeline.formulas import BS_FORMULAS, BS_TOTAL_NAMES, PL_121_154_FORMULAS, apply_to_row_map
+from app.pipeline.source_index import _key as _norm, get_index
+from app.pipeline.utils import find_pl_sales_total
+
+Vals = List[int]
+Rule = Tuple[Optional[str], int, Sequence[str], Sequence[str]]
+
+
+def _is_total(norm: str) -> bool:
+    return bool(re.search(r"(合計|小計|総計|計)$", norm)) or "の部" in norm
+
+
+def _match(norm: str, include: Sequence[str], exclude: Sequence[str]) -> bool:
+    if any(re.search(p, norm) for p in exclude):
+        return False
+    return any(re.search(p, norm) for p in include)
+
+
+def _add(acc: Vals, vals: Vals, sign: int = 1) -> None:
+    for j in range(3):
+        acc[j] += sign * vals[j]
+
+
+def _abs(vals: Vals) -> Vals:
+    return [abs(v) for v in vals]
+
+
+class _Rows:
+    """行番号ごとの金額・採用科目を貯め、row_data_map / PL 行リストに変換する。"""
+
+    def __init__(self, labels: Dict[int, str]):
+        self.labels = labels
+        self.vals: Dict[int, Vals] = {}
+        self.names: Dict[int, List[str]] = {}
+        self.methods: Dict[int, str] = {}
+        self.kubun: Dict[int, str] = {}
+
+    def add(self, line_no: int, name: str, vals: Vals, sign: int = 1) -> None:
+        _add(self.vals.setdefault(line_no, [0, 0, 0]), vals, sign)
+        self.names.setdefault(line_no, []).append(name)
+
+    def set(self, line_no: int, vals: Vals, method: str, label: Optional[str] = None) -> None:
+        self.vals[line_no] = list(vals)
+        self.methods[line_no] = method
+        if label is not None:
+            self.labels[line_no] = label
+
+    def get(self, line_no: int) -> Vals:
+        return list(self.vals.get(line_no, [0, 0, 0]))
+
+    def has(self, line_no: int) -> bool:
+        return line_no in self.vals
+
+    def sum(self, line_nos: Sequence[int]) -> Vals:
+        total = [0, 0, 0]
+        for n in line_nos:
+            _add(total, self.get(n))
+        return total
+
+    def method(self, line_no: int) -> str:
+        if line_no in self.methods:
+            return self.methods[line_no]
+        names = self.names.get(line_no)
+        return ("ルール集計: " + "、".join(names)) if names else "該当なし"
+
+    def entry(self, line_no: int) -> Dict[str, Any]:
+        now, prev, prev2 = self.get(line_no)
+        return {
+            "勘定科目": self.labels.get(line_no, ""),
+            "今期": now,
+            "前期": prev,
+            "前々期": prev2,
+            "区分": self.kubun.get(line_no, ""),
+            "集計方法": self.method(line_no),
+        }
+
+
+def row_kubun(line_no: int) -> str:
+    """行の区分（118 は V、121〜139 は F、それ以外は空）。"""
+    if line_no == 118:
+        return "V"
+    if 121 <= line_no <= 139:
+        return "F"
+    return ""
+
+
+def _items(source: Dict[str, Any], key: str):
+    for r in get_index(source).items(key):
+        if r.name:
+            yield r.name, r.key, r.bunrui_key, list(r.vals)
+
+
+def _find_total(source: Dict[str, Any], key: str, names: Sequence[str]) -> Optional[Tuple[str, Vals]]:
+    # 合計行は後に出現するもの（一番右の列）を優先する
+    r = get_index(source).last(key, names)
+    return (r.name, list(r.vals)) if r is not None else None
+
+
+# ============================================================
+# 1〜78行（BS）
+# ============================================================
+
+BS_LABELS: Dict[int, str] = {
+    1: "現金・預金", 2: "（うち定期預金）", 3: "受取手形", 4: "売掛金", 5: "当座資産(その他)", 6: "当座資産の合計",
+    7: "製品・商品", 8: "原材料", 9: "仕掛品", 10: "棚卸資産(その他)", 11: "棚卸資産小計",
+    20: "貸倒引当金（▲）", 21: "その他流動資産(その他)", 22: "その他流動資産小計", 23: "流動資産合計",
+    24: "建物付属設備", 25: "構築物", 26: "機械装置", 27: "車両運搬具", 28: "什器・備品", 29: "土地",
+    30: "建設仮勘定", 31: "その他有形固定資産", 32: "有形固定資産小計", 33: "無形固定資産小計",
+    34: "投資有価証券", 35: "出資金", 36: "保証金", 37: "その他の投資等", 38: "関係会社株式", 39: "保険積立金",
+    40: "貸倒引当金（▲）", 41: "長期前払費用", 42: "投資等小計", 43: "繰延資産", 44: "固定資産合計", 45: "資産合計",
+    46: "支払手形", 47: "買掛金", 53: "未払法人税", 54: "未払消費税", 55: "流動負債（その他）", 56: "流動負債合計",
+    59: "設備支払手形", 64: "固定負債合計", 65: "負債合計",
+    66: "資本金", 67: "資本剰余金", 68: "利益剰余金", 69: "うち準備金、積立金", 70: "うち繰越利益剰余金",
+    71: "資本等小計", 72: "自己株式（▲）", 73: "評価換算差額等", 74: "純資産合計", 75: "純資産・負債合計",
+    76: "借方／貸方照合（資産合計－純資産・負債合計）", 77: "受取手形割引高", 78: "受取手形裏書譲渡高",
+}
+
+# (区分グループ, 行番号, include, exclude) … 上から順に最初に一致した行へ割り当てる
+# 区分グループ: CA=流動資産, FA=固定資産, DA=繰延資産, CL=流動負債, FL=固定負債, EQ=純資産, None=問わない
+BS_ITEM_RULES: List[Rule] = [
+    (None, 77, [r"割引手形", r"受取手形割引"], []),
+    (None, 78, [r"裏書手形", r"裏書譲渡"], []),
+    ("CA", 2, [r"定期預金", r"定期積金"], []),
+    ("CA", 1, [r"現金", r"預金", r"貯金", r"銀行", r"信金", r"信用金庫", r"信用組合"], []),
+    ("CA", 3, [r"受取手形", r"電子記録債権"], []),
+    ("CA", 4, [r"売掛金", r"完成工事未収入金"], []),
+    ("CA", 5, [r"有価証券", r"預け金"], []),
+    ("CA", 9, [r"仕掛品", r"未成工事支出金", r"半製品"], []),
+    ("CA", 8, [r"原材料", r"^材料"], []),
+    ("CA", 7, [r"^製品", r"^商品"], [r"券"]),
+    ("CA", 10, [r"貯蔵品", r"棚卸資産", r"未着品", r"積送品"], []),
+    ("CA", 20, [r"貸倒引当金"], []),
+    ("FA", 24, [r"建物", r"建築物"], [r"減価償却累計", r"構築物"]),
+    ("FA", 25, [r"構築物"], [r"減価償却累計"]),
+    ("FA", 26, [r"機械"], [r"減価償却累計"]),
+    ("FA", 27, [r"車両", r"車輛", r"運搬具"], [r"減価償却累計"]),
+    ("FA", 28, [r"工具", r"器具", r"備品", r"什器", r"事務機器", r"金型"], [r"減価償却累計"]),
+    ("FA", 29, [r"^土地"], []),
+    ("FA", 30, [r"建設仮勘定"], []),
+    ("FA", 33, [r"ソフトウ[ェエ]ア", r"商標権", r"特許権", r"借地権", r"電話加入権", r"のれん", r"営業権", r"施設利用権", r"無形"], []),
+    ("FA", 38, [r"関係会社株式", r"子会社株式", r"関連会社株式"], []),
+    ("FA", 34, [r"投資有価証券"], []),
+    ("FA", 35, [r"出資金"], []),
+    ("FA", 36, [r"保証金", r"敷金", r"権利金"], []),
+    ("FA", 39, [r"保険積立金", r"保険掛金", r"解約返戻"], []),
+    ("FA", 40, [r"貸倒引当金"], []),
+    ("FA", 41, [r"長期前払費用", r"長期延滞税"], []),
+    ("FA", 37, [r"長期貸付", r"長期性預金", r"会員権", r"差入", r"積立金", r"投資", r"長期"], []),
+    (None, 43, [r"創立費", r"開業費", r"開発費", r"株式交付費", r"社債発行費"], []),
+    ("CL", 46, [r"^支払手形"], [r"設備"]),
+    ("CL", 47, [r"買掛金", r"工事未払金"], []),
+    ("CL", 53, [r"未払法人税", r"未払法人"], []),
+    ("CL", 54, [r"未払消費税", r"仮受消費税"], []),
+    ("FL", 59, [r"設備支払手形"], []),
+    ("EQ", 66, [r"^資本金"], []),
+    ("EQ", 69, [r"利益準備金", r"積立金"], [r"繰越"]),
+    ("EQ", 70, [r"繰越利益"], []),
+    ("EQ", 67, [r"資本準備金", r"その他資本剰余金", r"資本剰余金"], []),
+    ("EQ", 72, [r"自己株式"], []),
+    ("EQ", 73, [r"評価差額", r"換算調整", r"評価換算", r"新株予約権"], []),
+]
+
+# 合計・見出し扱いで集計しない科目（正規化後）
+_BS_SUBTOTAL_NAMES = {"当座資産", "投資その他の資産", "負債", "資産", "その他利益剰余金", "有形固定資産", "無形固定資産"}
+
+_CA_SLOTS = list(range(12, 20))
+_CL_SLOTS = list(range(48, 53))
+_FL_SLOTS = [57, 58, 60, 61, 62, 63]
+
+
+def _bs_group(bunrui: str) -> Optional[str]:
+    if "流動資産" in bunrui:
+        return "CA"
+    if "繰延資産" in bunrui:
+        return "DA"
+    if "固定資産" in bunrui or "有形" in bunrui or "無形" in bunrui or "投資" in bunrui:
+        return "FA"
+    if "流動負債" in bunrui:
+        return "CL"
+    if "固定負債" in bunrui:
+        return "FL"
+    if any(w in bunrui for w in ("純資産", "資本", "株主", "評価", "新株")):
+        return "EQ"
+    return None
+
+
+# 分類が空・不明な科目の区分グループを科目名から推定する
+_GROUP_BY_NAME: List[Tuple[str, Sequence[str]]] = [
+    ("FL", [r"長期借入", r"社債", r"長期未払", r"退職給付引当", r"長期預り"]),
+    ("CL", [r"借入金", r"未払", r"預り金", r"前受", r"仮受", r"買掛", r"^支払手形", r"賞与引当", r"リース債務"]),
+    ("EQ", [r"資本金", r"剰余金", r"準備金", r"自己株式", r"評価差額"]),
+    ("CA", [r"現金", r"預金", r"売掛", r"受取手形", r"有価証券", r"商品", r"製品", r"仕掛", r"材料", r"前払費用", r"未収", r"仮払", r"立替"]),
+    ("FA", [r"建物", r"構築物", r"機械", r"車両", r"器具", r"備品", r"土地", r"ソフトウ", r"投資", r"出資金", r"保証金", r"敷金", r"保険積立"]),
+]
+
+
+def _infer_group(norm: str) -> Optional[str]:
+    for group, patterns in _GROUP_BY_NAME:
+        if _match(norm, patterns, []):
+            return group
+    return None
+
+
+# hybrid で LLM に選ばせる行（科目を直接積み上げる行のみ。21/55/63 は「その他」枠として空き行に振り分ける）
+BS_CANDIDATE_ROWS: Dict[int, str] = {
+    n: BS_LABELS.get(n, "")
+    for n in (1, 2, 3, 4, 5, 7, 8, 9, 10, 20, 21, 24, 25, 26, 27, 28, 29, 30, 31, 33,
+              34, 35, 36, 37, 38, 39, 40, 41, 43, 46, 47, 53, 54, 55, 59, 63, 66, 67, 69, 70, 72, 73, 77, 78)
+}
+BS_CANDIDATE_ROWS.update({55: "流動負債（その他）", 63: "固定負債（その他）"})
+
+
+def describe_accounts(source: Dict[str, Any], keys: Sequence[str], names: Sequence[str]) -> List[Dict[str, str]]:
+    """LLM に分類させる科目の一覧（科目名と分類のみ。金額は判断に使わないため送らない）。"""
+    wanted = set(names)
+    out: List[Dict[str, str]] = []
+    for key in keys:
+        for r in get_index(source).items(key):
+            if r.name in wanted:
+                out.append({"勘定科目": r.name, "分類": r.bunrui})
+                wanted.discard(r.name)
+    return out
+
+
+def _bs_classify(norm: str, group: Optional[str]) -> Optional[int]:
+    if group == "DA":
+        return 43
+    for rule_group, line_no, include, exclude in BS_ITEM_RULES:
+        if rule_group is not None and rule_group != group:
+            continue
+        if _match(norm, include, exclude):
+            return line_no
+    return None
+
+
+_BS_TOTAL_KEYS = {n for names in BS_TOTAL_NAMES.values() for n in names}
+
+
+def _bs_skip(norm: str, vals: Vals) -> bool:
+    """BS の合計・小計行と金額がすべて 0 の科目（行に割り当てない）。"""
+    return _is_total(norm) or norm in _BS_TOTAL_KEYS or norm in _BS_SUBTOTAL_NAMES or all(v == 0 for v in vals)
+
+
+def bs_row_map(
+    source: Dict[str, Any], assign: Optional[Dict[str, int]] = None
+) -> Tuple[Dict[int, Dict[str, Any]], List[str]]:
+    """
+    BS（1〜78行）をルールで集計し、LLM 経路の Step A と同じ形の row_data_map を返す。
+    assign（科目名 -> 行番号）に含まれる科目はルールより優先してその行に割り当てる。
+    戻り値: (row_data_map, どの行にも割り当てられなかった科目名)
+    """
+    assign = assign or {}
+    rows = _Rows(dict(BS_LABELS))
+    unmatched: List[str] = []
+    slots = {"CA": list(_CA_SLOTS), "CL": list(_CL_SLOTS), "FL": list(_FL_SLOTS)}
+    overflow = {"CA": 21, "CL": 55, "FL": 63}
+
+    for name, norm, bunrui, vals in _items(source, "BS"):
+        if _bs_skip(norm, vals):
+            continue
+        group = _bs_group(bunrui) or _infer_group(norm)
+        line_no = assign.get(name)
+        if line_no == 0:
+            continue
+        if line_no in (21, 55, 63):
+            # 「その他」枠の指定は、ルールで枠に入る科目と同じく空き行から順に埋める
+            group, line_no = {21: "CA", 55: "CL", 63: "FL"}[line_no], None
+        elif line_no is None:
+            line_no = _bs_classify(norm, group)
+        elif line_no == 31:
+            rows.add(31, name, vals)
+            continue
+
+        if line_no in (20, 40, 72):
+            # 控除項目はプラスの絶対値で持つ
+            rows.add(line_no, name, _abs(vals))
+            continue
+        if line_no is not None:
+            rows.add(line_no, name, vals)
+            if line_no == 2:
+                rows.add(1, name, vals)
+            continue
+        if "減価償却累計" in norm and group == "FA":
+            rows.add(31, name, _abs(vals), sign=-1)
+            continue
+        if group in slots:
+            if slots[group]:
+                slot = slots[group].pop(0)
+                rows.add(slot, name, vals)
+                rows.labels[slot] = name
+            else:
+                rows.add(overflow[group], name, vals)
+            continue
+        if group == "FA":
+            rows.add(37, name, vals)
+        elif group == "EQ":
+            rows.add(73, name, vals)
+        unmatched.append(name)
+
+    # 科目を割り当てる行のうち、data.json に合計行があればそれを採用する行
+    for line_no in (33, 43, 67):
+        found = _find_total(source, "BS", BS_TOTAL_NAMES[line_no])
+        if found:
+            # 割り当てた科目名も残す（集計方法から科目の対応を読み取るため。mapping_store.learn_bs）
+            names = rows.names.get(line_no)
+            detail = f"（内訳: {'、'.join(names)}）" if names else ""
+            rows.set(line_no, found[1], f"data.json記載の{found[0]}を採用{detail}")
+
+    row_data_map = {i: rows.entry(i) for i in range(1, 79)}
+    # 合計・小計・差引行（data.json に合計行があればそれを採用）
+    apply_to_row_map(row_data_map, BS_FORMULAS, source)
+    return row_data_map, unmatched
+
+
+# ============================================================
+# 112〜120行（PL：売上高〜売上総利益）
+# ============================================================
+
+PL_112_120_LABELS: Dict[int, str] = {
+    112: "売上高", 113: "期首製品・商品棚高", 114: "商品仕入高", 115: "当期製造原価", 116: "他勘定振替高",
+    117: "期末製品・商品棚卸高", 118: "期首-期末製品差額(V)", 119: "売上原価", 120: "売上総利益",
+}
+
+_SALES_DEDUCTION = [r"値引", r"戻り", r"割戻", r"返品", r"リベート", r"相殺", r"キャンセル"]
+
+
+def _pl_row(line_no: int, rows: _Rows) -> Dict[str, Any]:
+    e = rows.entry(line_no)
+    return {
+        "行番号": line_no,
+        "勘定科目": e["勘定科目"],
+        "今期": e["今期"],
+        "前期": e["前期"],
+        "前々期": e["前々期"],
+        "区分": e["区分"],
+        "集計方法": e["集計方法"],
+    }
+
+
+def pl_112_120_rows(source: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    112〜120 行をルールで集計する（114/116/118〜120 は cloab001 の finalize で確定するため仮の値）。
+    戻り値: (行リスト, 判断できなかった科目名)
+    """
+    rows = _Rows(dict(PL_112_120_LABELS))
+    rows.kubun[118] = row_kubun(118)
+    unmatched: List[str] = []
+
+    # 112：売上高（PL の売上高合計があれば後処理で上書きされる）
+    if find_pl_sales_total(source) is None:
+        for name, norm, bunrui, vals in _items(source, "PL"):
+            if "売上" not in bunrui and "収益" not in bunrui or _is_total(norm):
+                continue
+            if "ネット売上" in norm or not _match(norm, _SALES_DEDUCTION, []):
+                rows.add(112, name, vals)
+            else:
+                rows.add(112, name, vals, sign=-1)
+
+    for name, norm, bunrui, vals in _items(source, "PL"):
+        if _is_total(norm):
+            continue
+        if "期首" in norm and ("棚卸" in norm or "在庫" in norm):
+            rows.add(113, name, vals)
+        elif "期末" in norm and ("棚卸" in norm or "在庫" in norm) or "未成工事支出金" in norm:
+            rows.add(117, name, vals)
+        elif _match(norm, [r"当期製造原価", r"製品製造原価", r"当期工事原価", r"完成工事原価"], [r"振替"]):
+            rows.add(115, name, vals)
+
+    return [_pl_row(n, rows) for n in range(112, 121)], unmatched
+
+
+# ============================================================
+# 121〜154行（PL：販管費〜当期利益）
+# ============================================================
+
+PL_121_154_LABELS: Dict[int, str] = {
+    121: "役員報酬", 122: "給与・賞与", 123: "退職金", 124: "法定福利費・福利厚生費", 125: "減価償却費",
+    126: "貸倒償却費", 127: "取扱手数料", 128: "旅費交通費", 129: "支払手数料", 130: "荷造運賃",
+    131: "地代家賃", 132: "保険料", 133: "租税公課", 134: "広告宣伝費", 135: "水道光熱費",
+    136: "事務用・備品消耗品費", 137: "通信費", 138: "その他雑費", 139: "販売費及び一般管理費",
+    140: "営業利益", 141: "受取利息・配当", 142: "雑収入", 143: "", 144: "", 145: "営業外収入合計",
+    146: "支払利息割引料", 147: "営業外支出その他", 148: "営業外支出合計", 149: "経常利益",
+    150: "特別利益", 151: "特別損失", 152: "税引前当期利益", 153: "法人税等充当額", 154: "当期利益",
+}
+
+# 販売費の内訳（上から順に最初に一致した行）
+SGA_RULES: List[Tuple[int, Sequence[str], Sequence[str]]] = [
+    (121, [r"役員報酬", r"役員給与", r"役員賞与"], []),
+    (123, [r"退職"], []),
+    (124, [r"法定福利", r"福利厚生", r"厚生費"], []),
+    (122, [r"給与", r"給料", r"賞与", r"手当", r"雑給", r"賃金"], []),
+    (125, [r"減価償却"], []),
+    (126, [r"貸倒"], []),
+    (127, [r"取扱手数料", r"販売手数料"], []),
+    (129, [r"手数料"], []),
+    (128, [r"旅費", r"交通費"], []),
+    (130, [r"荷造", r"運賃", r"発送", r"配送", r"運送"], []),
+    (131, [r"地代", r"家賃", r"賃借料"], []),
+    (132, [r"保険料"], []),
+    (133, [r"租税公課"], []),
+    (134, [r"広告", r"宣伝"], []),
+    (135, [r"水道", r"光熱", r"電気", r"ガス"], []),
+    (136, [r"消耗品", r"事務用品", r"備品"], []),
+    (137, [r"通信"], []),
+]
+
+
+ROW154_PENDING = "後処理で計算（152-153）"
+
+
+# hybrid で LLM に選ばせる販売費の行（125 は finalize で確定するが、科目名の分類先としては選べるようにする）
+SGA_CANDIDATE_ROWS: Dict[int, str] = {n: PL_121_154_LABELS[n] for n in range(121, 139)}
+
+
+def sga_source_key(source: Dict[str, Any]) -> str:
+    return "販売費" if source.get("販売費") else "PL"
+
+
+def _sga_skip(sga_key: str, norm: str, bunrui: str) -> bool:
+    """販売費の内訳として割り当てない科目（PL から拾う場合の販管費以外・合計行）。"""
+    if sga_key == "PL" and "販売費" not in bunrui and "管理費" not in bunrui:
+        return True
+    return _is_total(norm) or norm == "販売費及び一般管理費"
+
+
+def section_accounts(source: Dict[str, Any], section: str) -> List[str]:
+    """section（"1_78" / "121_154"）で行に割り当てる科目名（assign・記憶の対象。金額がすべて 0 の科目を除く。出現順・重複なし）。"""
+    names: List[str] = []
+    if section == "1_78":
+        for name, norm, _bunrui, vals in _items(source, "BS"):
+            if not _bs_skip(norm, vals):
+                names.append(name)
+    else:
+        sga_key = sga_source_key(source)
+        for name, norm, bunrui, vals in _items(source, sga_key):
+            if not _sga_skip(sga_key, norm, bunrui) and any(vals):
+                names.append(name)
+    return list(dict.fromkeys(names))
+
+
+def pl_121_154_rows(
+    source: Dict[str, Any], assign: Optional[Dict[str, int]] = None
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    121〜154 行をルールで集計する（125/138〜140/145/147〜149/152/153 は cloab001 の finalize で確定）。
+    assign（販売費の科目名 -> 行番号）に含まれる科目はルールより優先してその行に割り当てる。
+    戻り値: (行リスト, 判断できなかった科目名)
+    """
+    assign = assign or {}
+    rows = _Rows(dict(PL_121_154_LABELS))
+    for n in range(121, 140):
+        rows.kubun[n] = row_kubun(n)
+    unmatched: List[str] = []
+
+    sga_key = sga_source_key(source)
+    for name, norm, bunrui, vals in _items(source, sga_key):
+        if _sga_skip(sga_key, norm, bunrui):
+            continue
+        if name in assign:
+            if assign[name] in SGA_CANDIDATE_ROWS:
+                rows.add(assign[name], name, vals)
+            continue
+        for line_no, include, exclude in SGA_RULES:
+            if _match(norm, include, exclude):
+                rows.add(line_no, name, vals)
+                break
+        else:
+            rows.add(138, name, vals)
+            unmatched.append(name)
+
+    other_income: List[Tuple[str, Vals]] = []
+    for name, norm, bunrui, vals in _items(source, "PL"):
+        if _is_total(norm):
+            continue
+        if "営業外収益" in bunrui:
+            if _match(norm, [r"受取利息", r"受取配当", r"有価証券利息"], []):
+                rows.add(141, name, vals)
+            elif "雑収入" in norm:
+                rows.add(142, name, vals)
+            elif norm not in ("営業外収益",):
+                other_income.append((name, vals))
+        elif "営業外費用" in bunrui:
+            if _match(norm, [r"支払利息", r"割引料"], []):
+                rows.add(146, name, vals)
+        elif "特別利益" in bunrui and norm != "特別利益":
+            rows.add(150, name, vals)
+        elif "特別損失" in bunrui and norm != "特別損失":
+            rows.add(151, name, vals)
+
+    # 143 は 141・142 以外の1科目目、144 はそれ以外の合計
+    if other_income:
+        name, vals = other_income[0]
+        rows.add(143, name, vals)
+        rows.labels[143] = name
+        for name, vals in other_income[1:]:
+            rows.add(144, name, vals)
+        if len(other_income) > 1:
+            rows.labels[144] = "営業外収入（その他）"
+
+    for line_no, names in ((150, ["特別利益", "特別利益合計"]), (151, ["特別損失", "特別損失合計"])):
+        found = _find_total(source, "PL", names)
+        if found:
+            rows.set(line_no, found[1], f"PL記載の{found[0]}を採用")
+
+    # 154 は 153 の確定後に finish_rows_121_154 で計算する（PL に当期利益があればそれを採用）
+    rows.set(154, [0, 0, 0], ROW154_PENDING)
+
+    return [_pl_row(n, rows) for n in range(121, 155)], unmatched
+
+
+def blank_row(line_no: int) -> Dict[str, Any]:
+    """金額 0 の行（LLM の省略形出力で出力されなかった行を補う）。勘定科目・区分は行定義から。"""
+    label = BS_LABELS.get(line_no) or PL_112_120_LABELS.get(line_no) or PL_121_154_LABELS.get(line_no, "")
+    return {
+        "行番号": line_no,
+        "勘定科目": label,
+        "今期": 0,
+        "前期": 0,
+        "前々期": 0,
+        "区分": row_kubun(line_no),
+        "集計方法": "",
+    }
+
+
+def finish_rows_121_154(row_dict: Dict[int, Dict[str, Any]], source: Dict[str, Any]) -> None:
+    """finalize_rows_121_154 の後に呼ぶ。ルール集計の 154 を確定する（PL の当期利益、無ければ 152−153）。"""
+    row = row_dict.get(154)
+    if row is None or row.get("集計方法") != ROW154_PENDING:
+        return
+    apply_to_row_map(row_dict, {154: PL_121_154_FORMULAS[154]}, source)
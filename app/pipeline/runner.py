@@ -1,11 +1,20 @@
 from __future__ import annotations
+import copy
 import json
-import os
-import subprocess
-import tempfile
-import shutil
-from pathlib import Path
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.pipeline.cloab001 import PIPELINE_MODE, iter_cloab001, learn_mappings, mappings_cover, run_cloab001
+from app.pipeline.cloab002 import run_cloab002
+from app.pipeline.cloab003 import INPUT_ROWS, PERIOD_KEYS, run_cloab003, update_inputs
+from app.pipeline.case_store import CASE_STORE_ENABLED, case_key, case_update_lock, load_case, save_case
+from app.pipeline.mapping_store import company_key
+from app.pipeline.result_cache import (
+    get_cached_result,
+    get_structure_mappings,
+    store_result,
+    store_structure_mappings,
+)
 
 
 def _format_kouseihi_two_decimals(obj: Any) -> Any:
@@ -34,71 +43,128 @@ def _format_kouseihi_two_decimals(obj: Any) -> Any:
 
     return obj
 
-PROJECT_ROOT = Path(__file__).resolve().parents[2]  # ~/cash-ai-01
-ORIGINALS_DIR = PROJECT_ROOT / "app" / "pipeline" / "originals"
-
-def _run(cmd: list[str], cwd: Path, env: Dict[str, str]) -> None:
-    p = subprocess.run(
-        cmd,
-        cwd=str(cwd),
-        env=env,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-    )
-    if p.returncode != 0:
-        raise RuntimeError(f"Command failed: {' '.join(cmd)}\n--- output ---\n{p.stdout}")
-
-def run_001_002_003(payload: Dict[str, Any]) -> Dict[str, Any]:
+def _source_from_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     data_json = {
         "BS": payload.get("BS", []),
         "PL": payload.get("PL", []),
         "販売費": payload.get("SGA", []),
         "製造原価": payload.get("MFG", []),
+        # 会社ごとの科目対応の記憶（mapping_store）に使う。集計・プロンプトには使わない
+        "_meta": {"company_id": payload.get("company_id"), "ai_case_id": payload.get("ai_case_id")},
     }
+    # JSON を経由していた旧実装（data.json）と同じく、入力はコピーを渡す
+    return json.loads(json.dumps(data_json, ensure_ascii=False))
 
-    run_dir = Path(tempfile.mkdtemp(prefix="cashai_", dir="/tmp"))
 
-    try:
-        (run_dir / "data.json").write_text(
-            json.dumps(data_json, ensure_ascii=False),
-            encoding="utf-8"
-        )
+def _derived_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """cloab001 の行に cloab002/003 の比率・増減・追加項目（77〜80, 155〜164）を適用する（rows は変更しない）。"""
+    derived = run_cloab003(run_cloab002(copy.deepcopy(rows)))
+    _format_kouseihi_two_decimals(derived)
+    return derived
 
-        api_key = os.environ.get("OPENAI_API_KEY", "")
-        env = dict(os.environ)
-        if api_key:
-            env["OPENAI_API_KEY2"] = api_key
-
-        # cash-ai-01 直下を PYTHONPATH に入れる（google/colabスタブを拾える）
-        env["PYTHONPATH"] = str(PROJECT_ROOT)
-
-        _run(["python3", str(ORIGINALS_DIR / "cloab001.py"), "--workdir", str(run_dir)], cwd=ORIGINALS_DIR, env=env)
-
-        # 新cloab001.py（=旧cloab001+002相当）は output.json を生成する想定
-        data_path = run_dir / "output.json"
-        if not data_path.exists():
-            # 念のため旧仕様（003相当）もフォールバック
-            data_path = run_dir / "output_updated.json"
-        if not data_path.exists():
-            raise RuntimeError("output.json / output_updated.json が生成されませんでした。")
 
+def _store_case(case_id: Optional[str], derived: Optional[List[Dict[str, Any]]]) -> None:
+    """
+    derived（cloab003 まで適用した行）を案件の結果として保存する。
+    保存済みの案件で手入力した行（集計方法が「入力」の 77・78・155〜158）は値を引き継ぎ、依存する行だけを再計算する
+    （パイプラインの再実行で手入力が消えないようにする。derived 自体は変更しない）。
+    """
+    if not CASE_STORE_ENABLED or case_id is None or derived is None:
+        return
+    with case_update_lock:
+        stored = load_case(case_id)
+        manual = {
+            row["行番号"]: {pk: row.get(pk, 0) for pk in PERIOD_KEYS}
+            for row in stored or []
+            if row.get("行番号") in INPUT_ROWS and row.get("集計方法") == "入力"
+        }
+        if manual:
+            derived = copy.deepcopy(derived)
+            update_inputs(derived, manual)
+            _format_kouseihi_two_decimals(derived)
+        save_case(case_id, derived)
+
+
+def run_001_002_003(payload: Dict[str, Any], use_cache: bool = True, mode: Optional[str] = None) -> Dict[str, Any]:
+    mode = mode or PIPELINE_MODE
+    # 同一入力（正規化後）・同一プロンプト/ルール・同一モードの結果があればそのまま返す
+    if use_cache:
+        cached = get_cached_result(payload, mode)
+        if cached is not None:
+            # 案件の行（cloab003 まで適用済み）も結果と一緒に保存してあるため、cloab002/003 は実行しない
+            case_rows = cached.pop("case_rows", None)
+            if case_rows is None and CASE_STORE_ENABLED and case_key(payload) is not None:
+                case_rows = _derived_rows(cached["output"])
+            _store_case(case_key(payload), case_rows)
+            cached["cached"] = True
+            return cached
+
+    # cloab001 をプロセス内で実行（旧：python3 cloab001.py --workdir ... を毎回起動していた）
+    source = _source_from_payload(payload)
+    run_mode, fast_path = mode, False
+    if use_cache and mode != "rules":
+        # 科目名・分類が前回と同じで金額だけが変わった場合は、前回の科目対応＋ルールで LLM なしに再集計する
+        mappings = get_structure_mappings(payload, company_key(source))
+        if mappings is not None and mappings_cover(source, mappings):
+            source["_meta"]["mappings"] = mappings
+            run_mode, fast_path = "rules", True
+    result = run_cloab001(source, mode=run_mode)
+    rows = result["rows"]
+    if use_cache and not fast_path:
+        store_structure_mappings(payload, company_key(source), learn_mappings(rows, source))
+
+    # 旧実装では data / output を output.json からそれぞれ読み込んでいたため、別オブジェクトにする
+    data_obj = copy.deepcopy(rows)
+    output_obj = rows
+
+    _format_kouseihi_two_decimals(data_obj)
+    _format_kouseihi_two_decimals(output_obj)
+    r = {"data": data_obj, "output": output_obj, "timings": result["timings"], "validation": result["validation"]}
+    case_rows = _derived_rows(output_obj) if CASE_STORE_ENABLED else None
+    _store_case(case_key(payload), case_rows)
+    if use_cache and not fast_path:
+        # 前回の科目対応による再集計（rules）の結果は mode のキーでは保存しない（次回も同じ経路で再集計される）
+        # case_rows は結果のキャッシュにだけ持たせ、応答には含めない
+        store_result(payload, {**r, "case_rows": case_rows}, mode)
+    r["cached"] = False
+    r["fast_path"] = fast_path
+    return r
+
+
+def iter_001_002_003(payload: Dict[str, Any], mode: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    ストリーミング版。区間（1_78 / 81_111 / 112_120 / 121_154）が確定した順に
+    {"section": ..., "rows": [...]} を返し、最後に cloab002/003 の比率・増減・追加項目（77〜80, 155〜164）を
+    {"section": "final", "rows": [...], "timings": {...}, "validation": {...}} として返す。
+    """
+    source = _source_from_payload(payload)
+    for event in iter_cloab001(source, mode=mode):
+        if event["section"] == "all":
+            derived = run_cloab003(run_cloab002(event["rows"]))
+            _format_kouseihi_two_decimals(derived)
+            _store_case(case_key(payload), derived)
+            yield {"section": "final", "rows": derived, "timings": event["timings"], "validation": event["validation"]}
+        else:
+            _format_kouseihi_two_decimals(event["rows"])
+            yield event
 
-        data_obj = json.loads(data_path.read_text(encoding="utf-8"))
 
-        output_path = run_dir / "output.json"
-        output_obj = None
-        if output_path.exists():
-            try:
-                output_obj = json.loads(output_path.read_text(encoding="utf-8"))
-            except Exception:
-                output_obj = None
+def get_case_rows(case_id: str) -> Optional[List[Dict[str, Any]]]:
+    """保存済みの案件の行（cloab003 まで適用し、手入力を反映したもの）。保存されていなければ None。"""
+    return load_case(case_id)
 
-        _format_kouseihi_two_decimals(data_obj)
-        if output_obj is not None:
-            _format_kouseihi_two_decimals(output_obj)
-        return {"data": data_obj, "output": output_obj}
 
-    finally:
-        # /tmp 枯渇防止：必ず掃除
-        shutil.rmtree(run_dir, ignore_errors=True)
\ No newline at end of file
+def update_case_inputs(case_id: str, inputs: Dict[int, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    保存済みの案件の手入力行（77・78・155〜158）を変更し、依存する行だけを再計算して保存する（LLM は呼ばない）。
+    戻り値: {"rows": 変更した行, "timings": {"recompute": ミリ秒}}。案件が保存されていなければ None。
+    """
+    t0 = time.perf_counter()
+    with case_update_lock:
+        rows = load_case(case_id)
+        if rows is None:
+            return None
+        changed = update_inputs(rows, inputs)
+        _format_kouseihi_two_decimals(rows)
+        save_case(case_id, rows)
+    return {"rows": changed, "timings": {"recompute": int((time.perf_counter() - t0) * 1000)}}
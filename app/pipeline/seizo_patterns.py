@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+製造原価（81〜111 行）の科目名パターン表と、それをコンパイルした照合器
+
+パターン表は固定のため import 時に行ごとの含む / 除くパターンを1本の正規表現にまとめておき、
+製造原価の科目ごとに全行を1回で判定して行ごとに合算する（seizo_sums）。
+cloab001._apply_seizo_only_81_111（81〜92・106〜109 の抽出）と formulas.SEIZO_FORMULAS（84 の直接記載）が使う。
+"""
+from __future__ import annotations
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.pipeline.source_index import get_index
+
+_TOTAL_PATTERNS = [r"合計", r"小計", r"総計"]
+
+# 行番号 -> (含むパターン, 除くパターン)。_normalize_account_name 後の科目名に re.search で照合し、
+# 含むのいずれかに一致し、除くのいずれにも一致しない科目を合算する（84 は記載があれば採用する値。formulas.SEIZO_FORMULAS）
+SEIZO_PATTERN_RULES: Dict[int, Tuple[List[str], List[str]]] = {
+    # 81〜84 材料費
+    81: ([r"期首材料棚卸高", r"期首.*材料.*棚卸", r"材料棚卸高", r"期首材料"], [r"期末"]),
+    82: (
+        [r"当期材料仕入高", r"材料仕入高", r"原材料仕入", r"材料購入", r"原材料購入", r"購入高", r"仕入"],
+        [r"期首", r"期末", r"棚卸", r"在庫"] + _TOTAL_PATTERNS,
+    ),
+    83: ([r"期末材料棚卸高", r"期末.*材料.*棚卸", r"期末材料", r"材料棚卸高"], [r"期首"]),
+    84: ([r"当期材料費", r"材料費"], _TOTAL_PATTERNS),
+    # 85〜88 労務費
+    85: (
+        [r"賃金", r"雑給", r"給料", r"給与", r"作業員給与", r"工員賃金", r"直接工賃金", r"臨時", r"パート", r"アルバイト", r"手当", r"役員報酬"],
+        [r"賞与", r"退職", r"法定福利", r"福利", r"厚生", r"当期労務費", r"労務費合計"] + _TOTAL_PATTERNS,
+    ),
+    86: (
+        [r"賞与", r"賞与手当", r"賞与引当金", r"賞与給付"],
+        [r"雑給", r"給料", r"給与", r"役員報酬"] + _TOTAL_PATTERNS,
+    ),
+    87: ([r"退職", r"退職金", r"退職給付"], _TOTAL_PATTERNS),
+    88: (
+        [r"法定福利", r"社会保険", r"健康保険", r"厚生年金", r"労働保険", r"雇用保険", r"福利厚生", r"厚生費"],
+        _TOTAL_PATTERNS,
+    ),
+    # 90〜92 製造経費（専用行）
+    90: ([r"減価償却", r"償却費"], _TOTAL_PATTERNS),
+    91: ([r"外注加工", r"加工外注", r"外注費.*加工", r"外注費\(?加工\)?"], _TOTAL_PATTERNS),
+    92: ([r"消耗品", r"副資材"], _TOTAL_PATTERNS),
+    # 106〜109 仕掛品・他勘定振替
+    106: ([r"期首仕掛品", r"期首.*仕掛", r"期首WIP"], []),
+    108: ([r"期末仕掛品", r"期末.*仕掛", r"期末WIP"], []),
+    109: ([r"他勘定振替", r"振替高"], []),
+}
+
+
+def _alternation(patterns: Sequence[str]) -> Optional["re.Pattern[str]"]:
+    return re.compile("|".join(f"(?:{p})" for p in patterns)) if patterns else None
+
+
+class _PatternMatcher:
+    """
+    行ごとの含む / 除くパターンをそれぞれ1本の選択（|）の正規表現にコンパイルしておき、
+    科目名ごとに全行を1回で判定する（行 × パターン × 科目 の re.search をしない）。
+    """
+
+    __slots__ = ("rules",)
+
+    def __init__(self, rules: Dict[int, Tuple[List[str], List[str]]]):
+        self.rules = [(n, _alternation(inc), _alternation(exc)) for n, (inc, exc) in rules.items()]
+
+    def classify(self, name: str) -> List[int]:
+        """name が該当する行番号（規則の定義順）。"""
+        return [
+            n for n, inc, exc in self.rules
+            if inc is not None and inc.search(name) and (exc is None or not exc.search(name))
+        ]
+
+    def sum_by_row(self, records: Iterable[Any]) -> Dict[int, Tuple[List[int], List[str]]]:
+        """{行番号: ([今期, 前期, 前々期] の合計, 該当した勘定科目)}。records は SourceRecord（出現順）。"""
+        out: Dict[int, Tuple[List[int], List[str]]] = {n: ([0, 0, 0], []) for n, _inc, _exc in self.rules}
+        for rec in records:
+            if rec.norm == "":
+                continue
+            for n in self.classify(rec.norm):
+                total, matched = out[n]
+                for j in range(3):
+                    total[j] += rec.vals[j]
+                matched.append(rec.name)
+        return out
+
+
+SEIZO_MATCHER = _PatternMatcher(SEIZO_PATTERN_RULES)
+
+
+def seizo_sums(source: Dict[str, Any]) -> Dict[int, Tuple[List[int], List[str]]]:
+    """元データの製造原価の科目を SEIZO_PATTERN_RULES の行ごとに合算する（SEIZO_MATCHER.sum_by_row）。"""
+    return SEIZO_MATCHER.sum_by_row(get_index(source).items("製造原価"))
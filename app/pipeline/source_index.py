@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+元データ（BS / PL / 販売費 / 製造原価）の科目を1回だけ読み込んだ索引
+
+集計の各所で source[key] を線形に走査し、そのたびに科目名の strip・正規化と金額の変換をしていたため、
+実行ごとに1回だけ SourceRecord（科目名・正規化名・分類・金額の3期）に変換し、
+科目名 / 正規化名 / 分類 ごとの索引を作っておく。索引の値は元データの出現順の SourceRecord のリスト。
+  - name     : 勘定科目（前後の空白を除く）
+  - norm     : utils._normalize_account_name（空白・中点・「勘定科目」などを除く。製造原価の抽出で使う）
+  - key      : norm からさらに括弧を除いたもの（rules の科目名の照合で使う）
+  - bunrui   : 分類（前後の空白を除く）。bunrui_key は key と同じ正規化
+  - vals     : [今期, 前期, 前々期] の整数（utils._get_amount_triplet）
+get_index(source) は source["_meta"]["index"] に索引を保持する（iter_cloab001 が区間の並列実行の前に作る）。
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.pipeline.utils import _get_amount_triplet, _normalize_account_name
+
+SOURCE_KEYS = ("BS", "PL", "販売費", "製造原価")
+
+
+def _key(text: Any) -> str:
+    n = _normalize_account_name(text)
+    for ch in "（）()「」":
+        n = n.replace(ch, "")
+    return n
+
+
+class SourceRecord:
+    __slots__ = ("item", "pos", "name", "norm", "key", "bunrui", "bunrui_key", "vals")
+
+    def __init__(self, item: Dict[str, Any], pos: int):
+        self.item = item
+        self.pos = pos
+        self.name = str(item.get("勘定科目", "")).strip()
+        self.norm = _normalize_account_name(item.get("勘定科目", ""))
+        self.key = _key(self.name)
+        self.bunrui = str(item.get("分類", "")).strip()
+        self.bunrui_key = _key(item.get("分類", ""))
+        self.vals = _get_amount_triplet(item)
+
+
+class SourceIndex:
+    __slots__ = ("records", "_by_name", "_by_key", "_by_bunrui")
+
+    def __init__(self, source: Dict[str, Any]):
+        self.records: Dict[str, List[SourceRecord]] = {}
+        self._by_name: Dict[str, Dict[str, List[SourceRecord]]] = {}
+        self._by_key: Dict[str, Dict[str, List[SourceRecord]]] = {}
+        self._by_bunrui: Dict[str, Dict[str, List[SourceRecord]]] = {}
+        for key in SOURCE_KEYS:
+            recs = [SourceRecord(item, i) for i, item in enumerate(source.get(key) or []) if isinstance(item, dict)]
+            self.records[key] = recs
+            by_name: Dict[str, List[SourceRecord]] = {}
+            by_key: Dict[str, List[SourceRecord]] = {}
+            by_bunrui: Dict[str, List[SourceRecord]] = {}
+            for r in recs:
+                by_name.setdefault(r.name, []).append(r)
+                by_key.setdefault(r.key, []).append(r)
+                by_bunrui.setdefault(r.bunrui, []).append(r)
+            self._by_name[key] = by_name
+            self._by_key[key] = by_key
+            self._by_bunrui[key] = by_bunrui
+
+    def items(self, key: str) -> List[SourceRecord]:
+        return self.records.get(key, [])
+
+    def by_name(self, key: str, name: str) -> List[SourceRecord]:
+        return self._by_name.get(key, {}).get(name, [])
+
+    def by_key(self, key: str, norm: str) -> List[SourceRecord]:
+        return self._by_key.get(key, {}).get(norm, [])
+
+    def by_bunrui(self, key: str, bunrui: str) -> List[SourceRecord]:
+        return self._by_bunrui.get(key, {}).get(bunrui, [])
+
+    def named(self, key: str, names: Iterable[str], bunrui: Optional[str] = None) -> List[SourceRecord]:
+        """科目名が names のいずれかの科目（bunrui 指定時は分類も一致するもの）を出現順に。"""
+        recs = [r for name in set(names) for r in self.by_name(key, name)]
+        if bunrui is not None:
+            recs = [r for r in recs if r.bunrui == bunrui]
+        return sorted(recs, key=lambda r: r.pos)
+
+    def first(self, key: str, names: Iterable[str], bunrui: Optional[str] = None) -> Optional[SourceRecord]:
+        recs = self.named(key, names, bunrui)
+        return recs[0] if recs else None
+
+    def last(self, key: str, norms: Iterable[str]) -> Optional[SourceRecord]:
+        """表記ゆれを除いた科目名が norms のいずれかの科目のうち、最後に出現したもの（合計行は一番右の列を優先する）。"""
+        recs = [r for norm in set(norms) for r in self.by_key(key, norm) if r.name]
+        return max(recs, key=lambda r: r.pos) if recs else None
+
+
+def get_index(source: Dict[str, Any]) -> SourceIndex:
+    meta = source.setdefault("_meta", {})
+    index = meta.get("index")
+    if index is None:
+        index = meta["index"] = SourceIndex(source)
+    return index
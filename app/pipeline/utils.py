@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+cloab001〜003 共通ユーティリティ（originals/cloab001.py から移植）
+"""
+from __future__ import annotations
+
+
+def to_int_safe_bs(s):
+    if s is None:
+        return 0
+    if isinstance(s, (int, float)):
+        return int(s)
+    s = str(s).replace(",", "").replace(" ", "").replace("　", "")
+    if s == "" or s == "-" or s == "ー":
+        return 0
+    if "△" in s or "▲" in s:
+        s = s.replace("△", "").replace("▲", "")
+        try:
+            return -int(s)
+        except ValueError:
+            return 0
+    try:
+        return int(s)
+    except ValueError:
+        return 0
+
+
+def _normalize_account_name(name: str) -> str:
+    """勘定科目名を正規化する。"""
+    name = str(name).strip()
+    name = name.replace(" ", "").replace("　", "")  # 全角半角スペース除去
+    name = name.replace("・", "").replace("・", "")  # 中点除去
+    name = name.replace("勘定科目", "").replace("科目", "")  # 「勘定科目」などの語句を除去
+    return name
+
+
+def _get_amount_triplet(item: dict) -> list:
+    """辞書から今期、前期、前々期の金額を整数で取得する。"""
+    now_val = to_int_safe_bs(item.get("今期", {}).get("金額", 0) if isinstance(item.get("今期"), dict) else item.get("今期", 0))
+    prev_val = to_int_safe_bs(item.get("前期", {}).get("金額", 0) if isinstance(item.get("前期"), dict) else item.get("前期", 0))
+    prev2_val = to_int_safe_bs(item.get("前々期", {}).get("金額", 0) if isinstance(item.get("前々期"), dict) else item.get("前々期", 0))
+    return [now_val, prev_val, prev2_val]
+
+
+def find_pl_sales_total(source_data: dict):
+    """
+    PL 配列から売上高合計の行を探し、(科目, 集計方法の注記) を返す。見つからなければ None。
+    複数列ある場合は「一番右（最後に出現する売上合計行）」を採用。
+    """
+    from app.pipeline.source_index import get_index  # source_index が utils を import するため遅延
+
+    idx = get_index(source_data)
+
+    # 分類が「売上高」かつ勘定科目が「売上高」の行（複数ある場合は最後が一番右の合計列）
+    candidates_exact = [r.item for r in idx.named("PL", ["売上高"], "売上高")]
+
+    # 分類が「売上高」の合計行（合計っぽい名称）
+    candidates_total = []
+    if not candidates_exact:
+        total_keywords = ["売上高合計", "売上合計", "純売上高", "正味売上高", "事業収益合計", "完成工事高合計"]
+        candidates_total = [r.item for r in idx.named("PL", total_keywords) if r.bunrui in ("売上高", "")]
+
+    if candidates_exact:
+        chosen = candidates_exact[-1]
+        method_note = "PDF記載値を優先採用（勘定科目=売上高, 分類=売上高）" + (
+            f"（{len(candidates_exact)}件中最後の値を採用）" if len(candidates_exact) > 1 else ""
+        )
+        return chosen, method_note
+    if candidates_total:
+        chosen = candidates_total[-1]
+        return chosen, f"PDF記載の売上合計行を採用: {chosen.get('勘定科目','')}"
+    return None
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+集計結果の検算（originals/cloab001.py の verify_total 相当）
+
+1〜78 行の合計行が内訳の合計と一致しているか、貸借（行76 = 45 − 75）が合っているか、
+PL の段階利益（139 / 140 / 145 / 148 / 149 / 152 / 154）の計算が合っているかを調べ、不一致の一覧を返す。
+調べる行と式は formulas の表の check（ルール集計が計算に使う式と同じ表）。
+  - 区間の実行中：モデルの段階的な切り替え（小さいモデル → MODEL）の判定に使う（bs_problems / validate_section）
+  - 集計後：不一致のあった LLM 区間だけを、不一致の内容を添えて1回だけ再質問する判定と、API 応答の要約に使う（validate_section / summarize）
+  - 控除項目（20 / 40 / 72 行）は絶対値で差し引く（originals と同じ）
+  - 差異が VALIDATION_TOLERANCE 以下なら一致とみなす（元データの端数処理のずれを許容する場合に設定）
+"""
+from __future__ import annotations
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+
+from app.pipeline import formulas, rules
+from app.pipeline.row_table import RowTable
+from app.pipeline.source_index import get_index
+
+VALIDATION_TOLERANCE = int(os.environ.get("CASHAI_VALIDATION_TOLERANCE", "0"))
+
+PERIODS = ["今期", "前期", "前々期"]
+
+_DEDUCTION_ROWS = {20, 40, 72}
+
+def _checks(table: Dict[int, Dict[str, Any]], labels: Dict[int, str]) -> List[Tuple[int, str, Sequence[Tuple[int, int]]]]:
+    """formulas の表のうち check のある行の (行番号, 名称, [(内訳の行番号, 符号)])。"""
+    return [(n, labels.get(n, ""), f["check"]) for n, f in sorted(table.items()) if f["check"] is not None]
+
+
+BS_TOTAL_CHECKS = _checks(formulas.BS_FORMULAS, rules.BS_LABELS)
+
+# 112〜120 / 121〜154 行（finalize_rows_112_120 / finalize_rows_121_154 の後の値で調べる）
+PL_112_120_CHECKS = _checks(formulas.PL_112_120_FORMULAS, rules.PL_112_120_LABELS)
+PL_TOTAL_CHECKS = _checks(formulas.PL_121_154_FORMULAS, rules.PL_121_154_LABELS)
+
+
+def _vals(table: RowTable, line_no: int) -> List[int]:
+    # RowTable は (前々期, 前期, 今期) の順
+    v = table.get(line_no)
+    return [v[2], v[1], v[0]]
+
+
+def _diff_entry(line_no: int, label: str, calc: List[int], actual: List[int]) -> Dict[str, Any]:
+    return {
+        "行番号": line_no,
+        "勘定科目": label,
+        "計算値": dict(zip(PERIODS, calc)),
+        "出力値": dict(zip(PERIODS, actual)),
+        "差異": dict(zip(PERIODS, [c - a for c, a in zip(calc, actual)])),
+    }
+
+
+def verify_totals(
+    rows: Sequence[Dict[str, Any]], checks: Sequence[Tuple[int, str, Sequence[Tuple[int, int]]]] = BS_TOTAL_CHECKS
+) -> List[Dict[str, Any]]:
+    """
+    checks の合計行のうち、内訳から計算した値と一致しない行の一覧（差異は 計算値 − 出力値）。
+    rows に無い行を参照する式は調べない（区間の行だけで検算する場合）。
+    """
+    table = RowTable.from_rows(rows)
+    problems = []
+    for line_no, label, terms in checks:
+        if not table.has(line_no) or not all(table.has(n) for n, _ in terms):
+            continue
+        calc = [0, 0, 0]
+        for n, sign in terms:
+            v = _vals(table, n)
+            if n in _DEDUCTION_ROWS:
+                v = [abs(x) for x in v]
+            for j in range(3):
+                calc[j] += sign * v[j]
+        actual = _vals(table, line_no)
+        if any(abs(c - a) > VALIDATION_TOLERANCE for c, a in zip(calc, actual)):
+            problems.append(_diff_entry(line_no, label, calc, actual))
+    return problems
+
+
+def verify_balance(rows: Sequence[Dict[str, Any]], source: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    元データの資産合計と負債純資産合計が一致しているのに、出力の 45 行と 75 行が一致しない場合の不一致。
+    （元データ自体が貸借不一致の場合は、出力の不一致をモデルの誤りとはみなさない）
+    """
+    idx = get_index(source)
+    assets = idx.last("BS", formulas.BS_TOTAL_NAMES[45])
+    liabilities = idx.last("BS", formulas.BS_TOTAL_NAMES[75])
+    if assets is None or liabilities is None or assets.vals != liabilities.vals:
+        return []
+    table = RowTable.from_rows(rows)
+    v45, v75 = _vals(table, 45), _vals(table, 75)
+    if all(abs(a - b) <= VALIDATION_TOLERANCE for a, b in zip(v45, v75)):
+        return []
+    return [_diff_entry(76, "貸借不一致（45 − 75）", [a - b for a, b in zip(v45, v75)], [0, 0, 0])]
+
+
+def bs_problems(rows: Sequence[Dict[str, Any]], source: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return verify_totals(rows) + verify_balance(rows, source)
+
+
+def validate_section(section: str, rows: Sequence[Dict[str, Any]], source: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    区間（"1_78" / "112_120" / "121_154"）の集計後の検算。各不一致に "section" を付けて返す。
+    121〜154 の 140 は行120 を参照するため、112〜120 の行も含めて渡すこと（含めなければ 140 は調べない）。
+    """
+    if section == "1_78":
+        problems = bs_problems(rows, source)
+    elif section == "112_120":
+        problems = verify_totals(rows, PL_112_120_CHECKS)
+    elif section == "121_154":
+        problems = verify_totals(rows, PL_TOTAL_CHECKS)
+    else:
+        return []
+    return [{"section": section, **p} for p in problems]
+
+
+def summarize(findings: Sequence[Dict[str, Any]], retried: Sequence[str] = ()) -> Dict[str, Any]:
+    """API 応答用の要約（不一致の行番号と差異のみ。計算値・出力値は行データから分かるため省く）。"""
+    return {
+        "ok": not findings,
+        "findings": [
+            {"section": f["section"], "行番号": f["行番号"], "勘定科目": f["勘定科目"], "差異": f["差異"]}
+            for f in findings
+        ],
+        "retried": list(retried),
+    }
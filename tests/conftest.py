@@ -0,0 +1,69 @@
+"""
+テスト共通の設定。app を import する前に、キャッシュ・記憶の SQLite をテスト用の一時ディレクトリに向ける。
+LLM はすべて tests/fakes.py の FakeAnthropic で置き換える（ANTHROPIC_API_KEY は不要）。
+"""
+from __future__ import annotations
+import copy
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_TMP = tempfile.mkdtemp(prefix="cashai-tests-")
+os.environ.update(
+    {
+        "CASHAI_LLM_CACHE_PATH": os.path.join(_TMP, "cache.sqlite3"),
+        "CASHAI_MAPPING_MEMORY_PATH": os.path.join(_TMP, "mappings.sqlite3"),
+        # LLM の応答キャッシュは切り、呼び出し回数をそのまま数えられるようにする
+        "CASHAI_LLM_CACHE": "0",
+        "CASHAI_RESULT_CACHE": "1",
+        "CASHAI_CASE_STORE": "1",
+        "CASHAI_MAPPING_MEMORY": "1",
+        "CASHAI_BS_SPLIT": "0",
+        "CASHAI_PIPELINE_MODE": "llm",
+    }
+)
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import pytest  # noqa: E402
+
+from app.pipeline import llm  # noqa: E402
+from app.pipeline.case_store import case_result_store  # noqa: E402
+from app.pipeline.llm_cache import llm_response_cache  # noqa: E402
+from app.pipeline.mapping_store import account_mapping_store  # noqa: E402
+from app.pipeline.result_cache import pipeline_result_cache, structure_mapping_cache  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def load_fixture(name: str):
+    with open(FIXTURES / name, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_stores(tmp_path, monkeypatch):
+    """結果のキャッシュ・案件・科目対応の記憶をテストごとに空の SQLite にする。"""
+    for store in (
+        llm_response_cache, pipeline_result_cache, structure_mapping_cache, case_result_store, account_mapping_store
+    ):
+        monkeypatch.setattr(store, "path", str(tmp_path / "stores.sqlite3"))
+        monkeypatch.setattr(store, "_conn", None)
+
+
+@pytest.fixture
+def payload():
+    return copy.deepcopy(load_fixture("payload.json"))
+
+
+@pytest.fixture
+def use_client(monkeypatch):
+    """llm.get_client() が返す共有クライアントを差し替える（runner は client を受け取らないため）。"""
+
+    def _use(client):
+        monkeypatch.setattr(llm, "_client", client)
+        return client
+
+    return _use
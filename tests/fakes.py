@@ -0,0 +1,102 @@
+"""
+テスト用の Anthropic クライアントの代わり（messages.create / messages.stream のみ）。
+区間ごとの答え（行番号 -> 1行）を持ち、プロンプトから区間を判断して返す。呼び出しは calls に記録する。
+"""
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.pipeline.prompts import SYSTEM_PROMPT_CLASSIFY
+
+
+def _text(value: Any) -> str:
+    # system / content は文字列か、cache_control 付きのテキストブロックのリスト
+    return value if isinstance(value, str) else "".join(b["text"] for b in value or [])
+
+
+def row_line(r: Dict[str, Any]) -> str:
+    """行 dict を LLM の出力形式（prompts.LINE_FORMAT）の1行にする。"""
+    return "｜".join(str(r.get(k, "")) for k in ("行番号", "勘定科目", "今期", "前期", "前々期", "区分", "集計方法"))
+
+
+class _Text:
+    type = "text"
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Usage:
+    input_tokens = 100
+    output_tokens = 100
+    cache_read_input_tokens = 0
+    cache_creation_input_tokens = 0
+
+
+class _Response:
+    stop_reason = "end_turn"
+
+    def __init__(self, text: str):
+        self.content = [_Text(text)]
+        self.usage = _Usage()
+
+
+class _Stream:
+    def __init__(self, text: str):
+        self._text = text
+
+    def __enter__(self) -> "_Stream":
+        return self
+
+    def __exit__(self, *exc: Any) -> bool:
+        return False
+
+    @property
+    def text_stream(self):
+        for i in range(0, len(self._text), 16):
+            yield self._text[i:i + 16]
+
+    def get_final_message(self) -> _Response:
+        return _Response(self._text)
+
+
+class _Messages:
+    def __init__(self, owner: "FakeAnthropic"):
+        self._owner = owner
+
+    def create(self, **kw: Any) -> _Response:
+        return _Response(self._owner.answer(kw))
+
+    def stream(self, **kw: Any) -> _Stream:
+        return _Stream(self._owner.answer(kw))
+
+
+class FakeAnthropic:
+    """
+    rows（1〜154 行の dict）を区間ごとの答えにする。classify は {科目名: 行番号}（無い科目は 138）。
+    答えの行は区間の指示で「出力しないでください」と指定された行を除いて返す。
+    """
+
+    def __init__(self, rows: Sequence[Dict[str, Any]], classify: Optional[Dict[str, int]] = None):
+        self.lines = {r["行番号"]: row_line(r) for r in rows}
+        self.classify = classify or {}
+        self.calls: List[str] = []
+        self.messages = _Messages(self)
+
+    def answer(self, kw: Dict[str, Any]) -> str:
+        system_text = _text(kw.get("system"))
+        text = system_text + "".join(_text(m["content"]) for m in kw.get("messages") or [])
+        if system_text.startswith(SYSTEM_PROMPT_CLASSIFY):
+            self.calls.append("classify")
+            names = re.findall(r"^(.+?)（分類：", text, flags=re.M)
+            return "\n".join(f"{n}｜{self.classify.get(n, 138)}" for n in names)
+        if "121" in text and "34 行" in text:
+            section, line_nos = "pl_121_154", range(121, 155)
+        elif "112〜120" in text or "112 〜 120" in text:
+            section, line_nos = "pl_112_120", range(112, 121)
+        else:
+            section, line_nos = "bs_1_78", range(1, 79)
+        self.calls.append(section)
+        m = re.search(r"出力しないでください：([0-9, ]+)", text)
+        skip = {int(x) for x in m.group(1).split(",")} if m else set()
+        return "\n".join(self.lines[n] for n in line_nos if n not in skip and n in self.lines)
@@ -0,0 +1,77 @@
+"""保存済みの案件の手入力行（77・78・155〜158）の変更（LLM なしで依存する行だけを再計算する）。"""
+from __future__ import annotations
+
+import pytest
+
+from app.pipeline import formulas, runner
+from app.pipeline.cloab001 import run_cloab001
+from app.pipeline.row_table import RowTable
+from fakes import FakeAnthropic
+
+CASE_ID = "fixture-case"
+
+
+def _run(payload, use_client):
+    rows = run_cloab001(runner._source_from_payload(payload), mode="rules")["rows"]
+    client = use_client(FakeAnthropic(rows))
+    runner.run_001_002_003(payload, mode="llm")
+    client.calls.clear()
+    return client
+
+
+def _by_no(rows):
+    return {r["行番号"]: r for r in rows}
+
+
+def test_update_recomputes_dependents_only(payload, use_client):
+    client = _run(payload, use_client)
+    before = _by_no(runner.get_case_rows(CASE_ID))
+
+    r = runner.update_case_inputs(CASE_ID, {155: {"今期": 1000}})
+    changed = [row["行番号"] for row in r["rows"]]
+    assert changed == [155] + formulas.dependents(formulas.DERIVED_FORMULAS, [155])
+    assert client.calls == []
+
+    after = _by_no(runner.get_case_rows(CASE_ID))
+    assert after[155]["今期"] == 1000 and after[155]["集計方法"] == "入力"
+    assert after[155]["前期"] == before[155]["前期"]
+    for n in set(after) - set(changed):
+        assert after[n] == before[n], n
+    # 再計算した行は、保存した全行から計算し直した値と一致する
+    table = RowTable.from_rows(after.values())
+    expected = formulas.evaluate(table, {n: formulas.DERIVED_FORMULAS[n] for n in changed[1:]}, create=True)
+    for n in changed[1:]:
+        assert [after[n][k] for k in ("前々期", "前期", "今期")] == expected[n][0], n
+
+
+def test_manual_inputs_survive_pipeline_rerun(payload, use_client):
+    _run(payload, use_client)
+    runner.update_case_inputs(CASE_ID, {77: {"今期": 5000}})
+    runner.run_001_002_003(payload, use_cache=False, mode="llm")
+    row77 = _by_no(runner.get_case_rows(CASE_ID))[77]
+    assert row77["今期"] == 5000 and row77["集計方法"] == "入力"
+
+
+def test_update_rejects_non_input_rows(payload, use_client):
+    _run(payload, use_client)
+    with pytest.raises(ValueError):
+        runner.update_case_inputs(CASE_ID, {45: {"今期": 1}})
+    assert runner.update_case_inputs("unknown-case", {155: {"今期": 1}}) is None
+
+
+def test_patch_endpoint(payload, use_client):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    _run(payload, use_client)
+    http = TestClient(app)
+    res = http.patch(f"/v1/cases/{CASE_ID}/inputs", json={"inputs": [{"行番号": 156, "今期": 2000}]})
+    assert res.status_code == 200
+    assert res.json()["rows"][0]["行番号"] == 156
+    assert _by_no(http.get(f"/v1/cases/{CASE_ID}").json()["rows"])[156]["今期"] == 2000
+    assert http.patch(f"/v1/cases/{CASE_ID}/inputs", json={"inputs": [{"行番号": 45, "今期": 1}]}).status_code == 400
+    assert http.patch(f"/v1/cases/{CASE_ID}/inputs", json={"inputs": []}).status_code == 400
+    assert http.patch("/v1/cases/unknown/inputs", json={"inputs": [{"行番号": 156}]}).status_code == 404
@@ -0,0 +1,61 @@
+"""金額だけを修正して再実行した場合の fast path（前回の科目対応＋ルールで LLM なしに再集計）。"""
+from __future__ import annotations
+import copy
+
+from app.pipeline import runner
+from app.pipeline.cloab001 import run_cloab001
+from fakes import FakeAnthropic
+
+
+def _rules_rows(payload):
+    return run_cloab001(runner._source_from_payload(payload), mode="rules")["rows"]
+
+
+def _amounts_changed(payload):
+    changed = copy.deepcopy(payload)
+    for key in ("BS", "PL", "SGA"):
+        for item in changed[key]:
+            item["今期"]["金額"] = item["今期"]["金額"] * 11 // 10
+    return changed
+
+
+def _row(result, line_no):
+    return next(r for r in result["output"] if r["行番号"] == line_no)
+
+
+def test_amount_only_resubmit_makes_no_llm_calls(payload, use_client):
+    client = use_client(FakeAnthropic(_rules_rows(payload)))
+    first = runner.run_001_002_003(payload, mode="llm")
+    assert not first["fast_path"]
+    assert client.calls
+
+    client.calls.clear()
+    changed = _amounts_changed(payload)
+    second = runner.run_001_002_003(changed, mode="llm")
+    assert second["fast_path"] and not second["cached"]
+    assert client.calls == []
+    # 前回の対応どおりに、新しい金額で集計し直している
+    assert _row(second, 121)["今期"] == 1320000
+    assert _row(second, 45)["今期"] == _row(second, 75)["今期"] == 4785000
+
+
+def test_sga_account_in_row_138_is_learned(payload, use_client):
+    # 雑費はどの行の 集計方法 にも残らない（138 は finalize で PL の記載値から確定する）
+    use_client(FakeAnthropic(_rules_rows(payload)))
+    runner.run_001_002_003(payload, mode="llm")
+    source = runner._source_from_payload(_amounts_changed(payload))
+    mappings = runner.get_structure_mappings(_amounts_changed(payload), runner.company_key(source))
+    assert mappings["121_154"]["雑費"] == 138
+    assert mappings["121_154"]["役員報酬"] == 121
+
+
+def test_mappings_are_not_shared_between_companies(payload, use_client):
+    client = use_client(FakeAnthropic(_rules_rows(payload)))
+    runner.run_001_002_003(payload, mode="llm")
+
+    client.calls.clear()
+    other = _amounts_changed(payload)
+    other["company_id"] = "another-co"
+    result = runner.run_001_002_003(other, mode="llm")
+    assert not result["fast_path"]
+    assert client.calls
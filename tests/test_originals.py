@@ -0,0 +1,80 @@
+"""
+移植後の cloab001 と originals/cloab001.py（data.json → output.json のスクリプト）の比較。
+originals は別プロセスで実行し、anthropic を tests/fakes.py の FakeAnthropic に差し替えて同じ答えを返させる。
+"""
+from __future__ import annotations
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from app.pipeline import formulas, runner
+from app.pipeline.cloab001 import run_cloab001
+from app.pipeline.row_table import RowTable
+from app.pipeline.validation import validate_section
+from fakes import FakeAnthropic
+
+ROOT = Path(__file__).resolve().parent.parent
+ORIGINAL = ROOT / "app" / "pipeline" / "originals" / "cloab001.py"
+
+# originals の `import anthropic` が読み込む差し替え（答えは CASHAI_FAKE_ROWS の行リスト）
+_STUB = """
+import json, os
+from fakes import FakeAnthropic
+
+def Anthropic(**kw):
+    with open(os.environ["CASHAI_FAKE_ROWS"], encoding="utf-8") as f:
+        return FakeAnthropic(json.load(f))
+"""
+
+
+def _rules_rows(payload):
+    return run_cloab001(runner._source_from_payload(payload), mode="rules")["rows"]
+
+
+def _run_original(payload, answers, workdir: Path):
+    source = runner._source_from_payload(payload)
+    data = {k: v for k, v in source.items() if k != "_meta"}
+    (workdir / "data.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    (workdir / "fake_rows.json").write_text(json.dumps(answers, ensure_ascii=False), encoding="utf-8")
+    stub = workdir / "stub" / "anthropic"
+    stub.mkdir(parents=True)
+    (stub / "__init__.py").write_text(_STUB, encoding="utf-8")
+
+    env = dict(os.environ)
+    env.update(
+        {
+            "ANTHROPIC_API_KEY": "test",
+            "CASHAI_FAKE_ROWS": str(workdir / "fake_rows.json"),
+            # 差し替えの anthropic / fakes・google.colab のスタブ（リポジトリ直下）の順に探す
+            "PYTHONPATH": os.pathsep.join([str(stub.parent), str(ROOT / "tests"), str(ROOT)]),
+        }
+    )
+    p = subprocess.run(
+        [sys.executable, str(ORIGINAL)], cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    assert p.returncode == 0, p.stdout.decode("utf-8", "replace")
+    return json.loads((workdir / "output.json").read_text(encoding="utf-8"))
+
+
+def test_llm_mode_matches_originals(payload, tmp_path):
+    answers = _rules_rows(payload)
+    rows = run_cloab001(runner._source_from_payload(payload), FakeAnthropic(answers), mode="llm")["rows"]
+    expected = _run_original(payload, answers, tmp_path)
+    assert json.dumps(rows, ensure_ascii=False, sort_keys=True) == json.dumps(expected, ensure_ascii=False, sort_keys=True)
+
+
+def test_rules_mode_totals_follow_formulas(payload):
+    source = runner._source_from_payload(payload)
+    rows = run_cloab001(source, mode="rules")["rows"]
+    table = RowTable.from_rows(rows)
+    # BS の合計行は 1〜76 行の明細から計算した値と一致する（原本の合計も明細と合っている）
+    for n, f in formulas.BS_FORMULAS.items():
+        if f["check"]:
+            expected = [sum(sign * table.get(m)[j] for m, sign in f["check"]) for j in range(3)]
+            assert list(table.get(n)) == expected, n
+    assert validate_section("1_78", rows, source) == []
+    assert validate_section("112_120", rows, source) == []
+    # 資産合計（45）と 負債・純資産合計（75）
+    assert table.get(45) == table.get(75)
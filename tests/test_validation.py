@@ -0,0 +1,57 @@
+"""区間ごとの検算と、検算を通った区間だけ科目対応を記憶すること。"""
+from __future__ import annotations
+import copy
+
+from app.pipeline import runner
+from app.pipeline.cloab001 import run_cloab001
+from app.pipeline.mapping_store import account_mapping_store, company_key
+from app.pipeline.validation import validate_section
+from fakes import FakeAnthropic
+
+
+def _rules_rows(source):
+    return run_cloab001(copy.deepcopy(source), mode="rules")["rows"]
+
+
+def test_sga_total_finding_for_row_138_account(payload):
+    # 雑費（138）は finalize で PL の「その他販売費及び一般管理費」から確定するため、PL に無ければ 139 が合わない
+    source = runner._source_from_payload(payload)
+    rows = _rules_rows(source)
+    assert validate_section("1_78", rows, source) == []
+    assert validate_section("112_120", rows, source) == []
+    findings = validate_section("121_154", rows, source)
+    assert [(f["section"], f["行番号"]) for f in findings] == [("121_154", 139)]
+    assert findings[0]["差異"]["今期"] == -320000
+
+
+def test_bs_detail_mismatch_is_reported(payload):
+    source = runner._source_from_payload(payload)
+    rows = _rules_rows(source)
+    for r in rows:
+        if r["行番号"] == 24:
+            r["今期"] += 1000
+    findings = validate_section("1_78", rows, source)
+    # 建物（24）を含む 有形固定資産合計（32）が不一致。差異は 計算値 − 出力値（32 は原本の合計のまま）
+    row32 = next(f for f in findings if f["行番号"] == 32)
+    assert row32["差異"] == {"今期": 1000, "前期": 0, "前々期": 0}
+    assert all(f["section"] == "1_78" for f in findings)
+
+
+def test_only_clean_sections_are_remembered(payload):
+    source = runner._source_from_payload(payload)
+    client = FakeAnthropic(_rules_rows(source))
+    run_cloab001(copy.deepcopy(source), client, mode="llm")
+    company = company_key(source)
+    assert account_mapping_store.load(company, "1_78")["ソフトウェア"] == 33
+    # 121〜154 は 139 の不一致が残るため記憶しない
+    assert account_mapping_store.load(company, "121_154") == {}
+
+
+def test_unchanged_findings_after_escalation_skip_retry(payload):
+    source = runner._source_from_payload(payload)
+    client = FakeAnthropic(_rules_rows(source))
+    result = run_cloab001(copy.deepcopy(source), client, mode="llm")
+    # 上位モデルでも同じ不一致 → 検算のやり直しはしない（121〜154 は2回だけ）
+    assert sorted(client.calls) == ["bs_1_78", "pl_112_120", "pl_121_154", "pl_121_154"]
+    assert result["validation"]["retried"] == []
+    assert [f["行番号"] for f in result["validation"]["findings"]] == [139]